@@ -0,0 +1,51 @@
+"""
+Compares the binary codec of the network parts with the pickle and zlib
+encoding used before, in messages per second for encoding plus decoding
+and in bytes per message:
+
+    python donkeycar/benchmarks/network_codec.py
+"""
+import pickle
+import timeit
+import zlib
+
+import numpy as np
+
+from donkeycar.parts.codec import decode, encode
+
+
+def pickle_round_trip(name, value):
+    z = zlib.compress(pickle.dumps({"name": name, "val": value}))
+    obj = pickle.loads(zlib.decompress(z))
+    return z, obj['val']
+
+
+def codec_round_trip(name, value):
+    z = encode(name, value)
+    return z, decode(z)[1]
+
+
+def payloads():
+    rng = np.random.default_rng(0)
+    return {
+        'controls': [0.25, -0.5, 'local', True],
+        'lidar 360 floats': rng.uniform(0, 10000, 360),
+        'image 120x160x3': rng.integers(0, 255, (120, 160, 3), dtype=np.uint8),
+        'jpeg bytes': bytes(rng.integers(0, 255, 5000, dtype=np.uint8)),
+    }
+
+
+def benchmark(number=1000):
+    print(f'{"payload":<20}{"encoding":<10}{"msg/s":>12}{"bytes/msg":>12}')
+    for label, value in payloads().items():
+        for encoding, round_trip in (('pickle', pickle_round_trip),
+                                     ('codec', codec_round_trip)):
+            size = len(round_trip('test', value)[0])
+            seconds = timeit.timeit(lambda: round_trip('test', value),
+                                    number=number)
+            print(f'{label:<20}{encoding:<10}{number / seconds:>12.0f}'
+                  f'{size:>12}')
+
+
+if __name__ == "__main__":
+    benchmark()
@@ -0,0 +1,55 @@
+"""
+Measures the import time of the donkeycar modules needed to start a car
+using 'python -X importtime' and lists the slowest imports. Run on the car
+to check that no heavy ML framework gets imported before a model is loaded:
+
+    python donkeycar/benchmarks/startup.py donkeycar.parts.keras
+"""
+import subprocess
+import sys
+
+DEFAULT_MODULES = ['donkeycar', 'donkeycar.parts.keras',
+                   'donkeycar.pipeline.training', 'donkeycar.parts.kinematics']
+HEAVY_MODULES = ['tensorflow', 'torch', 'fastai']
+
+
+def import_times(module):
+    """
+    Import the module in a fresh interpreter and parse the output of
+    -X importtime.
+
+    :param module:  name of the module to import
+    :return:        dict of imported module name to cumulative time in us
+    """
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c',
+                             f'import {module}'],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.PIPE,
+                            universal_newlines=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        # line format: 'import time: self [us] | cumulative | imported package'
+        if not line.startswith('import time:') or '[us]' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        times[name.strip()] = int(cumulative)
+    return times
+
+
+def benchmark(module, top=10):
+    times = import_times(module)
+    total = times.get(module, 0)
+    print(f'{module}: {total / 1000:.1f} ms')
+    slowest = sorted(times.items(), key=lambda kv: kv[1], reverse=True)
+    for name, cumulative in slowest[:top]:
+        print(f'    {cumulative / 1000:10.1f} ms  {name}')
+    heavy = [m for m in HEAVY_MODULES if m in times]
+    if heavy:
+        print(f'    WARNING: {module} imports {", ".join(heavy)}')
+    return total, heavy
+
+
+if __name__ == "__main__":
+    modules = sys.argv[1:] or DEFAULT_MODULES
+    for mod in modules:
+        benchmark(mod)
+    print('\nDone.')
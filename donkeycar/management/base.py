@@ -364,6 +364,126 @@ class ShowHistogram(BaseCommand):
         self.show_histogram(args.tub, args.record, args.out)
 
 
+class TubPose(BaseCommand):
+    """
+    Reconstructs the pose track of a tub with the batch kinematics and
+    writes a copy of the tub with the pose columns added. Uses the bicycle
+    model on the distance, or the integrated speed, and the steering of
+    the records, or the unicycle model if left and right wheel distances
+    are given.
+    """
+    POSE_KEYS = ['pos/x', 'pos/y', 'pos/angle', 'vel/x', 'vel/y', 'vel/angle']
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='tubpose',
+                                         usage='%(prog)s [options]')
+        parser.add_argument('--tub', required=True, help='path to tub')
+        parser.add_argument('--out', required=True,
+                            help='path of the tub to write')
+        parser.add_argument('--config', default='./config.py', help=HELP_CONFIG)
+        parser.add_argument('--distance', default='enc/distance',
+                            help='record of the travelled distance')
+        parser.add_argument('--speed', default='enc/speed',
+                            help='record of the speed, integrated if there '
+                                 'is no distance record')
+        parser.add_argument('--steering', default='user/angle',
+                            help='record of the normalized steering')
+        parser.add_argument('--left', default=None,
+                            help='record of the left wheel distance, for '
+                                 'differential drive')
+        parser.add_argument('--right', default=None,
+                            help='record of the right wheel distance, for '
+                                 'differential drive')
+        parser.add_argument('--wheel-base', type=float, default=None,
+                            help='overrides WHEEL_BASE of the config')
+        parser.add_argument('--max-steering-angle', type=float, default=None,
+                            help='overrides MAX_STEERING_ANGLE of the config')
+        parser.add_argument('--axle-length', type=float, default=None,
+                            help='overrides AXLE_LENGTH of the config')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    @staticmethod
+    def column(records, key):
+        import numpy as np
+        return np.array([record.get(key) or 0.0 for record in records],
+                        dtype=np.float64)
+
+    def poses(self, records, args, cfg):
+        """
+        :return: arrays of the pose columns of the records, in the order
+                 of POSE_KEYS
+        """
+        import numpy as np
+        from donkeycar.parts.kinematics import bicycle_poses, unicycle_poses
+
+        def setting(value, key):
+            if value is None:
+                value = getattr(cfg, key, None) if cfg else None
+            if value is None:
+                raise ValueError(f'{key} is not configured')
+            return value
+
+        timestamps = self.column(records, '_timestamp_ms') / 1000.0
+        if args.left and args.right:
+            poses = unicycle_poses(setting(args.axle_length, 'AXLE_LENGTH'),
+                                   self.column(records, args.left),
+                                   self.column(records, args.right),
+                                   timestamps)
+        else:
+            if records and args.distance in records[0]:
+                distances = self.column(records, args.distance)
+            else:
+                # trapezoidal integration of the speed
+                speeds = self.column(records, args.speed)
+                steps = np.diff(timestamps) * (speeds[1:] + speeds[:-1]) / 2
+                distances = np.concatenate(([0.0], np.cumsum(steps)))
+            # steering is positive to the right, the steering angle to the left
+            steering_angles = -self.column(records, args.steering) \
+                * setting(args.max_steering_angle, 'MAX_STEERING_ANGLE')
+            poses = bicycle_poses(setting(args.wheel_base, 'WHEEL_BASE'),
+                                  distances, steering_angles, timestamps)
+        return poses[2:8]
+
+    def write_tub(self, tub, records, poses, out):
+        from donkeycar.parts.tub_v2 import Tub
+
+        keys = [key for key in self.POSE_KEYS if key not in tub.inputs]
+        inputs = tub.inputs + keys
+        types = tub.types + ['float'] * len(keys)
+        metadata = [f'{k}:{v}' for k, v in tub.manifest.metadata.items()]
+        out_tub = Tub(out, inputs, types, metadata)
+        # records keep their image files names, so the images are copied
+        for name in os.listdir(tub.images_base_path):
+            shutil.copy2(os.path.join(tub.images_base_path, name),
+                         out_tub.images_base_path)
+        for i, record in enumerate(records):
+            contents = dict(record)
+            for key, values in zip(self.POSE_KEYS, poses):
+                contents[key] = float(values[i])
+            # keep the time stamps of the records, unlike Tub.write_record
+            contents['_index'] = out_tub.manifest.current_index
+            out_tub.manifest.write_record(contents)
+        out_tub.close()
+
+    def run(self, args):
+        from donkeycar.parts.tub_v2 import Tub
+
+        args = self.parse_args(args)
+        cfg = load_config(args.config) \
+            if os.path.exists(os.path.expanduser(args.config)) else None
+        tub = Tub(args.tub, read_only=True)
+        records = list(tub)
+        try:
+            poses = self.poses(records, args, cfg)
+        except ValueError as e:
+            logger.error(f'{e}, set it in the config or as argument')
+            return
+        self.write_tub(tub, records, poses, args.out)
+        tub.close()
+        logger.info(f'Wrote {len(records)} records with pose to {args.out}')
+
+
 class ShowCnnActivations(BaseCommand):
 
     def __init__(self):
@@ -560,6 +680,37 @@ class Train(BaseCommand):
                          f"one of 'tensorflow' or 'pytorch'")
 
 
+class PilotServer(BaseCommand):
+
+    def parse_args(self, args):
+        parser = argparse.ArgumentParser(prog='pilotserver',
+                                         usage='%(prog)s [options]')
+        parser.add_argument('--model', required=True,
+                            help='model to serve')
+        parser.add_argument('--type', default=None, help='model type')
+        parser.add_argument('--config', default='./config.py', help=HELP_CONFIG)
+        parser.add_argument('--port', type=int, default=5560,
+                            help='port to serve inference on')
+        parsed_args = parser.parse_args(args)
+        return parsed_args
+
+    def run(self, args):
+        from donkeycar.parts.remote_pilot import PilotServer as Server
+        args = self.parse_args(args)
+        cfg = load_config(args.config)
+        model = dk.utils.get_model_by_type(args.type, cfg)
+        model.load(os.path.expanduser(args.model))
+        server = Server(model, port=args.port)
+        print(f'Serving {args.model} on port {server.port}, '
+              f'press Ctrl-C to stop')
+        try:
+            server.serve()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.shutdown()
+
+
 class ModelDatabase(BaseCommand):
 
     def parse_args(self, args):
@@ -599,12 +750,14 @@ def execute_from_command_line():
         'tubclean': TubManager,
         'tubplot': ShowPredictionPlots,
         'tubhist': ShowHistogram,
+        'tubpose': TubPose,
         'makemovie': MakeMovieShell,
         'createjs': CreateJoystick,
         'cnnactivations': ShowCnnActivations,
         'update': UpdateCar,
         'train': Train,
         'models': ModelDatabase,
+        'pilotserver': PilotServer,
         'ui': Gui,
     }
 
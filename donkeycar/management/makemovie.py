@@ -1,13 +1,6 @@
 import moviepy.editor as mpy
-from tensorflow.python.keras import activations
-from tensorflow.python.keras import backend as K
-import tensorflow as tf
 import cv2
 from matplotlib import cm
-try:
-    from vis.utils import utils
-except:
-    raise Exception("Please install keras-vis: pip install git+https://github.com/autorope/keras-vis.git")
 
 import donkeycar as dk
 from donkeycar.parts.tub_v2 import Tub
@@ -158,6 +151,13 @@ class MakeMovie(object):
             x += dx
 
     def init_salient(self, model):
+        # tensorflow and keras-vis are only required for salient maps
+        from tensorflow.python.keras import activations
+        try:
+            from vis.utils import utils
+        except:
+            raise Exception("Please install keras-vis: pip install git+https://github.com/autorope/keras-vis.git")
+
         # Utility to search for layer index by name. 
         # Alternatively we can specify this as -1 since it corresponds to the last layer.
         output_name = []
@@ -184,6 +184,10 @@ class MakeMovie(object):
         return True
 
     def compute_visualisation_mask(self, img):
+        import tensorflow as tf
+        from tensorflow.python.keras import backend as K
+        from vis.utils import utils
+
         img = img.reshape((1,) + img.shape)
         images = tf.Variable(img, dtype=float)
 
@@ -0,0 +1,120 @@
+import logging
+import time
+from threading import Condition
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncPilot:
+    """
+    Wraps a pilot part and runs its inference in a separate thread, so the
+    drive loop is no longer blocked for the model latency. The drive loop
+    hands over the newest frame and gets back the most recent completed
+    pilot output together with its age in milliseconds. Frames which arrive
+    while the model is still busy are dropped, only the newest one is kept.
+    Optionally angle and throttle, the first two outputs, are extrapolated
+    linearly from the last two inferences to the time of the drive loop.
+    The part must be added to the vehicle with threaded=True.
+    """
+    def __init__(self, pilot, num_outputs=2, max_age_ms=500, extrapolate=False):
+        """
+        :param pilot:       pilot part, i.e. a KerasPilot
+        :param num_outputs: number of outputs of the pilot, used to return
+                            None values before the first inference completed
+        :param max_age_ms:  outputs older than this are returned as None
+                            values, so the car does not keep driving on
+                            a stalled pilot; None disables the check
+        :param extrapolate: extrapolate angle and throttle by at most one
+                            inference interval, limited to -1..1
+        """
+        self.pilot = pilot
+        self.num_outputs = num_outputs
+        self.max_age_ms = max_age_ms
+        self.extrapolate = extrapolate
+        self.condition = Condition()
+        # newest inputs which have not been picked up by the worker yet
+        self.pending_inputs = None
+        self.last_img_arr = None
+        self.output = None
+        self.output_time = None
+        self.previous_output = None
+        self.previous_time = None
+        self.inferences = 0
+        self.dropped_frames = 0
+        self.on = True
+
+    def update(self):
+        while self.on:
+            with self.condition:
+                while self.pending_inputs is None and self.on:
+                    self.condition.wait(timeout=0.1)
+                if not self.on:
+                    break
+                inputs, self.pending_inputs = self.pending_inputs, None
+            try:
+                output = self.pilot.run(*inputs)
+            except Exception as e:
+                # keep the worker alive, the last output becomes stale
+                logger.error(f'AsyncPilot inference failed: {e}')
+                continue
+            with self.condition:
+                self.previous_output = self.output
+                self.previous_time = self.output_time
+                self.output = output
+                self.output_time = time.time()
+                self.inferences += 1
+
+    def run_threaded(self, img_arr, *other_inputs):
+        with self.condition:
+            # only hand over new frames, otherwise the worker would infer
+            # the same frame over and over again
+            if img_arr is not None and img_arr is not self.last_img_arr:
+                if self.pending_inputs is not None:
+                    self.dropped_frames += 1
+                # the camera may reuse the buffer of the frame while the
+                # worker still infers it
+                self.pending_inputs = (img_arr.copy(), *other_inputs)
+                self.last_img_arr = img_arr
+                self.condition.notify()
+            output, output_time = self.output, self.output_time
+            previous, previous_time = self.previous_output, self.previous_time
+        output = self.to_output(output, output_time)
+        if self.extrapolate and previous is not None and output[0] is not None:
+            output = self.extrapolate_output(output, output_time,
+                                             previous, previous_time)
+        return output
+
+    def run(self, img_arr, *other_inputs):
+        """ Synchronous fallback if the part is added without a thread """
+        output = self.pilot.run(img_arr, *other_inputs)
+        return self.to_output(output, time.time())
+
+    def to_output(self, output, output_time):
+        if output is None:
+            return (None, ) * (self.num_outputs + 1)
+        age_ms = (time.time() - output_time) * 1000.0
+        if self.max_age_ms is not None and age_ms > self.max_age_ms:
+            return (None, ) * self.num_outputs + (age_ms, )
+        return (*output, age_ms)
+
+    def extrapolate_output(self, output, output_time, previous, previous_time):
+        interval = output_time - previous_time
+        if interval <= 0:
+            return output
+        scale = min((time.time() - output_time) / interval, 1.0)
+        output = list(output)
+        for i in range(min(2, self.num_outputs)):
+            try:
+                value = output[i] + (output[i] - previous[i]) * scale
+            except TypeError:
+                continue
+            output[i] = min(max(value, -1.0), 1.0)
+        return tuple(output)
+
+    def shutdown(self):
+        with self.condition:
+            self.on = False
+            self.condition.notify_all()
+        self.pilot.shutdown()
+        logger.info(f'AsyncPilot ran {self.inferences} inferences and '
+                    f'dropped {self.dropped_frames} frames')
@@ -1,10 +1,10 @@
 import logging
 import os
+import queue
 import time
 import numpy as np
 from PIL import Image
 import glob
-from donkeycar.utils import rgb2gray
 
 logger = logging.getLogger(__name__)
 logging.basicConfig(level=logging.INFO)
@@ -12,6 +12,67 @@ logging.basicConfig(level=logging.INFO)
 class CameraError(Exception):
     pass
 
+class FramePool:
+    '''
+    A fixed number of preallocated frame buffers which a camera fills in
+    place, round robin, instead of allocating a new array for every frame.
+    Each published frame is handed downstream as a fresh view of its buffer,
+    so parts can still tell a new frame from a repeated one by identity,
+    without the pixel data being copied. A frame stays intact until the
+    camera has published size - 1 newer frames; the generation counter lets
+    consumers holding on to frames check for that. Parts which keep a frame
+    beyond the loop it was published in, i.e. to process it in a thread of
+    their own, must copy it instead.
+    '''
+    def __init__(self, shape, dtype=np.uint8, size=4):
+        if size < 2:
+            raise ValueError("FramePool needs at least two buffers")
+        self.shape = tuple(shape)
+        self.dtype = np.dtype(dtype)
+        self.buffers = [np.zeros(self.shape, dtype=self.dtype) for _ in range(size)]
+        self.index = -1
+        self.generation = 0
+        self.frame = None
+
+    def next_buffer(self):
+        '''
+        :return: the buffer the next frame should be written into
+        '''
+        return self.buffers[(self.index + 1) % len(self.buffers)]
+
+    def publish(self):
+        '''
+        Mark the buffer returned by next_buffer() as the latest frame
+        :return: view of the new frame
+        '''
+        self.index = (self.index + 1) % len(self.buffers)
+        self.generation += 1
+        self.frame = self.buffers[self.index].view()
+        return self.frame
+
+    def is_valid(self, generation):
+        '''
+        :param generation: value of self.generation when the frame was read
+        :return: True if the frame of that generation is not being overwritten
+        '''
+        return self.generation - generation < len(self.buffers) - 1
+
+
+GREY_WEIGHTS = np.array([0.299, 0.587, 0.114])
+
+
+def rgb2gray_into(rgb, out, scratch):
+    '''
+    Same as utils.rgb2gray for uint8 images, but writing into the
+    preallocated out array, using the float64 scratch array of the same
+    shape for the intermediate result.
+    '''
+    np.dot(rgb[..., :3], GREY_WEIGHTS, out=scratch)
+    np.rint(scratch, out=scratch)
+    np.copyto(out, scratch, casting='unsafe')
+    return out
+
+
 class BaseCamera:
 
     def run_threaded(self):
@@ -38,6 +99,11 @@ class PiCamera(BaseCamera):
         self.frame = None
         self.on = True
         self.image_d = image_d
+        if image_d == 1:
+            # picamera hands out a new rgb array per frame, which is passed
+            # on as is; grey frames are converted into reusable buffers
+            self.pool = FramePool((image_h, image_w), np.uint8)
+            self.grey_scratch = np.empty((image_h, image_w), np.float64)
 
         # get the first frame or timeout
         logger.info('PiCamera loaded...')
@@ -61,10 +127,12 @@ class PiCamera(BaseCamera):
         if self.stream is not None:
             f = next(self.stream)
             if f is not None:
-                self.frame = f.array
-                self.rawCapture.truncate(0)
                 if self.image_d == 1:
-                    self.frame = rgb2gray(self.frame)
+                    rgb2gray_into(f.array, self.pool.next_buffer(), self.grey_scratch)
+                    self.frame = self.pool.publish()
+                else:
+                    self.frame = f.array
+                self.rawCapture.truncate(0)
 
         return self.frame
 
@@ -105,6 +173,11 @@ class Webcam(BaseCamera):
         self.image_d = image_d
         self.image_w = image_w
         self.image_h = image_h
+        shape = (image_h, image_w) if image_d == 1 else (image_h, image_w, 3)
+        self.pool = FramePool(shape, np.uint8)
+        self.grey_scratch = np.empty((image_h, image_w), np.float64)
+        self.snapshot = None
+        self.scaled = None
 
         self.init_camera(image_w, image_h, image_d, camera_index)
         self.on = True
@@ -159,14 +232,26 @@ class Webcam(BaseCamera):
         logger.info("Webcam ready.")
 
     def run(self):
-        import pygame.image
+        import pygame
         if self.cam.query_image():
-            snapshot = self.cam.get_image()
-            if snapshot is not None:
-                snapshot1 = pygame.transform.scale(snapshot, self.resolution)
-                self.frame = pygame.surfarray.pixels3d(pygame.transform.rotate(pygame.transform.flip(snapshot1, True, False), 90))
+            # capture and scale into the same surfaces every frame
+            if self.snapshot is None:
+                self.snapshot = self.cam.get_image()
+            else:
+                self.snapshot = self.cam.get_image(self.snapshot)
+            if self.snapshot is not None:
+                if self.scaled is None:
+                    self.scaled = pygame.Surface(self.resolution, 0, self.snapshot)
+                pygame.transform.scale(self.snapshot, self.resolution, self.scaled)
+                # surface pixels are indexed (x, y), transposing gives the image
+                pixels = pygame.surfarray.pixels3d(self.scaled).transpose(1, 0, 2)
+                buffer = self.pool.next_buffer()
                 if self.image_d == 1:
-                    self.frame = rgb2gray(frame)
+                    rgb2gray_into(pixels, buffer, self.grey_scratch)
+                else:
+                    np.copyto(buffer, pixels)
+                del pixels  # unlock the surface
+                self.frame = self.pool.publish()
 
         return self.frame
 
@@ -218,6 +303,8 @@ class CSICamera(BaseCamera):
         self.capture_height = capture_height
         self.framerate = framerate
         self.frame = None
+        self.capture = None
+        self.pool = FramePool((image_h, image_w, 3), np.uint8)
         self.init_camera()
         self.running = True
 
@@ -255,9 +342,12 @@ class CSICamera(BaseCamera):
 
     def poll_camera(self):
         import cv2
-        self.ret , frame = self.camera.read()
+        # read into and convert into preallocated buffers
+        self.ret, frame = self.camera.read(self.capture)
         if frame is not None:
-            self.frame = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+            self.capture = frame
+            cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=self.pool.next_buffer())
+            self.frame = self.pool.publish()
 
     def run(self):
         self.poll_camera()
@@ -280,11 +370,18 @@ class V4LCamera(BaseCamera):
     cd python3-v4l2capture
     python setup.py build
     pip install -e .
+
+    With publish_jpeg=True the part outputs the decoded image and the
+    original jpeg bytes delivered by the camera, so consumers that need
+    jpeg (tub, web and network streamers) can skip re-encoding.
     '''
-    def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, dev_fn="/dev/video0", fourcc='MJPG'):
+    def __init__(self, image_w=160, image_h=120, image_d=3, framerate=20, dev_fn="/dev/video0", fourcc='MJPG',
+                 publish_jpeg=False):
 
         self.running = True
         self.frame = None
+        self.frame_jpeg = (None, None)
+        self.publish_jpeg = publish_jpeg
         self.image_w = image_w
         self.image_h = image_h
         self.dev_fn = dev_fn
@@ -324,7 +421,15 @@ class V4LCamera(BaseCamera):
             # Wait for the device to fill the buffer.
             select.select((self.video,), (), ())
             image_data = self.video.read_and_queue()
-            self.frame = jpg_conv.run(image_data)
+            frame = jpg_conv.run(image_data)
+            # update both together so readers never get a mismatched pair
+            self.frame_jpeg = (frame, image_data)
+            self.frame = frame
+
+    def run_threaded(self):
+        if self.publish_jpeg:
+            return self.frame_jpeg
+        return self.frame
 
     def shutdown(self):
         self.running = False
@@ -350,9 +455,11 @@ class MockCamera(BaseCamera):
 
 class ImageListCamera(BaseCamera):
     '''
-    Use the images from a tub as a fake camera output
+    Use the images from a tub as a fake camera output. When run threaded,
+    the images are opened and decoded ahead in the background, up to
+    prefetch of them, so the drive loop does not wait for the disk.
     '''
-    def __init__(self, path_mask='~/mycar/data/**/images/*.jpg'):
+    def __init__(self, path_mask='~/mycar/data/**/images/*.jpg', prefetch=8):
         self.image_filenames = glob.glob(os.path.expanduser(path_mask), recursive=True)
     
         def get_image_index(fnm):
@@ -372,17 +479,40 @@ class ImageListCamera(BaseCamera):
         logger.info( self.image_filenames[:10])
         self.i_frame = 0
         self.frame = None
-        self.update()
+        self.frames = queue.Queue(maxsize=prefetch)
+        self.on = True
+
+    def load_frame(self):
+        '''
+        Decode the next image of the list
+        '''
+        with Image.open(self.image_filenames[self.i_frame]) as img:
+            frame = np.asarray(img)
+        self.i_frame = (self.i_frame + 1) % self.num_images
+        return frame
 
     def update(self):
-        pass
+        while self.on and self.num_images > 0:
+            frame = self.load_frame()
+            while self.on:
+                try:
+                    self.frames.put(frame, timeout=0.1)
+                    break
+                except queue.Full:
+                    pass
 
-    def run_threaded(self):        
-        if self.num_images > 0:
-            self.i_frame = (self.i_frame + 1) % self.num_images
-            self.frame = Image.open(self.image_filenames[self.i_frame]) 
+    def run_threaded(self):
+        try:
+            # never wait for a slow disk, repeat the last frame instead
+            self.frame = self.frames.get_nowait()
+        except queue.Empty:
+            pass
+        return self.frame
 
-        return np.asarray(self.frame)
+    def run(self):
+        if self.num_images > 0:
+            self.frame = self.load_frame()
+        return self.frame
 
     def shutdown(self):
-        pass
+        self.on = False
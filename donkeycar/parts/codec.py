@@ -0,0 +1,242 @@
+"""
+Binary encoding of named values for the network parts, replacing pickle.
+
+A message is a fixed header followed by the name and the typed value:
+
+    magic 'DK' | version | flags | payload length (uint32) | name length
+    (uint16) | name (utf-8) | value
+
+Values are None, bool, int, float, str, bytes, numpy arrays and lists,
+tuples and dicts of those. Numpy arrays are written as dtype, shape and the
+raw buffer and decoded without copying. Only these types can be decoded, so
+unlike pickle a message from the network can't execute code. Large messages
+are zlib compressed, unless they carry bytes or uint8 arrays, i.e. images,
+which don't compress any further.
+
+For transports with multipart messages, like zmq, encode_frames() puts
+large arrays and bytes into frames of their own behind the message, so
+they are sent and received without copying them into the message.
+"""
+import struct
+import zlib
+from typing import Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+MAGIC = b'DK'
+VERSION = 1
+FLAG_COMPRESSED = 1
+COMPRESS_THRESHOLD = 1024
+
+HEADER = struct.Struct('<2sBBIH')
+UINT32 = struct.Struct('<I')
+INT64 = struct.Struct('<q')
+FLOAT64 = struct.Struct('<d')
+
+
+# value type tags
+_NONE, _TRUE, _FALSE, _INT, _FLOAT, _STR, _BYTES, _ARRAY, _LIST, _TUPLE, \
+    _DICT, _BYTES_FRAME, _ARRAY_FRAME = b'NTFidsbaltmBA'
+# arrays and bytes at least this large go into a frame of their own
+FRAME_THRESHOLD = 1024
+
+
+class CodecError(ValueError):
+    pass
+
+
+def _encode_value(value: Any, parts: List, info: dict,
+                  frames: Optional[List] = None) -> None:
+    if value is None:
+        parts.append(b'N')
+    elif isinstance(value, (bool, np.bool_)):
+        parts.append(b'T' if value else b'F')
+    elif isinstance(value, (int, np.integer)):
+        parts.append(b'i')
+        parts.append(INT64.pack(int(value)))
+    elif isinstance(value, (float, np.floating)):
+        parts.append(b'd')
+        parts.append(FLOAT64.pack(float(value)))
+    elif isinstance(value, str):
+        data = value.encode('utf-8')
+        parts.append(b's')
+        parts.append(UINT32.pack(len(data)))
+        parts.append(data)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        if frames is not None and len(value) >= FRAME_THRESHOLD:
+            parts.append(b'B')
+            parts.append(UINT32.pack(len(frames)))
+            frames.append(value)
+        else:
+            parts.append(b'b')
+            parts.append(UINT32.pack(len(value)))
+            parts.append(value)
+            info['binary'] = True
+    elif isinstance(value, np.ndarray):
+        if value.dtype.hasobject:
+            raise TypeError('Can not encode numpy arrays of objects')
+        value = np.ascontiguousarray(value)
+        dtype = value.dtype.str.encode('ascii')
+        own_frame = frames is not None and value.nbytes >= FRAME_THRESHOLD
+        parts.append(b'A' if own_frame else b'a')
+        parts.append(bytes((len(dtype),)))
+        parts.append(dtype)
+        parts.append(bytes((value.ndim,)))
+        parts.append(struct.pack(f'<{value.ndim}I', *value.shape))
+        if own_frame:
+            parts.append(UINT32.pack(len(frames)))
+            frames.append(value)
+        else:
+            parts.append(value.reshape(-1).view(np.uint8))
+            if value.dtype == np.uint8:
+                info['binary'] = True
+    elif isinstance(value, (list, tuple)):
+        parts.append(b'l' if isinstance(value, list) else b't')
+        parts.append(UINT32.pack(len(value)))
+        for item in value:
+            _encode_value(item, parts, info, frames)
+    elif isinstance(value, dict):
+        parts.append(b'm')
+        parts.append(UINT32.pack(len(value)))
+        for key, item in value.items():
+            _encode_value(key, parts, info, frames)
+            _encode_value(item, parts, info, frames)
+    else:
+        raise TypeError(f'Can not encode value of type {type(value)}')
+
+
+def encode(name: str, value: Any,
+           compress_threshold: int = COMPRESS_THRESHOLD,
+           frames: Optional[List] = None) -> bytes:
+    """
+    :param name:                name of the value, i.e. the part's name
+    :param value:               value to encode
+    :param compress_threshold:  compress values encoded to at least this
+                                many bytes, unless they contain images;
+                                None to never compress
+    :param frames:              if given, large arrays and bytes are
+                                appended to it instead of being written
+                                into the message
+    :return:                    the message
+    """
+    parts = []
+    info = {'binary': False}
+    _encode_value(value, parts, info, frames)
+    payload = b''.join(parts)
+    flags = 0
+    if compress_threshold is not None and not info['binary'] \
+            and len(payload) >= compress_threshold:
+        payload = zlib.compress(payload)
+        flags |= FLAG_COMPRESSED
+    name_data = name.encode('utf-8')
+    header = HEADER.pack(MAGIC, VERSION, flags,
+                         len(name_data) + len(payload), len(name_data))
+    return b''.join((header, name_data, payload))
+
+
+def message_length(data) -> int:
+    """
+    :param data:    buffer starting with a message header
+    :return:        length of the message in bytes, or 0 if data is shorter
+                    than a header
+    """
+    if len(data) < HEADER.size:
+        return 0
+    magic, version, _, length, _ = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise CodecError('Not a donkeycar message')
+    return HEADER.size + length
+
+
+def _decode_value(data: memoryview, offset: int,
+                  frames: Sequence = ()) -> Tuple[Any, int]:
+    tag = data[offset]
+    offset += 1
+    if tag == _FLOAT:
+        return FLOAT64.unpack_from(data, offset)[0], offset + FLOAT64.size
+    if tag == _INT:
+        return INT64.unpack_from(data, offset)[0], offset + INT64.size
+    if tag == _STR or tag == _BYTES:
+        length = UINT32.unpack_from(data, offset)[0]
+        offset += UINT32.size
+        value = data[offset:offset + length].tobytes()
+        if tag == _STR:
+            value = value.decode('utf-8')
+        return value, offset + length
+    if tag == _LIST or tag == _TUPLE:
+        count = UINT32.unpack_from(data, offset)[0]
+        offset += UINT32.size
+        items = []
+        for _ in range(count):
+            item, offset = _decode_value(data, offset, frames)
+            items.append(item)
+        return (items if tag == _LIST else tuple(items)), offset
+    if tag == _NONE:
+        return None, offset
+    if tag == _TRUE:
+        return True, offset
+    if tag == _FALSE:
+        return False, offset
+    if tag == _ARRAY or tag == _ARRAY_FRAME:
+        length = data[offset]
+        offset += 1
+        dtype = np.dtype(data[offset:offset + length].tobytes().decode('ascii'))
+        offset += length
+        ndim = data[offset]
+        offset += 1
+        shape = struct.unpack_from(f'<{ndim}I', data, offset)
+        offset += 4 * ndim
+        count = int(np.prod(shape))
+        if tag == _ARRAY_FRAME:
+            frame = _frame(frames, UINT32.unpack_from(data, offset)[0])
+            value = np.frombuffer(frame, dtype=dtype, count=count)
+            return value.reshape(shape), offset + UINT32.size
+        value = np.frombuffer(data, dtype=dtype, count=count,
+                              offset=offset).reshape(shape)
+        return value, offset + count * dtype.itemsize
+    if tag == _BYTES_FRAME:
+        frame = _frame(frames, UINT32.unpack_from(data, offset)[0])
+        return bytes(frame), offset + UINT32.size
+    if tag == _DICT:
+        count = UINT32.unpack_from(data, offset)[0]
+        offset += UINT32.size
+        value = {}
+        for _ in range(count):
+            key, offset = _decode_value(data, offset, frames)
+            value[key], offset = _decode_value(data, offset, frames)
+        return value, offset
+    raise CodecError(f'Unknown value type {tag}')
+
+
+def _frame(frames: Sequence, index: int):
+    if index >= len(frames):
+        raise CodecError('Missing frame')
+    frame = frames[index]
+    # zmq frames expose their data as buffer
+    return getattr(frame, 'buffer', frame)
+
+
+def decode(data, frames: Sequence = ()) -> Tuple[str, Any]:
+    """
+    Decode the message at the start of data. Numpy arrays in the value are
+    read only views of data or their frame, if it was not compressed.
+
+    :param data:    buffer with the message
+    :param frames:  the frames of large values, as filled by encode()
+    :return:        tuple of name and value
+    """
+    length = message_length(data)
+    if length == 0 or len(data) < length:
+        raise CodecError('Incomplete message')
+    _, _, flags, _, name_length = HEADER.unpack_from(data)
+    data = memoryview(data)[:length]
+    offset = HEADER.size
+    name = data[offset:offset + name_length].tobytes().decode('utf-8')
+    payload = data[offset + name_length:]
+    if flags & FLAG_COMPRESSED:
+        payload = memoryview(zlib.decompress(payload))
+    try:
+        value, _ = _decode_value(payload, 0, frames)
+    except struct.error as e:
+        raise CodecError('Truncated message') from e
+    return name, value
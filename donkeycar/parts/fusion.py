@@ -0,0 +1,202 @@
+"""
+Fusion of the odometry sensors into one pose and velocity estimate.
+"""
+import logging
+import math
+import time
+from typing import Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class OdometryEKF:
+    """
+    Extended Kalman filter which fuses the travelled distance of an
+    encoder, yaw rate and forward acceleration of an IMU and optional GPS
+    positions into a smoothed estimate of pose and velocity. The state is
+
+        x, y, angle, speed, angular velocity, acceleration, distance
+
+    and is predicted with a constant turn rate and acceleration model. As
+    every measurement observes a single state, they are applied one by one
+    as scalar updates, so a step only does in place operations on the
+    preallocated state and covariance.
+
+    Without GPS the pose is in the frame of the start, like for the
+    Bicycle part. The first GPS fix is aligned with the current position,
+    the offset is kept in gps_origin, and makes the angle uncertain, so
+    the angle is learned from the track of the following fixes.
+
+    @param speed_noise: speed change (m/s) per square root of a second
+    @param angular_velocity_noise: angular velocity change (rad/s) per
+                                   square root of a second
+    @param acceleration_noise: acceleration change (m/s^2) per square
+                               root of a second
+    @param distance_std: standard deviation (m) of the encoder distance
+    @param yaw_rate_std: standard deviation (rad/s) of the gyro yaw rate
+    @param acceleration_std: standard deviation (m/s^2) of the
+                             accelerometer
+    @param gps_std: standard deviation (m) of the GPS positions
+    @param yaw_rate_scale: factor of the gyro readings to radians per
+                           second, counter clockwise; the IMU part
+                           returns degrees per second
+    @param gps_angle_std: standard deviation (rad) of the angle at the
+                          first GPS fix
+    """
+    X, Y, ANGLE, SPEED, ANGULAR_VELOCITY, ACCELERATION, DISTANCE = range(7)
+    SIZE = 7
+
+    def __init__(self, speed_noise: float = 0.5,
+                 angular_velocity_noise: float = 1.0,
+                 acceleration_noise: float = 2.0,
+                 distance_std: float = 0.01,
+                 yaw_rate_std: float = 0.02,
+                 acceleration_std: float = 0.3,
+                 gps_std: float = 1.0,
+                 yaw_rate_scale: float = math.pi / 180,
+                 gps_angle_std: float = math.pi,
+                 debug: bool = False) -> None:
+        n = self.SIZE
+        self.noise_density = np.zeros(n)
+        self.noise_density[self.X] = self.noise_density[self.Y] = 1e-4
+        self.noise_density[self.ANGLE] = 1e-4
+        self.noise_density[self.SPEED] = speed_noise ** 2
+        self.noise_density[self.ANGULAR_VELOCITY] = angular_velocity_noise ** 2
+        self.noise_density[self.ACCELERATION] = acceleration_noise ** 2
+        self.noise_density[self.DISTANCE] = 1e-6
+        self.distance_variance = distance_std ** 2
+        self.yaw_rate_variance = yaw_rate_std ** 2
+        self.acceleration_variance = acceleration_std ** 2
+        self.gps_variance = gps_std ** 2
+        self.gps_angle_variance = gps_angle_std ** 2
+        self.yaw_rate_scale = yaw_rate_scale
+        self.debug = debug
+
+        self.state = np.zeros(n)
+        self.covariance = np.zeros((n, n))
+        self.jacobian = np.eye(n)
+        self.product = np.zeros((n, n))
+        self.gain = np.zeros(n)
+        self.gain_column = self.gain[:, np.newaxis]
+        self.row = np.zeros(n)
+        self.step = np.zeros(n)
+        self.correction = np.zeros((n, n))
+        self.diagonal = np.einsum('ii->i', self.covariance)
+        # covariance as returned by run(), updated in place
+        self.covariance_view = self.covariance.view()
+        self.covariance_view.flags.writeable = False
+        self.gps_origin = None
+        self.timestamp = None
+        self.running = True
+        self.reset()
+
+    def reset(self) -> None:
+        self.state[:] = 0
+        self.covariance[:] = 0
+        self.diagonal[self.SPEED] = 1.0
+        self.diagonal[self.ANGULAR_VELOCITY] = 1.0
+        self.diagonal[self.ACCELERATION] = 1.0
+        self.gps_origin = None
+        self.timestamp = None
+
+    def predict(self, delta_time: float) -> None:
+        """ Move the state delta_time seconds forward """
+        s = self.state
+        angle = s[self.ANGLE]
+        speed = s[self.SPEED]
+        cos_angle = math.cos(angle)
+        sin_angle = math.sin(angle)
+        s[self.X] += speed * cos_angle * delta_time
+        s[self.Y] += speed * sin_angle * delta_time
+        s[self.ANGLE] = math.atan2(
+            math.sin(angle + s[self.ANGULAR_VELOCITY] * delta_time),
+            math.cos(angle + s[self.ANGULAR_VELOCITY] * delta_time))
+        s[self.DISTANCE] += speed * delta_time
+        s[self.SPEED] += s[self.ACCELERATION] * delta_time
+
+        f = self.jacobian
+        f[self.X, self.ANGLE] = -speed * sin_angle * delta_time
+        f[self.X, self.SPEED] = cos_angle * delta_time
+        f[self.Y, self.ANGLE] = speed * cos_angle * delta_time
+        f[self.Y, self.SPEED] = sin_angle * delta_time
+        f[self.ANGLE, self.ANGULAR_VELOCITY] = delta_time
+        f[self.SPEED, self.ACCELERATION] = delta_time
+        f[self.DISTANCE, self.SPEED] = delta_time
+        # P = F P F' + Q
+        np.dot(f, self.covariance, out=self.product)
+        np.dot(self.product, f.T, out=self.covariance)
+        np.multiply(self.noise_density, delta_time, out=self.step)
+        self.diagonal += self.step
+
+    def update(self, index: int, value: float, variance: float) -> None:
+        """ Update the state with a measurement of one of its elements """
+        p = self.covariance
+        np.copyto(self.row, p[index])
+        innovation = value - self.state[index]
+        if index == self.ANGLE:
+            innovation = math.atan2(math.sin(innovation), math.cos(innovation))
+        np.divide(self.row, self.row[index] + variance, out=self.gain)
+        np.multiply(self.gain, innovation, out=self.step)
+        self.state += self.step
+        # P = P - K H P
+        np.multiply(self.gain_column, self.row, out=self.correction)
+        p -= self.correction
+
+    def update_gps(self, x: float, y: float) -> None:
+        if self.gps_origin is None:
+            # the frame of the odometry starts at the first fix
+            self.gps_origin = (x - self.state[self.X], y - self.state[self.Y])
+            self.diagonal[self.ANGLE] += self.gps_angle_variance
+            return
+        self.update(self.X, x - self.gps_origin[0], self.gps_variance)
+        self.update(self.Y, y - self.gps_origin[1], self.gps_variance)
+
+    def run(self, distance: Optional[float] = None,
+            yaw_rate: Optional[float] = None,
+            acceleration: Optional[float] = None,
+            gps_positions: Optional[Sequence[Tuple[float, float, float]]] = None,
+            timestamp: Optional[float] = None) -> Tuple[float, float, float, float, float, float, np.ndarray]:
+        """
+        @param distance: distance travelled by the encoder, or None
+        @param yaw_rate: gyro reading around the vertical axis, or None
+        @param acceleration: forward acceleration in m/s^2, or None
+        @param gps_positions: (timestamp, x, y) positions since the last
+                              call, like the array returned by the Gps part
+        @param timestamp: time of the readings or None for current time
+        @return x, y, angle, speed, angular velocity, distance and the
+                covariance of the state; the covariance is a read only
+                view which is updated by the next call
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.running:
+            if self.timestamp is None:
+                self.timestamp = timestamp
+                if distance is not None:
+                    self.state[self.DISTANCE] = distance
+            elif timestamp > self.timestamp:
+                self.predict(timestamp - self.timestamp)
+                self.timestamp = timestamp
+            if distance is not None:
+                self.update(self.DISTANCE, distance, self.distance_variance)
+            if yaw_rate is not None:
+                self.update(self.ANGULAR_VELOCITY,
+                            yaw_rate * self.yaw_rate_scale,
+                            self.yaw_rate_variance)
+            if acceleration is not None:
+                self.update(self.ACCELERATION, acceleration,
+                            self.acceleration_variance)
+            if gps_positions is not None and len(gps_positions):
+                _, x, y = gps_positions[-1]
+                self.update_gps(x, y)
+            if self.debug:
+                logger.info(f'EKF state {self.state}')
+        s = self.state
+        return (s[self.X], s[self.Y], s[self.ANGLE], s[self.SPEED],
+                s[self.ANGULAR_VELOCITY], s[self.DISTANCE],
+                self.covariance_view)
+
+    def shutdown(self) -> None:
+        self.running = False
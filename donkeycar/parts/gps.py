@@ -7,6 +7,7 @@ import platform
 import threading
 import time
 
+import numpy as np
 import pynmea2
 import serial
 import utm
@@ -16,13 +17,124 @@ logger = logging.getLogger(__name__)
 def is_mac():
     return "Darwin" == platform.system()
 
+# a gps position, (timestamp, x, y) in meters like getGpsPosition()
+POSITION_DTYPE = np.dtype([('timestamp', np.float64),
+                           ('x', np.float64),
+                           ('y', np.float64)])
+
+KNOTS_TO_METERS_PER_SECOND = 1852 / 3600
+
+
+class NmeaStream:
+    """
+    Splits the bytes read from a gps into NMEA sentences. Bytes are read
+    into a fixed bytearray and the complete sentences in it are extracted
+    together: one numpy pass finds the line ends and the running xor of
+    the bytes, so the checksum of each sentence is the xor of two of its
+    values. Only sentences with a valid checksum are split into fields.
+    """
+    def __init__(self, size:int = 4096):
+        self.buffer = bytearray(size)
+        self.view = memoryview(self.buffer)
+        self.end = 0
+        self.invalid = 0  # count of sentences with a bad checksum
+
+    def space(self) -> memoryview:
+        """
+        The free part of the buffer to read into, see written()
+        """
+        return self.view[self.end:]
+
+    def written(self, count:int):
+        self.end += count
+
+    def feed(self, data) -> list:
+        """
+        Add the bytes and return the fields of the sentences they complete
+        """
+        sentences = []
+        data = memoryview(data)
+        while len(data):
+            count = min(len(data), len(self.buffer) - self.end)
+            self.view[self.end:self.end + count] = data[:count]
+            self.end += count
+            data = data[count:]
+            sentences += self.sentences()
+        return sentences
+
+    def sentences(self) -> list:
+        """
+        Remove the complete sentences from the buffer
+        :return: list of the fields of each valid sentence, as bytes and
+                 without '$' and checksum, like [b'GPGGA', b'003918.00', ...]
+        """
+        buffer = self.buffer
+        last = buffer.rfind(b'\n', 0, self.end)
+        if last < 0:
+            if self.end == len(buffer):
+                # a full buffer without line end is garbage
+                self.end = 0
+            return []
+        data = np.frombuffer(buffer, dtype=np.uint8, count=last + 1)
+        xor = np.zeros(last + 2, dtype=np.uint8)
+        np.bitwise_xor.accumulate(data, out=xor[1:])
+        line_ends = np.flatnonzero(data == ord('\n')).tolist()
+        del data
+
+        sentences = []
+        start = 0
+        for end in line_ends:
+            dollar = buffer.rfind(b'$', start, end)
+            star = buffer.find(b'*', dollar, end) if dollar >= 0 else -1
+            if star >= 0:
+                try:
+                    checksum = int(buffer[star + 1:star + 3], 16)
+                except ValueError:
+                    checksum = -1
+                if checksum == xor[star] ^ xor[dollar + 1]:
+                    sentences.append(bytes(buffer[dollar + 1:star]).split(b','))
+                else:
+                    self.invalid += 1
+            start = end + 1
+
+        # keep the incomplete sentence
+        remaining = self.end - last - 1
+        buffer[:remaining] = buffer[last + 1:self.end]
+        self.end = remaining
+        return sentences
+
+
 class Gps:
-    def __init__(self, serial:str, baudrate:int = 9600, timeout:float = 0.5, debug = False):
+    """
+    Reads the NMEA sentences of a gps from a serial port and publishes the
+    positions of GGA and RMC sentences as (timestamp, x, y) in meters, like
+    getGpsPosition(). Speed in m/s and course in degrees of RMC and VTG
+    sentences are kept in speed and course.
+
+    The serial input is read in bulk, rate times per second by update(),
+    and parsed by an NmeaStream. A GGA and an RMC sentence of the same fix
+    give one position. Positions are collected in an array of capacity
+    positions, keeping the newest ones if nobody takes them, and run()
+    or run_threaded() return those since the last call as a read only
+    array of POSITION_DTYPE. It stays unchanged until the call after
+    the next one.
+    """
+    def __init__(self, serial:str, baudrate:int = 9600, timeout:float = 0.5,
+                 rate:float = 50, capacity:int = 64, debug = False):
         self.serial = serial
         self.baudrate = baudrate
         self.timeout = timeout
+        self.poll_delay = 1.0 / rate
         self.debug = debug
-        self.positions = []  # tuple of (timestamp, longitude, latitude)
+        self.stream = NmeaStream()
+        self.filling = np.empty(capacity, dtype=POSITION_DTYPE)
+        self.spare = np.empty(capacity, dtype=POSITION_DTYPE)
+        self.count = 0
+        self.dropped = 0
+        self.last_fix_time = None
+        self.zone_number = None
+        self.speed = None
+        self.course = None
         self.gps = None
         self.lock = threading.Lock()
         self.running = True
@@ -31,115 +143,157 @@ class Gps:
 
     def _open(self):
         with self.lock:
-            self.gps = serial.Serial(self.serial, baudrate=self.baudrate, timeout=self.timeout)
+            # also opens pyserial urls, like loop:// for tests
+            self.gps = serial.serial_for_url(self.serial, baudrate=self.baudrate, timeout=self.timeout)
 
     def clear(self):
         """
         Clear the positions buffer
         """
         with self.lock:
+            self.count = 0
+            self.stream.end = 0
             try:
                 if self.gps is not None and self.gps.is_open:
-                    self.positions = []
                     self.gps.reset_input_buffer()
             except serial.serialutil.SerialException:
                 pass
 
-    def _readline(self) -> str:
+    def _read(self) -> list:
+        """
+        Read all waiting bytes
+        :return: fields of the sentences completed by them
         """
-        Read a line from the gps in a threadsafe manner
-        returns line if read and None if no line was read
+        sentences = []
+        try:
+            waiting = self.gps.in_waiting if self.gps is not None else 0
+            # TODO: Serial.in_waiting _always_ returns 0 in Macintosh
+            if waiting == 0 and is_mac() and self.gps is not None:
+                waiting = 1
+            while waiting > 0:
+                space = self.stream.space()
+                count = self.gps.readinto(space[:min(waiting, len(space))])
+                if not count:
+                    break
+                self.stream.written(count)
+                waiting -= count
+                sentences += self.stream.sentences()
+        except serial.serialutil.SerialException:
+            pass
+        return sentences
+
+    def parse(self, sentences, timestamp:float):
         """
-        if self.lock.acquire(blocking=False):
+        Add the positions of the sentences and update speed and course
+        """
+        latitudes = []
+        longitudes = []
+        for fields in sentences:
+            kind = fields[0][2:]
             try:
-                # TODO: Serial.in_waiting _always_ returns 0 in Macintosh
-                if self.gps is not None and self.gps.is_open and (is_mac() or self.gps.in_waiting):
-                    return self.gps.readline().decode()
-            except serial.serialutil.SerialException:
-                pass
-            except UnicodeDecodeError:
-                # the first sentence often includes mis-framed garbase
-                pass  # ignore and keep going
-            finally:
-                self.lock.release()
-        return None
+                if kind == b'GGA' and len(fields) > 6:
+                    fix_time = fields[1]
+                    valid = fields[6] not in (b'', b'0')
+                    position = fields[2:6]
+                elif kind == b'RMC' and len(fields) > 8:
+                    fix_time = fields[1]
+                    valid = fields[2] == b'A'
+                    position = fields[3:7]
+                    if valid and fields[7]:
+                        self.speed = float(fields[7]) * KNOTS_TO_METERS_PER_SECOND
+                    if valid and fields[8]:
+                        self.course = float(fields[8])
+                    if not valid:
+                        logger.info("GPS receiver warning; position not valid")
+                elif kind == b'VTG' and len(fields) > 7:
+                    if fields[1]:
+                        self.course = float(fields[1])
+                    if fields[7]:
+                        self.speed = float(fields[7]) / 3.6
+                    elif fields[5]:
+                        self.speed = float(fields[5]) * KNOTS_TO_METERS_PER_SECOND
+                    continue
+                else:
+                    continue
+                if not valid or fix_time == self.last_fix_time \
+                        or not position[0] or not position[2]:
+                    continue
+                self.last_fix_time = fix_time
+                latitudes.append(float(position[0]) * (-1 if position[1] == b'S' else 1))
+                longitudes.append(float(position[2]) * (-1 if position[3] == b'W' else 1))
+            except ValueError:
+                logger.info(f"Ignoring NMEA sentence {b','.join(fields)}")
+        if latitudes:
+            self.add_positions(timestamp, nmea_to_degrees_array(latitudes),
+                               nmea_to_degrees_array(longitudes))
+
+    def add_positions(self, timestamp:float, latitudes:np.ndarray, longitudes:np.ndarray):
+        # one utm conversion for all positions, in the zone of the first one
+        southern = latitudes < 0
+        if southern.any() and not southern.all():
+            # utm converts positions of one hemisphere at a time
+            easting = np.empty(len(latitudes))
+            northing = np.empty(len(latitudes))
+            for hemisphere in (southern, ~southern):
+                easting[hemisphere], northing[hemisphere], self.zone_number, _ = \
+                    utm.from_latlon(latitudes[hemisphere], longitudes[hemisphere],
+                                    force_zone_number=self.zone_number)
+        else:
+            easting, northing, self.zone_number, _ = utm.from_latlon(
+                latitudes, longitudes, force_zone_number=self.zone_number)
+        with self.lock:
+            count = min(len(latitudes), len(self.filling))
+            if self.count + count > len(self.filling):
+                # keep the newest positions
+                keep = len(self.filling) - count
+                self.dropped += self.count - keep + len(latitudes) - count
+                self.filling[:keep] = self.filling[self.count - keep:self.count]
+                self.count = keep
+                easting = easting[-count:]
+                northing = northing[-count:]
+            positions = self.filling[self.count:self.count + count]
+            positions['timestamp'] = timestamp
+            # same order as getGpsPosition()
+            positions['x'] = northing
+            positions['y'] = easting
+            self.count += count
+
+    def publish(self) -> np.ndarray:
+        """
+        :return: the positions added since the last call, read only
+        """
+        with self.lock:
+            positions = self.filling[:self.count]
+            positions.flags.writeable = False
+            self.filling, self.spare = self.spare, self.filling
+            self.count = 0
+        return positions
 
     def poll(self, timestamp=None):
-        #
-        # read a line and convert to a position
-        # in a threadsafe manner
-        #
-        # if there are characters waiting
-        # then read the line and parse it
-        #
         if self.running:
             if timestamp is None:
                 timestamp = time.time()
-            line = self._readline()
-            if line:
+            sentences = self._read()
+            if sentences:
                 if self.debug:
-                    logger.info(line)
-                position = getGpsPosition(line, debug=self.debug)
-                if position:
-                    # (timestamp, longitude latitude)
-                    return (timestamp, position[0], position[1])
-        return None
+                    logger.info(sentences)
+                self.parse(sentences, timestamp)
 
     def run(self):
         if self.running:
-            #
-            # in non-threaded mode, just read a single reading and return it
-            #
-            if self.gps is not None:
-                position = self.poll(time.time())
-                if position:
-                    # [(timestamp, longitude, latitude)]
-                    return [position]
-
-        return []
-
+            self.poll(time.time())
+        return self.publish()
 
     def run_threaded(self):
-        if not self.running:
-            return []
-
-        #
-        # return the accumulated readings
-        #
-        with self.lock:
-            positions = self.positions
-            self.positions = []
-            return positions
-
+        return self.publish()
 
     def update(self):
         #
-        # open serial port and run an infinite loop.
         # NOTE: this is NOT compatible with non-threaded run()
         #
-        buffered_positions = []  # local read buffer
         while self.running:
-            position = self.poll(time.time())
-            if position:
-                buffered_positions.append(position)
-            if buffered_positions:
-                #
-                # make sure we access self.positions in
-                # a threadsafe manner.
-                # This will NOT block:
-                # - If it can't write then it will leave
-                #   readings in buffered_positions.
-                # - If it can write then it will moved the
-                #   buffered_positions into self.positions
-                #   and clear the buffer.
-                #
-                if self.lock.acquire(blocking=False):
-                    try:
-                        self.positions += buffered_positions
-                        buffered_positions = []
-                    finally:
-                        self.lock.release()
-            time.sleep(0)  # give other threads time
+            self.poll(time.time())
+            time.sleep(self.poll_delay)
 
     def shutdown(self):
         self.running = False
@@ -299,6 +453,17 @@ def nmea_to_degrees(gps_str, direction):
     # sum up the degrees and apply the direction as a sign
     #
     return (degrees + minutes) * (-1 if direction in ['W', 'S'] else 1)
+
+
+def nmea_to_degrees_array(values) -> np.ndarray:
+    """
+    Vectorised nmea_to_degrees() for coordinates DDDMM.MMMMM already
+    converted to floats, negative for W and S.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    magnitude = np.abs(values)
+    degrees = np.floor(magnitude / 100)
+    return np.sign(values) * (degrees + (magnitude - 100 * degrees) / 60)
     
 
 #
@@ -583,7 +748,7 @@ if __name__ == "__main__":
         state = "prompt" if waypoint_count > 0 else ""
         while gps_reader.running:
             readings = read_gps()
-            if readings:
+            if len(readings):
                 print("")
                 if state == "prompt":
                     print(f"Move to waypoint #{len(waypoints)+1} and press the space bar and enter to start sampling or any other key to just start logging.")
@@ -597,7 +762,7 @@ if __name__ == "__main__":
                     else:
                         state = ""  # just start logging
                 elif state == "sampling":
-                    waypoint_samples += readings
+                    waypoint_samples.extend(readings.tolist())
                     count = len(waypoint_samples)
                     print(f"Collected {count} so far...")
                     if count > samples_per_waypoint:
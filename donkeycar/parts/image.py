@@ -10,6 +10,9 @@ class ImgArrToJpg():
     def run(self, img_arr):
         if img_arr is None:
             return None
+        if isinstance(img_arr, bytes):
+            # already jpeg, i.e. passed through from an MJPEG camera
+            return img_arr
         try:
             image = arr_to_img(img_arr)
             jpg = img_to_binary(image)
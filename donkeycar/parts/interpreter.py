@@ -4,17 +4,14 @@ import logging
 import numpy as np
 from typing import Union, Sequence, List
 
-import tensorflow as tf
-from tensorflow import keras
-
-from tensorflow.python.framework.convert_to_constants import \
-    convert_variables_to_constants_v2 as convert_var_to_const
-from tensorflow.python.saved_model import tag_constants, signature_constants
+# Note: tensorflow is imported lazily in the functions and methods that need
+# it, so importing this module (and the pilots) stays cheap on the car
 
 logger = logging.getLogger(__name__)
 
 
 def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
+    import tensorflow as tf
     logger.info(f'Convert model {in_filename} to TFLite {out_filename}')
     model = tf.keras.models.load_model(in_filename)
     keras_to_tflite(model, out_filename, data_gen)
@@ -22,6 +19,7 @@ def keras_model_to_tflite(in_filename, out_filename, data_gen=None):
 
 
 def keras_to_tflite(model, out_filename, data_gen=None):
+    import tensorflow as tf
     converter = tf.lite.TFLiteConverter.from_keras_model(model)
     converter.target_spec.supported_ops = [tf.lite.OpsSet.TFLITE_BUILTINS,
                                            tf.lite.OpsSet.SELECT_TF_OPS]
@@ -72,8 +70,28 @@ def saved_model_to_tensor_rt(saved_path: str, tensor_rt_path: str):
         logger.error(f'TensorRT conversion failed because: {e}')
 
 
+def keras_model_to_onnx(in_filename, out_filename, opset=13):
+    import tensorflow as tf
+    logger.info(f'Convert model {in_filename} to ONNX {out_filename}')
+    model = tf.keras.models.load_model(in_filename, compile=False)
+    keras_to_onnx(model, out_filename, opset)
+    logger.info('ONNX conversion done.')
+
+
+def keras_to_onnx(model, out_filename, opset=13):
+    """ Converts a keras model into ONNX format, keeping the names of the
+        keras input layers as the names of the ONNX graph inputs. Requires
+        the tf2onnx package which is only needed at training time. """
+    import tensorflow as tf
+    import tf2onnx
+    input_signature = [tf.TensorSpec(inp.shape, tf.float32, name=name)
+                       for inp, name in zip(model.inputs, model.input_names)]
+    tf2onnx.convert.from_keras(model, input_signature=input_signature,
+                               opset=opset, output_path=out_filename)
+
+
 class Interpreter(ABC):
-    """ Base class to delegate between Keras, TFLite and TensorRT """
+    """ Base class to delegate between Keras, TFLite, TensorRT and ONNX """
 
     @abstractmethod
     def load(self, model_path: str) -> None:
@@ -86,14 +104,15 @@ class Interpreter(ABC):
         """ Some interpreters will need the model"""
         pass
 
-    def set_optimizer(self, optimizer: tf.keras.optimizers.Optimizer) -> None:
+    def set_optimizer(self, optimizer: 'tf.keras.optimizers.Optimizer') \
+            -> None:
         pass
 
     def compile(self, **kwargs):
         raise NotImplementedError('Requires implementation')
 
     @abstractmethod
-    def get_input_shapes(self) -> List[tf.TensorShape]:
+    def get_input_shapes(self) -> List['tf.TensorShape']:
         pass
 
     @abstractmethod
@@ -116,15 +135,16 @@ class KerasInterpreter(Interpreter):
 
     def __init__(self):
         super().__init__()
-        self.model: tf.keras.Model = None
+        self.model: 'tf.keras.Model' = None
 
     def set_model(self, pilot: 'KerasPilot') -> None:
         self.model = pilot.create_model()
 
-    def set_optimizer(self, optimizer: tf.keras.optimizers.Optimizer) -> None:
+    def set_optimizer(self, optimizer: 'tf.keras.optimizers.Optimizer') \
+            -> None:
         self.model.optimizer = optimizer
 
-    def get_input_shapes(self) -> List[tf.TensorShape]:
+    def get_input_shapes(self) -> List['tf.TensorShape']:
         assert self.model, 'Model not set'
         return [inp.shape for inp in self.model.inputs]
 
@@ -159,6 +179,7 @@ class KerasInterpreter(Interpreter):
         return self.invoke(input_dict)
 
     def load(self, model_path: str) -> None:
+        from tensorflow import keras
         logger.info(f'Loading model {model_path}')
         self.model = keras.models.load_model(model_path, compile=False)
 
@@ -243,6 +264,7 @@ class TfLite(Interpreter):
         self.output_details = None
     
     def load(self, model_path):
+        import tensorflow as tf
         assert os.path.splitext(model_path)[1] == '.tflite', \
             'TFlitePilot should load only .tflite files'
         logger.info(f'Loading model {model_path}')
@@ -307,13 +329,18 @@ class TensorRT(Interpreter):
         self.frozen_func = None
         self.input_shapes = None
 
-    def get_input_shapes(self) -> List[tf.TensorShape]:
+    def get_input_shapes(self) -> List['tf.TensorShape']:
         return self.input_shapes
 
     def compile(self, **kwargs):
         pass
 
     def load(self, model_path: str) -> None:
+        import tensorflow as tf
+        from tensorflow.python.framework.convert_to_constants import \
+            convert_variables_to_constants_v2 as convert_var_to_const
+        from tensorflow.python.saved_model import tag_constants, \
+            signature_constants
         saved_model_loaded = tf.saved_model.load(model_path,
                                                  tags=[tag_constants.SERVING])
         graph_func = saved_model_loaded.signatures[
@@ -355,6 +382,61 @@ class TensorRT(Interpreter):
     @staticmethod
     def convert(arr):
         """ Helper function. """
+        import tensorflow as tf
         value = tf.compat.v1.get_variable("features", dtype=tf.float32,
                                           initializer=tf.constant(arr))
         return tf.convert_to_tensor(value=value)
+
+
+class OnnxInterpreter(Interpreter):
+    """
+    This class wraps around the ONNX Runtime inference session. It does not
+    need TensorFlow at runtime, only the onnxruntime package.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.session = None
+        self.input_names = None
+        self.input_shapes = None
+
+    def load(self, model_path: str) -> None:
+        assert os.path.splitext(model_path)[1] == '.onnx', \
+            'OnnxInterpreter should load only .onnx files'
+        import onnxruntime as ort
+        logger.info(f'Loading model {model_path}')
+        self.session = ort.InferenceSession(
+            model_path, providers=ort.get_available_providers())
+        inputs = self.session.get_inputs()
+        self.input_names = [inp.name for inp in inputs]
+        self.input_shapes = [inp.shape for inp in inputs]
+        logger.info(f'Load model with onnx inputs {self.input_names} and '
+                    f'shapes {self.input_shapes}')
+
+    def compile(self, **kwargs):
+        pass
+
+    def invoke(self, feed) -> Sequence[Union[float, np.ndarray]]:
+        # as we invoke the session with a batch size of one we remove the
+        # additional dimension here again
+        outputs = [out[0] for out in self.session.run(None, feed)]
+        # don't return list if output is 1d
+        return outputs if len(outputs) > 1 else outputs[0]
+
+    def predict(self, img_arr: np.ndarray, other_arr: np.ndarray) \
+            -> Sequence[Union[float, np.ndarray]]:
+        assert self.session, 'Onnx model not loaded'
+        input_arrays = (img_arr, other_arr)
+        feed = {name: np.expand_dims(arr, axis=0).astype(np.float32)
+                for name, arr in zip(self.input_names, input_arrays)}
+        return self.invoke(feed)
+
+    def predict_from_dict(self, input_dict):
+        assert self.session, 'Onnx model not loaded'
+        feed = {name: np.expand_dims(input_dict[name], axis=0)
+                .astype(np.float32) for name in self.input_names}
+        return self.invoke(feed)
+
+    def get_input_shapes(self):
+        assert self.input_shapes is not None, "Need to load model first"
+        return self.input_shapes
@@ -9,31 +9,19 @@ include one or more models to help direct the vehicles motion.
 """
 
 from abc import ABC, abstractmethod
-from collections import deque
+from functools import wraps
 
 import numpy as np
 from typing import Dict, Tuple, Optional, Union, List, Sequence, Callable
 from logging import getLogger
 
-from tensorflow.python.data.ops.dataset_ops import DatasetV1, DatasetV2
-
 import donkeycar as dk
 from donkeycar.utils import normalize_image, linear_bin
 from donkeycar.pipeline.types import TubRecord
 from donkeycar.parts.interpreter import Interpreter, KerasInterpreter
 
-import tensorflow as tf
-from tensorflow import keras
-from tensorflow.keras.layers import Input, Dense
-from tensorflow.keras.layers import Convolution2D, MaxPooling2D, \
-    BatchNormalization
-from tensorflow.keras.layers import Activation, Dropout, Flatten
-from tensorflow.keras.layers import LSTM
-from tensorflow.keras.layers import TimeDistributed as TD
-from tensorflow.keras.layers import Conv3D, MaxPooling3D, Conv2DTranspose
-from tensorflow.keras.backend import concatenate
-from tensorflow.keras.models import Model
-from tensorflow.python.keras.callbacks import EarlyStopping, ModelCheckpoint
+# Note: tensorflow is imported lazily where models are built or trained, so
+# pilots running through a non-keras interpreter don't pay for the import
 
 ONE_BYTE_SCALE = 1.0 / 255.0
 
@@ -44,6 +32,85 @@ XY = Union[float, np.ndarray, Tuple[Union[float, np.ndarray], ...]]
 logger = getLogger(__name__)
 
 
+def skip_unchanged_frame(run: Callable) -> Callable:
+    """
+    Decorator for the run method of a pilot. When the drive loop runs faster
+    than the camera the same image array object is passed again. In that case
+    the model is not invoked and the previous output is returned, provided
+    the additional input didn't change either.
+    """
+    @wraps(run)
+    def wrapper(self, img_arr, other_arr=None):
+        if self.skip_unchanged_frames and img_arr is self.last_img_arr \
+                and img_arr is not None \
+                and _other_unchanged(other_arr, self.last_other_arr):
+            self.skipped_inferences += 1
+            return self.last_output
+        output = run(self, img_arr, other_arr)
+        self.last_img_arr = img_arr
+        self.last_other_arr = _copy_other(other_arr, self.last_other_arr)
+        self.last_output = output
+        return output
+    return wrapper
+
+
+def _copy_other(other_arr, last_other_arr) -> Optional[np.ndarray]:
+    """ Copy other_arr, as lists or arrays could be changed in place by
+        other parts, into the array of the last copy if it fits """
+    if other_arr is None:
+        return None
+    other_arr = np.asarray(other_arr)
+    if last_other_arr is None or last_other_arr.shape != other_arr.shape \
+            or last_other_arr.dtype != other_arr.dtype:
+        return other_arr.copy()
+    np.copyto(last_other_arr, other_arr)
+    return last_other_arr
+
+
+def _other_unchanged(other_arr, last_other_arr) -> bool:
+    if other_arr is None or last_other_arr is None:
+        return other_arr is last_other_arr
+    return np.array_equal(other_arr, last_other_arr)
+
+
+class SequenceBuffer:
+    """
+    Fixed length sequence of the most recent items, i.e. images or controls,
+    backed by a preallocated array. Every item is written twice, at its ring
+    position and at the same position shifted by the sequence length, so the
+    sequence in chronological order is always available as a contiguous view
+    of the buffer without stacking or copying the items.
+    """
+    def __init__(self, seq_length: int, item_shape: Tuple[int, ...],
+                 dtype=np.float32) -> None:
+        self.seq_length = seq_length
+        self.buffer = np.zeros((2 * seq_length, *item_shape), dtype=dtype)
+        # ring position of the oldest item
+        self.index = 0
+        self.empty = True
+
+    def fill(self, item) -> None:
+        """ Set all items of the sequence to the given item """
+        self.buffer[:] = item
+        self.index = 0
+        self.empty = False
+
+    def append(self, item) -> None:
+        """ Append item and drop the oldest one. The first item appended to
+            an empty buffer fills the whole sequence. """
+        if self.empty:
+            self.fill(item)
+            return
+        self.buffer[self.index] = item
+        self.buffer[self.index + self.seq_length] = item
+        self.index = (self.index + 1) % self.seq_length
+
+    def view(self) -> np.ndarray:
+        """ Returns the sequence, oldest item first, as a view into the
+            buffer which is only valid until the next append. """
+        return self.buffer[self.index:self.index + self.seq_length]
+
+
 class KerasPilot(ABC):
     """
     Base class for Keras models that will provide steering and throttle to
@@ -57,6 +124,12 @@ class KerasPilot(ABC):
         self.optimizer = "adam"
         self.interpreter = interpreter
         self.interpreter.set_model(self)
+        # return previous output if the drive loop passes the same frame again
+        self.skip_unchanged_frames = True
+        self.skipped_inferences = 0
+        self.last_img_arr = None
+        self.last_other_arr = None
+        self.last_output = None
         logger.info(f'Created {self} with interpreter: {interpreter}')
 
     def load(self, model_path: str) -> None:
@@ -67,7 +140,8 @@ class KerasPilot(ABC):
         self.interpreter.load_weights(model_path, by_name=by_name)
 
     def shutdown(self) -> None:
-        pass
+        logger.info(f'{self} skipped {self.skipped_inferences} inferences on '
+                    f'unchanged frames')
 
     def compile(self) -> None:
         pass
@@ -78,6 +152,7 @@ class KerasPilot(ABC):
 
     def set_optimizer(self, optimizer_type: str,
                       rate: float, decay: float) -> None:
+        from tensorflow import keras
         if optimizer_type == "adam":
             optimizer = keras.optimizers.Adam(lr=rate, decay=decay)
         elif optimizer_type == "sgd":
@@ -88,12 +163,13 @@ class KerasPilot(ABC):
             raise Exception(f"Unknown optimizer type: {optimizer_type}")
         self.interpreter.set_optimizer(optimizer)
 
-    def get_input_shapes(self) -> List[tf.TensorShape]:
+    def get_input_shapes(self) -> List['tf.TensorShape']:
         return self.interpreter.get_input_shapes()
 
     def seq_size(self) -> int:
         return 0
 
+    @skip_unchanged_frame
     def run(self, img_arr: np.ndarray, other_arr: List[float] = None) \
             -> Tuple[Union[float, np.ndarray], ...]:
         """
@@ -106,7 +182,8 @@ class KerasPilot(ABC):
         :return:            tuple of (angle, throttle)
         """
         norm_arr = normalize_image(img_arr)
-        np_other_array = np.array(other_arr) if other_arr else None
+        np_other_array = np.asarray(other_arr) \
+            if other_arr is not None and len(other_arr) else None
         return self.inference(norm_arr, np_other_array)
 
     def inference(self, img_arr: np.ndarray, other_arr: Optional[np.ndarray]) \
@@ -144,19 +221,21 @@ class KerasPilot(ABC):
 
     def train(self,
               model_path: str,
-              train_data: Union[DatasetV1, DatasetV2],
+              train_data: 'tf.data.Dataset',
               train_steps: int,
               batch_size: int,
-              validation_data: Union[DatasetV1, DatasetV2],
+              validation_data: 'tf.data.Dataset',
               validation_steps: int,
               epochs: int,
               verbose: int = 1,
               min_delta: float = .0005,
               patience: int = 5,
-              show_plot: bool = False) -> tf.keras.callbacks.History:
+              show_plot: bool = False) -> Dict[str, List[float]]:
         """
         trains the model
         """
+        from tensorflow.python.keras.callbacks import EarlyStopping, \
+            ModelCheckpoint
         assert isinstance(self.interpreter, KerasInterpreter)
         model = self.interpreter.model
         self.compile()
@@ -170,7 +249,7 @@ class KerasPilot(ABC):
                             save_best_only=True,
                             verbose=verbose)]
 
-        history: tf.keras.callbacks.History = model.fit(
+        history: 'tf.keras.callbacks.History' = model.fit(
             x=train_data,
             steps_per_epoch=train_steps,
             batch_size=batch_size,
@@ -254,11 +333,12 @@ class KerasPilot(ABC):
 
     def output_types(self) -> Tuple[Dict[str, np.typename], ...]:
         """ Used in tf.data, assume all types are doubles"""
+        import tensorflow as tf
         shapes = self.output_shapes()
         types = tuple({k: tf.float64 for k in d} for d in shapes)
         return types
 
-    def output_shapes(self) -> Dict[str, tf.TensorShape]:
+    def output_shapes(self) -> Dict[str, 'tf.TensorShape']:
         return {}
 
     def __str__(self) -> str:
@@ -320,6 +400,7 @@ class KerasCategorical(KerasPilot):
         return {'angle_out': angle, 'throttle_out': throttle}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         shapes = ({'img_in': tf.TensorShape(img_shape)},
@@ -364,6 +445,7 @@ class KerasLinear(KerasPilot):
         return {'n_outputs0': angle, 'n_outputs1': throttle}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         shapes = ({'img_in': tf.TensorShape(img_shape)},
@@ -386,13 +468,18 @@ class KerasMemory(KerasLinear):
                  mem_start_speed: float = 0.0):
         self.mem_length = mem_length
         self.mem_start_speed = mem_start_speed
-        self.mem_seq = deque([[0, mem_start_speed]] * mem_length)
+        self.mem_seq = self.create_mem_seq()
         self.mem_depth = mem_depth
         super().__init__(interpreter, input_shape)
 
     def seq_size(self) -> int:
         return self.mem_length + 1
 
+    def create_mem_seq(self) -> SequenceBuffer:
+        mem_seq = SequenceBuffer(self.mem_length, (2, ))
+        mem_seq.fill([0, self.mem_start_speed])
+        return mem_seq
+
     def create_model(self):
         return default_memory(self.input_shape,
                               self.mem_length, self.mem_depth, )
@@ -400,18 +487,17 @@ class KerasMemory(KerasLinear):
     def load(self, model_path: str) -> None:
         super().load(model_path)
         self.mem_length = self.interpreter.get_input_shapes()[1][1] // 2
-        self.mem_seq = deque([[0, self.mem_start_speed]] * self.mem_length)
+        self.mem_seq = self.create_mem_seq()
         logger.info(f'Loaded memory model with mem length {self.mem_length}')
 
+    @skip_unchanged_frame
     def run(self, img_arr: np.ndarray, other_arr: List[float] = None) -> \
             Tuple[Union[float, np.ndarray], ...]:
-        # Only called at start to fill the previous values
-
-        np_mem_arr = np.array(self.mem_seq).reshape((2 * self.mem_length,))
+        # the sequence view is contiguous, so reshape doesn't copy
+        np_mem_arr = self.mem_seq.view().reshape((2 * self.mem_length,))
         img_arr_norm = normalize_image(img_arr)
         angle, throttle = super().inference(img_arr_norm, np_mem_arr)
-        # fill new values into back of history list for next call
-        self.mem_seq.popleft()
+        # fill new values into back of history for next call
         self.mem_seq.append([angle, throttle])
         return angle, throttle
 
@@ -454,6 +540,7 @@ class KerasMemory(KerasLinear):
         return angle, throttle
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         shapes = ({'img_in': tf.TensorShape(img_shape),
@@ -494,6 +581,7 @@ class KerasInferred(KerasPilot):
         return {'n_outputs0': y}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         shapes = ({'img_in': tf.TensorShape(img_shape)},
@@ -587,6 +675,7 @@ class KerasIMU(KerasPilot):
         return {'out_0': angle, 'out_1': throttle}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         # the keys need to match the models input/output layers
@@ -637,6 +726,7 @@ class KerasBehavioral(KerasCategorical):
         return {'img_in': x[0], 'xbehavior_in': x[1]}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         # the keys need to match the models input/output layers
@@ -688,6 +778,7 @@ class KerasLocalizer(KerasPilot):
         return {'angle': angle, 'throttle': throttle, 'zloc': loc}
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         # the keys need to match the models input/output layers
@@ -707,7 +798,8 @@ class KerasLSTM(KerasPilot):
         self.num_outputs = num_outputs
         self.seq_length = seq_length
         super().__init__(interpreter, input_shape)
-        self.img_seq = deque()
+        # holds the normalised images
+        self.img_seq = SequenceBuffer(seq_length, input_shape)
         self.optimizer = "rmsprop"
 
     def seq_size(self) -> int:
@@ -759,19 +851,14 @@ class KerasLSTM(KerasPilot):
         assert isinstance(y, tuple), 'Expected tuple'
         return {'model_outputs': list(y)}
 
+    @skip_unchanged_frame
     def run(self, img_arr, other_arr=None):
         if img_arr.shape[2] == 3 and self.input_shape[2] == 1:
             img_arr = dk.utils.rgb2gray(img_arr)
-
-        while len(self.img_seq) < self.seq_length:
-            self.img_seq.append(img_arr)
-
-        self.img_seq.popleft()
-        self.img_seq.append(img_arr)
-        new_shape = (self.seq_length, *self.input_shape)
-        img_arr = np.array(self.img_seq).reshape(new_shape)
-        img_arr_norm = normalize_image(img_arr)
-        return self.inference(img_arr_norm, other_arr)
+        # only the new image gets normalised and copied into the sequence
+        img_arr_norm = normalize_image(img_arr.reshape(self.input_shape))
+        self.img_seq.append(img_arr_norm)
+        return self.inference(self.img_seq.view(), other_arr)
 
     def interpreter_to_output(self, interpreter_out) \
             -> Tuple[Union[float, np.ndarray], ...]:
@@ -780,6 +867,7 @@ class KerasLSTM(KerasPilot):
         return steering, throttle
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         # the keys need to match the models input/output layers
@@ -801,7 +889,8 @@ class Keras3D_CNN(KerasPilot):
         self.num_outputs = num_outputs
         self.seq_length = seq_length
         super().__init__(interpreter, input_shape)
-        self.img_seq = deque()
+        # holds the normalised images
+        self.img_seq = SequenceBuffer(seq_length, input_shape)
 
     def seq_size(self) -> int:
         return self.seq_length
@@ -851,19 +940,14 @@ class Keras3D_CNN(KerasPilot):
         assert isinstance(y, tuple), 'Expected tuple'
         return {'outputs': list(y)}
 
+    @skip_unchanged_frame
     def run(self, img_arr, other_arr=None):
         if img_arr.shape[2] == 3 and self.input_shape[2] == 1:
             img_arr = dk.utils.rgb2gray(img_arr)
-
-        while len(self.img_seq) < self.seq_length:
-            self.img_seq.append(img_arr)
-
-        self.img_seq.popleft()
-        self.img_seq.append(img_arr)
-        new_shape = (self.seq_length, *self.input_shape)
-        img_arr = np.array(self.img_seq).reshape(new_shape)
-        img_arr_norm = normalize_image(img_arr)
-        return self.inference(img_arr_norm, other_arr)
+        # only the new image gets normalised and copied into the sequence
+        img_arr_norm = normalize_image(img_arr.reshape(self.input_shape))
+        self.img_seq.append(img_arr_norm)
+        return self.inference(self.img_seq.view(), other_arr)
 
     def interpreter_to_output(self, interpreter_out) \
             -> Tuple[Union[float, np.ndarray], ...]:
@@ -872,6 +956,7 @@ class Keras3D_CNN(KerasPilot):
         return steering, throttle
 
     def output_shapes(self):
+        import tensorflow as tf
         # need to cut off None from [None, 120, 160, 3] tensor shape
         img_shape = self.get_input_shapes()[0][1:]
         # the keys need to match the models input/output layers
@@ -916,6 +1001,7 @@ def conv2d(filters, kernel, strides, layer_num, activation='relu'):
     :param activation:  activation, defaults to relu
     :return:            tf.keras Convolution2D layer
     """
+    from tensorflow.keras.layers import Convolution2D
     return Convolution2D(filters=filters,
                          kernel_size=(kernel, kernel),
                          strides=(strides, strides),
@@ -933,6 +1019,7 @@ def core_cnn_layers(img_in, drop, l4_stride=1):
     :param l4_stride:       4-th layer stride, default 1
     :return:                stack of CNN layers
     """
+    from tensorflow.keras.layers import Dropout, Flatten
     x = img_in
     x = conv2d(24, 5, 2, 1)(x)
     x = Dropout(drop)(x)
@@ -949,6 +1036,8 @@ def core_cnn_layers(img_in, drop, l4_stride=1):
 
 
 def default_n_linear(num_outputs, input_shape=(120, 160, 3)):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop)
@@ -967,6 +1056,9 @@ def default_n_linear(num_outputs, input_shape=(120, 160, 3)):
 
 
 def default_memory(input_shape=(120, 160, 3), mem_length=3, mem_depth=0):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.backend import concatenate
+    from tensorflow.keras.models import Model
     drop = 0.2
     drop2 = 0.1
     logger.info(f'Creating memory model with length {mem_length}, depth '
@@ -994,6 +1086,8 @@ def default_memory(input_shape=(120, 160, 3), mem_length=3, mem_depth=0):
 
 
 def default_categorical(input_shape=(120, 160, 3)):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = core_cnn_layers(img_in, drop, l4_stride=2)
@@ -1012,6 +1106,9 @@ def default_categorical(input_shape=(120, 160, 3)):
 
 
 def default_imu(num_outputs, num_imu_inputs, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.backend import concatenate
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     imu_in = Input(shape=(num_imu_inputs,), name="imu_in")
@@ -1040,6 +1137,9 @@ def default_imu(num_outputs, num_imu_inputs, input_shape):
 
 
 def default_bhv(num_bvh_inputs, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.backend import concatenate
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     # tensorflow is ordering the model inputs alphabetically in tensorrt,
@@ -1072,6 +1172,8 @@ def default_bhv(num_bvh_inputs, input_shape):
 
 
 def default_loc(num_locations, input_shape):
+    from tensorflow.keras.layers import Input, Dense, Dropout
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
 
@@ -1098,6 +1200,10 @@ def default_loc(num_locations, input_shape):
 
 
 def rnn_lstm(seq_length=3, num_outputs=2, input_shape=(120, 160, 3)):
+    from tensorflow.keras.layers import Input, Dense, Dropout, Flatten, \
+        Convolution2D, MaxPooling2D, LSTM
+    from tensorflow.keras.layers import TimeDistributed as TD
+    from tensorflow.keras.models import Model
     # add sequence length dimensions as keras time-distributed expects shape
     # of (num_samples, seq_length, input_shape)
     img_seq_shape = (seq_length,) + input_shape
@@ -1140,6 +1246,9 @@ def build_3d_cnn(input_shape, s, num_outputs):
     :param num_outputs:     output dimension
     :return:                keras model
     """
+    from tensorflow.keras.layers import Input, Dense, Dropout, Flatten, \
+        Activation, BatchNormalization, Conv3D, MaxPooling3D
+    from tensorflow.keras.models import Model
     drop = 0.5
     input_shape = (s, ) + input_shape
     img_in = Input(shape=input_shape, name='img_in')
@@ -1194,6 +1303,9 @@ def default_latent(num_outputs, input_shape):
     # TODO: this auto-encoder should run the standard cnn in encoding and
     #  have corresponding decoder. Also outputs should be reversed with
     #  images at end.
+    from tensorflow.keras.layers import Input, Dense, Dropout, Flatten, \
+        Convolution2D, Conv2DTranspose
+    from tensorflow.keras.models import Model
     drop = 0.2
     img_in = Input(shape=input_shape, name='img_in')
     x = img_in
@@ -2,9 +2,9 @@ import logging
 import math
 import time
 from typing import Tuple
-from tensorflow.python.ops.linalg_ops import norm
 
-from tornado.web import _xsrf_form_html
+import numpy as np
+
 from donkeycar.utils import compare_to, sign, is_number_type, clamp
 
 logger = logging.getLogger(__name__)
@@ -207,6 +207,89 @@ def bicycle_angular_velocity(wheel_base:float, forward_velocity:float, steering_
     return forward_velocity / wheel_base * math.tan(steering_angle)
 
 
+def _advancing(timestamps:np.ndarray) -> np.ndarray:
+    """
+    Mask of the readings which the kinematics parts integrate, i.e. the
+    first one and those with a timestamp after all previous ones.
+    """
+    valid = np.ones(len(timestamps), dtype=bool)
+    valid[1:] = timestamps[1:] > np.maximum.accumulate(timestamps)[:-1]
+    return valid
+
+
+def _hold(values:np.ndarray, valid:np.ndarray) -> np.ndarray:
+    """
+    Expand the values computed for the valid readings to all readings,
+    repeating the last valid value for the skipped ones.
+    """
+    return values[np.cumsum(valid) - 1]
+
+
+def _integrate_pose(delta_distance:np.ndarray, delta_angle:np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Integrate the changes in distance and orientation between readings
+    into x, y and the unlimited angle, starting at the origin; like the
+    parts, each step moves along the orientation midway through the step.
+    """
+    angle = np.concatenate(([0.0], np.cumsum(delta_angle)))
+    estimated_angle = angle[:-1] + delta_angle / 2
+    x = np.concatenate(([0.0], np.cumsum(delta_distance * np.cos(estimated_angle))))
+    y = np.concatenate(([0.0], np.cumsum(delta_distance * np.sin(estimated_angle))))
+    return x, y, angle
+
+
+def bicycle_poses(wheel_base:float, distances, steering_angles, timestamps) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Batch version of Bicycle.run, i.e. to reconstruct the pose track from
+    the recorded odometry of a tub. Row i of the results are the outputs
+    of Bicycle.run after the first i + 1 readings, except where the part
+    returns zeros: the first row holds the first distance and timestamp,
+    and readings with a timestamp that is not after all previous ones
+    are skipped and hold the previous results.
+    @param wheel_base: distance between the front and back wheels
+    @param distances: distances the reference point has travelled
+    @param steering_angles: steering angles in radians, left is positive
+    @param timestamps: times of the readings in seconds
+    @return tuple of arrays distance, velocity, x, y, angle,
+            x', y', angle' and timestamp
+    """
+    distances = np.asarray(distances, dtype=np.float64)
+    steering_angles = np.asarray(steering_angles, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        return tuple(np.zeros(0) for _ in range(9))
+    valid = _advancing(timestamps)
+    distance = distances[valid]
+    timestamp = timestamps[valid]
+
+    delta_time = np.diff(timestamp)
+    delta_distance = np.diff(distance)
+    delta_angle = delta_distance / wheel_base * np.tan(steering_angles[valid][1:])
+    x, y, angle = _integrate_pose(delta_distance, delta_angle)
+
+    velocity = np.concatenate(([0.0], delta_distance / delta_time))
+    x_velocity = np.concatenate(([0.0], np.diff(x) / delta_time))
+    y_velocity = np.concatenate(([0.0], np.diff(y) / delta_time))
+    angle_velocity = np.concatenate(([0.0], delta_angle / delta_time))
+    angle = np.arctan2(np.sin(angle), np.cos(angle))
+    return tuple(_hold(values, valid) for values in (
+        distance, velocity, x, y, angle,
+        x_velocity, y_velocity, angle_velocity, timestamp))
+
+
+def bicycle_steering_angles(wheel_base:float, forward_velocities, angular_velocities) -> np.ndarray:
+    """
+    Batch version of InverseBicycle.run and bicycle_steering_angle().
+    Steering angles are zero where the forward velocity is zero.
+    """
+    forward_velocities = np.asarray(forward_velocities, dtype=np.float64)
+    turn = np.asarray(angular_velocities, dtype=np.float64) * wheel_base
+    ratio = np.divide(turn, forward_velocities,
+                      out=np.zeros(np.broadcast(turn, forward_velocities).shape),
+                      where=forward_velocities != 0)
+    return np.arctan(ratio)
+
+
 class BicycleNormalizeAngularVelocity:
     """
     For a car-like vehicle, convert an angular velocity in radians per second
@@ -346,6 +429,44 @@ class Unicycle:
         self.running = False
 
 
+def unicycle_poses(axle_length:float, left_distances, right_distances, timestamps) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Batch version of Unicycle.run, see bicycle_poses(); like there,
+    values are held where the part returns zeros.
+    @param axle_length: distance between the two drive wheels
+    @param left_distances: distances the left wheel has travelled
+    @param right_distances: distances the right wheel has travelled
+    @param timestamps: times of the readings in seconds
+    @return tuple of arrays distance, velocity, x, y, angle,
+            x', y', angle' and timestamp
+    """
+    left_distances = np.asarray(left_distances, dtype=np.float64)
+    right_distances = np.asarray(right_distances, dtype=np.float64)
+    timestamps = np.asarray(timestamps, dtype=np.float64)
+    if len(timestamps) == 0:
+        return tuple(np.zeros(0) for _ in range(9))
+    valid = _advancing(timestamps)
+    left = left_distances[valid]
+    right = right_distances[valid]
+    timestamp = timestamps[valid]
+
+    delta_time = np.diff(timestamp)
+    delta_left = np.diff(left)
+    delta_right = np.diff(right)
+    delta_distance = (delta_left + delta_right) / 2
+    delta_angle = (delta_right - delta_left) / axle_length
+    x, y, angle = _integrate_pose(delta_distance, delta_angle)
+
+    velocity = np.concatenate(([0.0], delta_distance / delta_time))
+    x_velocity = np.concatenate(([0.0], np.diff(x) / delta_time))
+    y_velocity = np.concatenate(([0.0], np.diff(y) / delta_time))
+    angle_velocity = np.concatenate(([0.0], delta_angle / delta_time))
+    angle = np.arctan2(np.sin(angle), np.cos(angle))
+    return tuple(_hold(values, valid) for values in (
+        (left + right) / 2, velocity, x, y, angle,
+        x_velocity, y_velocity, angle_velocity, timestamp))
+
+
 class InverseUnicycle:
     """
     Unicycle inverse kinematics that converts forward velocity and 
@@ -46,6 +46,61 @@ def angle_in_bounds(angle, min_angle, max_angle):
         return (min_angle <= angle <= 360) or (max_angle >= angle >= 0)
 
 
+# a lidar measurement, see RPLidar2.poll()
+MEASUREMENT_DTYPE = np.dtype([('distance', np.float64),
+                              ('angle', np.float64),
+                              ('time', np.float64),
+                              ('scan', np.int64),
+                              ('index', np.int64)])
+
+
+class ScanBuffer(object):
+    '''
+    Double buffer of lidar measurements in structured numpy arrays of
+    MEASUREMENT_DTYPE. The measurements of the scan in progress are written
+    to one array, when the scan is complete the arrays are swapped and the
+    completed scan is published as a read only view. The view is replaced
+    by reference, so a reader always gets a whole scan. The array of the
+    published scan is filled again as soon as the next scan is published,
+    so a scan is only valid until then; a reader which keeps a scan any
+    longer must copy it.
+    '''
+    def __init__(self, capacity=2048):
+        self.filling = np.empty(capacity, dtype=MEASUREMENT_DTYPE)
+        self.spare = np.empty(capacity, dtype=MEASUREMENT_DTYPE)
+        self.count = 0
+        self.scan = self.filling[:0]
+        self.scan.flags.writeable = False
+
+    def add(self, distance, angle, time, scan, index):
+        if self.count == len(self.filling):
+            # the published scan may still be read, so grow the filling one
+            grown = np.empty(2 * len(self.filling), dtype=MEASUREMENT_DTYPE)
+            grown[:self.count] = self.filling[:self.count]
+            self.filling = grown
+        self.filling[self.count] = (distance, angle, time, scan, index)
+        self.count += 1
+
+    def clear(self):
+        '''
+        drop the measurements added since the last publish
+        '''
+        self.count = 0
+
+    def publish(self):
+        '''
+        publish the measurements added since the last publish as a scan
+        '''
+        scan = self.filling[:self.count]
+        scan.flags.writeable = False
+        self.filling, self.spare = self.spare, self.filling
+        if len(self.filling) < len(self.spare):
+            self.filling = np.empty(len(self.spare), dtype=MEASUREMENT_DTYPE)
+        self.count = 0
+        self.scan = scan
+        return scan
+
+
 class RPLidar2(object):
     '''
     Adapted from https://github.com/Ezward/rplidar
@@ -96,8 +151,8 @@ class RPLidar2(object):
         self.min_distance = min_distance
         self.max_distance = max_distance
         self.forward_angle = forward_angle
-        self.spin_reverse = (args.angle_direction != CLOCKWISE)
-        self.measurements = [] # list of (distance, angle, time, scan, index) 
+        self.spin_reverse = (angle_direction != CLOCKWISE)
+        self.buffer = ScanBuffer()
 
         from adafruit_rplidar import RPLidar
         import glob
@@ -125,8 +180,6 @@ class RPLidar2(object):
         self.lidar.clear_input()
         time.sleep(1)
 
-        self.measurement_count = 0  # number of measurements in the scan
-        self.measurement_index = 0  # index of next measurement in the scan
         self.full_scan_count = 0
         self.full_scan_index = 0
         self.total_measurements = 0
@@ -148,10 +201,12 @@ class RPLidar2(object):
 
                 # check for start of new scan
                 if new_scan:
+                    if self.full_scan_count > 0:
+                        self.buffer.publish()
+                    else:
+                        self.buffer.clear()  # partial scan before the first
                     self.full_scan_count += 1
                     self.full_scan_index = 0
-                    self.measurement_count = self.measurement_index  # this full scan
-                    self.measurement_index = 0   # start filling in next scan
                     
                 #
                 # rplidar spins clockwise,
@@ -167,8 +222,8 @@ class RPLidar2(object):
                 if angle_in_bounds(angle, self.min_angle, self.max_angle):
                     if distance >= self.min_distance and distance <= self.max_distance:
                         #
-                        # A measurement is a tuple of
-                        #    (angle, distance, time, scan, index).
+                        # A measurement is a row of MEASUREMENT_DTYPE:
+                        #    (distance, angle, time, scan, index).
                         #
                         # distance = distance in millimeters as a float;
                         #            zero indicates invalid measurement
@@ -179,21 +234,11 @@ class RPLidar2(object):
                         # index: index within full scan as an integer
                         #
                         # Note: The scan:index pair represents a natural key
-                        #       identifying the measurement. This driver
-                        #       maintains a circular buffer of measurements
-                        #       that represent the most recent 360 degrees
-                        #       of measurements.  This list may include
-                        #       measurements from the current full scan and
-                        #       from the previous full scan.  So if
-                        #       run_threaded() is called rapidly
-                        #       (faster than the scan rate of the lidar),
-                        #       then the returned scans will have some new
-                        #       values and some values that may have been
-                        #       seen in the previous scan.  The scan:index
-                        #       pair can be used to
-                        #       to 'diff' scans to see which measurements
-                        #       are are 'new' and which measurements are
-                        #       shared between scans.
+                        #       identifying the measurement. The measurements
+                        #       of a full scan are published together when
+                        #       the next scan starts, so run_threaded()
+                        #       returns the same scan until a new one is
+                        #       complete; the scan field tells them apart.
                         #
                         #       The time at which the measurement was
                         #       aquired is also included. In a moving
@@ -205,16 +250,8 @@ class RPLidar2(object):
                         #       kinematic model to adjust for movement
                         #       of the lidar when attached to a vehicle.
                         #
-                        measurement = (distance, angle, now,
+                        self.buffer.add(distance, angle, now,
                                         self.full_scan_count, self.full_scan_index)
-                        
-                        # grow buffer if necessary, otherwise overwrite
-                        if self.measurement_index >= len(self.measurements):
-                            self.measurements.append(measurement)
-                            self.measurement_count = self.measurement_index + 1
-                        else:
-                            self.measurements[self.measurement_index] = measurement  # noqa
-                        self.measurement_index += 1
                         self.full_scan_index += 1
                             
             except serial.serialutil.SerialException:
@@ -235,13 +272,17 @@ class RPLidar2(object):
         logger.info("RPLidar rate = {rate} measurements per second".format(rate=measurement_rate))
 
     def run_threaded(self):
+        '''
+        :return: the last complete scan as a read only structured array
+                 of MEASUREMENT_DTYPE
+        '''
         if self.running:
-            return self.measurements
-        return []
+            return self.buffer.scan
+        return self.buffer.scan[:0]
     
     def run(self):
         if not self.running:
-            return []
+            return self.buffer.scan[:0]
         #
         # poll for 'batch' and return it
         # poll for time provided in constructor
@@ -252,7 +293,7 @@ class RPLidar2(object):
             time.sleep(0)  # yield time to other threads
             if time.time() >= batch_time:
                 break
-        return self.measurements
+        return self.buffer.scan
 
     def shutdown(self):
         self.running = False
@@ -404,65 +445,26 @@ class LidarPlot(object):
         self.max_dist = max_dist
         self.rad = radius_plot
         self.resolution = resolution
-        if plot_type == self.PLOT_TYPE_CIRC:
-            self.plot_fn = self.plot_circ
-        else:
-            self.plot_fn = self.plot_line
-            
-    def plot_line(self, img, dist, theta, max_dist, draw):
-        '''
-        scale dist so that max_dist is edge of img (mm)
-        and img is PIL Image, draw the line using the draw ImageDraw object
-        '''
-        center = (img.width / 2, img.height / 2)
-        max_pixel = min(center[0], center[1])
-        dist = dist / max_dist * max_pixel
-        if dist < 0 :
-            dist = 0
-        elif dist > max_pixel:
-            dist = max_pixel
-        theta = np.radians(theta)
-        sx = math.cos(theta) * dist + center[0]
-        sy = math.sin(theta) * dist + center[1]
-        ex = math.cos(theta) * (dist + self.rad) + center[0]
-        ey = math.sin(theta) * (dist + self.rad) + center[1]
-        fill = 128
-        draw.line((sx,sy, ex, ey), fill=(fill, fill, fill), width=1)
-        
-    def plot_circ(self, img, dist, theta, max_dist, draw):
-        '''
-        scale dist so that max_dist is edge of img (mm)
-        and img is PIL Image, draw the circle using the draw ImageDraw object
-        '''
-        center = (img.width / 2, img.height / 2)
-        max_pixel = min(center[0], center[1])
-        dist = dist / max_dist * max_pixel
-        if dist < 0 :
-            dist = 0
-        elif dist > max_pixel:
-            dist = max_pixel
-        theta = np.radians(theta)
-        sx = int(math.cos(theta) * dist + center[0])
-        sy = int(math.sin(theta) * dist + center[1])
-        ex = int(math.cos(theta) * (dist + 2 * self.rad) + center[0])
-        ey = int(math.sin(theta) * (dist + 2 * self.rad) + center[1])
-        fill = 128
-
-        draw.ellipse((min(sx, ex), min(sy, ey), max(sx, ex), max(sy, ey)),
-                     fill=(fill, fill, fill))
-
-    def plot_scan(self, img, distances, angles, max_dist, draw):
-        for dist, angle in zip(distances, angles):
-            self.plot_fn(img, dist, angle, max_dist, draw)
-            
+        # angles increase clockwise on the image, distances beyond
+        # max_dist are drawn at the edge
+        self.renderer = PolarRenderer(
+            resolution, max_dist, mark_px=radius_plot,
+            mark=PolarRenderer.MARK_CIRCLE if plot_type == self.PLOT_TYPE_CIRC
+            else PolarRenderer.MARK_LINE,
+            angle_direction=CLOCKWISE, point_color=(128, 128, 128),
+            clip_distance=True)
+
+    def plot_scan(self, img, distances, angles, max_dist, draw=None):
+        self.renderer.max_distance = max_dist
+        return self.renderer.render(distances, angles)
+
     def run(self, distances, angles):
         '''
         takes two lists of equal length, one of distance values,
         the other of angles corresponding to the dist meas 
         '''
-        self.frame = Image.new('RGB', self.resolution, (255, 255, 255))
-        draw = ImageDraw.Draw(self.frame)
-        self.plot_scan(self.frame, distances, angles, self.max_dist, draw)
+        self.renderer.max_distance = self.max_dist
+        self.frame = self.renderer.image(distances, angles)
         return self.frame
 
     def shutdown(self):
@@ -640,6 +642,174 @@ def plot_polar_angle(draw_context, bounds, color, theta,
     draw_context.line((cx, cy, sx, sy), fill=color, width=1)
 
 
+def measurement_columns(measurements):
+    '''
+    distances, angles and times of measurements as numpy arrays, from a
+    structured array with distance, angle and time fields or a sequence of
+    (distance, angle, time, ...) rows; times is None if not given.
+    '''
+    if isinstance(measurements, np.ndarray) and measurements.dtype.names:
+        times = measurements['time'] if 'time' in measurements.dtype.names \
+            else None
+        return measurements['distance'], measurements['angle'], times
+    rows = np.asarray(measurements, dtype=np.float64)
+    if rows.size == 0:
+        return np.empty(0), np.empty(0), None
+    rows = rows.reshape(len(rows), -1)
+    return rows[:, 0], rows[:, 1], rows[:, 2] if rows.shape[1] > 2 else None
+
+
+class PolarRenderer(object):
+    '''
+    Draws whole lidar scans into a reused uint8 RGBX buffer. The pixel
+    coordinates of all measurements are computed with numpy at once and
+    the marks are stamped by fancy indexing, in place of drawing each
+    measurement with PIL.
+
+    The polar origin is the center of the image and max_distance is at the
+    nearest image edge. Measurements beyond max_distance are skipped or,
+    with clip_distance, drawn at the edge. A circle mark is a disc of radius
+    mark_px just beyond the measured distance, a line mark a radial line of
+    mark_px. With fade_seconds, measurements stay on the image and fade
+    out over that many seconds, by the time of the measurements.
+    '''
+    MARK_LINE = 0
+    MARK_CIRCLE = 1
+
+    def __init__(self, resolution=(500, 500), max_distance=4000,
+                 mark_px=3, mark=MARK_CIRCLE,
+                 angle_direction=COUNTER_CLOCKWISE, rotate_plot=0,
+                 background=(255, 255, 255), point_color=(255, 64, 64),
+                 clip_distance=False, fade_seconds=None):
+        width, height = resolution
+        self.max_distance = max_distance
+        self.angle_direction = angle_direction
+        self.rotate_plot = rotate_plot
+        self.clip_distance = clip_distance
+        self.fade_seconds = fade_seconds
+        self.point_color = np.array(point_color, dtype=np.uint8)
+        self.cx = width / 2
+        self.cy = height / 2
+        self.max_pixel = min(self.cx, self.cy)
+        self.mark_px = mark_px
+        if mark == self.MARK_CIRCLE:
+            # disc offsets around the center of the mark
+            r = np.arange(-mark_px, mark_px + 1)
+            dy, dx = np.meshgrid(r, r, indexing='ij')
+            inside = dx ** 2 + dy ** 2 <= mark_px ** 2
+            offsets = dy[inside], dx[inside]
+            self.radial = np.array([float(mark_px)])
+        else:
+            offsets = np.zeros(1, dtype=int), np.zeros(1, dtype=int)
+            self.radial = np.arange(mark_px + 1, dtype=np.float64)
+        self.resolution = resolution
+        self.buffer = np.full((height, width, 4), 255, dtype=np.uint8)
+        self.buffer[..., :3] = background
+        self.background = self.buffer.copy()
+        # a pixel as one uint32
+        self.buffer_pixels = self.buffer.view(np.uint32)[..., 0]
+        point = np.append(self.point_color, np.uint8(255))
+        self.point_pixel = point.view(np.uint32)[0]
+        # marks are drawn into a canvas with a border, so that only the
+        # centers of the marks need to be checked against the bounds
+        self.pad = 2 * mark_px + 1
+        self.padded_width = width + 2 * self.pad
+        self.offsets = offsets[0] * self.padded_width + offsets[1]
+        shape = (height + 2 * self.pad, self.padded_width)
+        self.canvas = np.zeros(shape, dtype=np.uint32)
+        self.canvas_view = self.canvas[self.pad:-self.pad, self.pad:-self.pad]
+        self.background_canvas = np.zeros(shape, dtype=np.uint32)
+        self.background_canvas[self.pad:-self.pad, self.pad:-self.pad] = \
+            self.background.view(np.uint32)[..., 0]
+        if fade_seconds:
+            self.weight = np.zeros(shape, dtype=np.float32)
+            self.weight_view = self.weight[self.pad:-self.pad, self.pad:-self.pad]
+            self.color_delta = point.astype(np.float32) - self.background
+            self.scratch = np.empty(self.buffer.shape, dtype=np.float32)
+            self.last_time = None
+
+    def pixels(self, distances, angles):
+        '''
+        :return: flat indices into the padded canvas of all pixels of the
+                 marks, and the index of the measurement of each
+        '''
+        distances = np.asarray(distances, dtype=np.float64)
+        angles = np.asarray(angles, dtype=np.float64)
+        if self.clip_distance:
+            keep = np.arange(len(distances))
+            distances = np.clip(distances, 0, self.max_distance)
+        else:
+            keep = np.flatnonzero((distances >= 0)
+                                  & (distances <= self.max_distance))
+            distances = distances[keep]
+            angles = angles[keep]
+        theta = (angles + self.rotate_plot) % 360.0
+        if self.angle_direction != COUNTER_CLOCKWISE:
+            theta = (360.0 - theta) % 360.0
+        theta = np.radians(theta)
+        distance_px = distances / self.max_distance * self.max_pixel
+        # mark centers along the radial part of the mark
+        radius = distance_px[:, np.newaxis] + self.radial
+        x = np.rint(self.cx + np.cos(theta)[:, np.newaxis] * radius).astype(int)
+        y = np.rint(self.cy - np.sin(theta)[:, np.newaxis] * radius).astype(int)
+        height, width = self.buffer.shape[:2]
+        # centers further out than this have no pixel on the image
+        margin = self.mark_px + 1
+        inside = (x >= -margin) & (x < width + margin) \
+            & (y >= -margin) & (y < height + margin)
+        centers = (y[inside] + self.pad) * self.padded_width + x[inside] + self.pad
+        index = np.broadcast_to(keep[:, np.newaxis], x.shape)[inside]
+        flat = (centers[:, np.newaxis] + self.offsets).ravel()
+        return flat, np.repeat(index, len(self.offsets))
+
+    def render(self, distances, angles, times=None):
+        '''
+        :return: the buffer with the measurements drawn, which is
+                 overwritten by the next call
+        '''
+        flat, index = self.pixels(distances, angles)
+        if not self.fade_seconds:
+            np.copyto(self.canvas, self.background_canvas)
+            self.canvas.ravel()[flat] = self.point_pixel
+            np.copyto(self.buffer_pixels, self.canvas_view)
+            return self.buffer
+
+        now = None
+        if times is not None and len(times):
+            now = float(np.max(times))
+        elif self.last_time is not None:
+            now = self.last_time
+        if now is not None and self.last_time is not None:
+            self.weight -= max(now - self.last_time, 0.) / self.fade_seconds
+            np.clip(self.weight, 0., 1., out=self.weight)
+        self.last_time = now
+        if times is None:
+            weight = np.ones(len(flat), dtype=np.float32)
+        else:
+            age = now - np.asarray(times, dtype=np.float64)[index]
+            weight = np.clip(1. - age / self.fade_seconds, 0., 1.)
+        weights = self.weight.ravel()
+        weight = np.maximum(weights[flat], weight)
+        # where marks overlap the largest weight is written last
+        order = np.argsort(weight, kind='stable')
+        weights[flat[order]] = weight[order]
+
+        # blend point color over the background by the weight
+        np.multiply(self.color_delta, self.weight_view[..., np.newaxis],
+                    out=self.scratch)
+        np.add(self.scratch, self.background, out=self.scratch)
+        np.copyto(self.buffer, self.scratch, casting='unsafe')
+        return self.buffer
+
+    def image(self, distances, angles, times=None):
+        '''
+        :return: the measurements drawn on a PIL RGB image
+        '''
+        self.render(distances, angles, times)
+        return Image.frombytes('RGB', self.resolution, self.buffer,
+                               'raw', 'RGBX')
+
+
 class LidarPlot2(object):
     '''
     takes the lidar measurements as a list of (distance, angle) tuples
@@ -666,7 +836,8 @@ class LidarPlot2(object):
                  rotate_plot=0,
                  background_color=(224, 224, 224),
                  border_color=(128, 128, 128),
-                 point_color=(255, 64, 64)):
+                 point_color=(255, 64, 64),
+                 fade_seconds=None):
         
         self.frame = Image.new('RGB', resolution)
         self.mark_px = mark_px
@@ -683,37 +854,123 @@ class LidarPlot2(object):
         self.border_color = border_color
         self.point_color = point_color
 
-    def run(self, measurements):
-        '''
-        draw measurements to a PIL image and output the pil image
-        measurements: list of polar coordinates as (distance, angle) tuples
-        '''
-            
-        self.frame = Image.new('RGB', self.resolution, (255, 255, 255))
-        bounds = (0, 0, self.frame.width, self.frame.height)
-        draw = ImageDraw.Draw(self.frame)
-        
-        # background
-        draw.rectangle(bounds, fill=self.background_color)
-
-        # bounding perimeter and zero heading
+        # background, bounding perimeter and zero heading are drawn once
+        background = Image.new('RGB', resolution, background_color)
+        bounds = (0, 0, background.width, background.height)
+        draw = ImageDraw.Draw(background)
         plot_polar_bounds(draw, bounds, self.border_color,
                           self.angle_direction, self.rotate_plot)
         plot_polar_angle(draw, bounds, self.border_color, 0,
                          self.angle_direction, self.rotate_plot)
-        
-        # data points
-        plot_polar_points(
-            draw, bounds, self.mark_fn, self.point_color, self.mark_px,
-            [(distance, angle) for distance, angle, _, _, _ in measurements],
-            self.max_distance, self.angle_direction, self.rotate_plot)
-        
+        self.renderer = PolarRenderer(
+            resolution, max_dist, mark_px,
+            PolarRenderer.MARK_CIRCLE if plot_type == self.PLOT_TYPE_CIRCLE
+            else PolarRenderer.MARK_LINE,
+            angle_direction, rotate_plot, np.asarray(background),
+            point_color, fade_seconds=fade_seconds)
+
+    def run(self, measurements):
+        '''
+        draw measurements to a PIL image and output the pil image
+        measurements: (distance, angle, time, scan, index) measurements,
+                      as a list of tuples or a structured array
+        '''
+        self.frame = self.renderer.image(*measurement_columns(measurements))
         return self.frame
 
     def shutdown(self):
         pass
 
 
+class LidarSectors(object):
+    '''
+    Summarises a lidar scan into num_sectors equal angular sectors as a
+    cheap safety layer. Sector 0 is centered on angle 0, i.e. forward for
+    RPLidar2, and sectors follow the direction of increasing angles. For
+    each sector the given percentile of the valid distances is taken, 0 for
+    the nearest measurement; sectors without measurements are at infinity.
+
+    The outputs are the sector distances, an occupancy vector of the sectors
+    nearer than occupied_distance, the time to collision in seconds in the
+    direction of travel and an emergency stop flag. The time to collision
+    uses the nearest sector within front_width degrees around forward, or
+    around backward when the speed is negative. The stop flag is set if that
+    sector is nearer than stop_distance or the time to collision is below
+    stop_ttc. Distances are in the unit of the lidar, distance_scale
+    converts them to the meters of the speed.
+    '''
+    def __init__(self, num_sectors=16, percentile=0,
+                 occupied_distance=1000, stop_distance=300, stop_ttc=0.5,
+                 front_width=60, distance_scale=0.001):
+        self.num_sectors = num_sectors
+        self.sector_width = 360.0 / num_sectors
+        self.percentile = percentile
+        self.occupied_distance = occupied_distance
+        self.stop_distance = stop_distance
+        self.stop_ttc = stop_ttc
+        self.distance_scale = distance_scale
+        # sectors overlapping the cone around forward and backward
+        centers = np.arange(num_sectors) * self.sector_width
+        offset = np.abs((centers + 180.0) % 360.0 - 180.0)
+        half = (front_width + self.sector_width) / 2
+        self.front = np.flatnonzero(offset < half)
+        self.back = np.flatnonzero(180.0 - offset < half)
+        self.sectors = np.full(num_sectors, np.inf)
+
+    def summarise(self, distances, angles):
+        '''
+        :return: the percentile distance of each sector
+        '''
+        distances = np.asarray(distances, dtype=np.float64)
+        angles = np.asarray(angles, dtype=np.float64)
+        valid = distances > 0
+        distances = distances[valid]
+        sector = ((angles[valid] + self.sector_width / 2) % 360.0
+                  // self.sector_width).astype(np.intp)
+        # guard against rounding up to 360 degrees
+        np.minimum(sector, self.num_sectors - 1, out=sector)
+        self.sectors.fill(np.inf)
+        if len(distances) == 0:
+            return self.sectors
+        if self.percentile == 0:
+            np.minimum.at(self.sectors, sector, distances)
+            return self.sectors
+        # sorted by sector then distance, the percentile of a sector is the
+        # element at its rank after the start of the sector
+        order = np.lexsort((distances, sector))
+        counts = np.bincount(sector, minlength=self.num_sectors)
+        starts = np.cumsum(counts) - counts
+        present = counts > 0
+        rank = np.floor(self.percentile / 100.0
+                        * (counts[present] - 1)).astype(np.intp)
+        self.sectors[present] = distances[order[starts[present] + rank]]
+        return self.sectors
+
+    def run(self, scan, speed=None):
+        '''
+        :param scan: measurements as structured array of MEASUREMENT_DTYPE
+                     or rows of (distance, angle, ...)
+        :param speed: forward speed in meters per second, i.e. enc/vel_m_s
+        :return: sector distances, occupied sectors, time to collision and
+                 emergency stop flag
+        '''
+        if scan is None:
+            scan = ()
+        distances, angles, _ = measurement_columns(scan)
+        sectors = self.summarise(distances, angles)
+        occupied = sectors < self.occupied_distance
+        ahead = self.back if speed is not None and speed < 0 else self.front
+        nearest = sectors[ahead].min() if len(ahead) else np.inf
+        ttc = np.inf
+        if speed:
+            ttc = nearest * self.distance_scale / abs(speed)
+        stop = bool(nearest < self.stop_distance or ttc < self.stop_ttc)
+        return sectors.copy(), occupied, float(ttc), stop
+
+    def shutdown(self):
+        pass
+
+
 class BreezySLAM(object):
     '''
     https://github.com/simondlevy/BreezySLAM
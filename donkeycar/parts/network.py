@@ -1,73 +1,91 @@
+import errno
+import select
 import socket
-import zlib, pickle
 import zmq
 import time
 
+from donkeycar.parts.codec import decode, encode, message_length
+
 class ZMQValuePub(object):
     '''
-    Use Zero Message Queue (zmq) to publish values
+    Use Zero Message Queue (zmq) to publish values. A value is sent as a
+    multipart message of the name as topic, the encoded value and a frame
+    for each large array or bytes value, i.e. an image. zmq copies the
+    frames before sending returns, so the camera can reuse the buffer of
+    an image right after, but the image is not copied into the message.
     '''
     def __init__(self, name, port = 5556, hwm=10):
-        context = zmq.Context()
+        self.context = zmq.Context()
         self.name = name
-        self.socket = context.socket(zmq.PUB)
+        self.topic = name.encode('utf-8')
+        self.socket = self.context.socket(zmq.PUB)
         self.socket.set_hwm(hwm)
         self.socket.bind("tcp://*:%d" % port)
     
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
-        self.socket.send(z)
+        frames = []
+        message = encode(self.name, values, frames=frames)
+        self.socket.send_multipart([self.topic, message] + frames)
 
     def shutdown(self):
         print("shutting down zmq")
-        #self.socket.close()
-        context = zmq.Context()
-        context.destroy()
+        self.socket.close(linger=0)
+        self.context.term()
 
 class ZMQValueSub(object):
     '''
-    Use Zero Message Queue (zmq) to subscribe to value messages from a remote publisher
+    Use Zero Message Queue (zmq) to subscribe to value messages from a remote publisher.
+    Each run reads all messages which arrived and returns the newest one, so
+    a subscriber which is slower than the publisher doesn't fall behind.
+    This replaces the zmq CONFLATE option, which can't be used with
+    multipart messages. Arrays are returned as read only views of the
+    received frames.
     '''
     def __init__(self, name, ip, port = 5556, hwm=10, return_last=True):
-        context = zmq.Context()
-        self.socket = context.socket(zmq.SUB)
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.SUB)
         self.socket.set_hwm(hwm)
         self.socket.connect("tcp://%s:%d" % (ip, port))
-        self.socket.setsockopt_string(zmq.SUBSCRIBE, '')
+        self.socket.setsockopt(zmq.SUBSCRIBE, name.encode('utf-8'))
         self.name = name
         self.return_last = return_last
         self.last = None
+        self.dropped = 0
 
     def run(self):
         '''
         poll socket for input. returns None when nothing was recieved
         otherwize returns packet data
         '''
-        try:
-            z = self.socket.recv(flags=zmq.NOBLOCK)
-        except zmq.Again as e:
+        frames = None
+        while True:
+            try:
+                newer = self.socket.recv_multipart(flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again as e:
+                break
+            if frames is not None:
+                self.dropped += 1
+            frames = newer
+
+        if frames is None:
             if self.return_last:
                 return self.last
             return None
 
-        #print("got", len(z), "bytes")
-        p = zlib.decompress(z)
-        obj = pickle.loads(p)
+        name, val = decode(frames[1].buffer, frames[2:])
 
-        if self.name == obj['name']:
-            self.last = obj['val'] 
-            return obj['val']
+        # the topic only filters by prefix
+        if self.name == name:
+            self.last = val
+            return val
 
         if self.return_last:
             return self.last
         return None
 
     def shutdown(self):
-        self.socket.close()
-        context = zmq.Context()
-        context.destroy()
+        self.socket.close(linger=0)
+        self.context.term()
 
 class UDPValuePub(object):
     '''
@@ -82,9 +100,7 @@ class UDPValuePub(object):
         self.sock.bind(("", 44444))
 
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
+        z = encode(self.name, values)
         #print("broadcast", len(z), "bytes to port", self.port)
         self.sock.sendto(z, ('<broadcast>', self.port))
 
@@ -119,188 +135,317 @@ class UDPValueSub(object):
         data, addr = self.client.recvfrom(1024 * 65)
         #print("got", len(data), "bytes")
         if len(data) > 0:
-            p = zlib.decompress(data)
-            obj = pickle.loads(p)
+            name, val = decode(data)
 
-            if self.name == obj['name']:
-                self.last = obj['val']
+            if self.name == name:
+                self.last = val
 
 
     def shutdown(self):
         self.running = False
         self.client.close()
 
-import select
+import selectors
+from threading import Thread, Lock
+
+
+class _TCPValueClient(object):
+    '''
+    Send state of a client of TCPServeValue: the message being sent and the
+    newest message to send next
+    '''
+    def __init__(self, sock):
+        self.sock = sock
+        self.sending = None
+        self.next = None
+
 
 class TCPServeValue(object):
     '''
-    Use tcp to serve values on local network
+    Use tcp to serve values on local network.
+    The sockets are served by a selector in a thread of the part, so run
+    only hands over the value and never blocks the vehicle loop. A value is
+    encoded once for all clients. Each client gets the newest value when it
+    finished receiving the previous one, values which are replaced before a
+    slow client could take them are dropped for that client.
     '''
     def __init__(self, name, port = 3233):
         self.name = name
         self.port = port
         self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
         self.sock.setblocking(False)
         self.sock.bind(("0.0.0.0", port))
         self.sock.listen(3)
         print("serving value:", name, "on port:", port)
-        self.clients = []
-
-    def send(self, sock, msg):
-        try:
-            sock.sendall(msg)
-        except ConnectionResetError:
-            print("client dropped connection")
-            self.clients.remove(sock)
-
-        #print("sent", len(msg), "bytes")
+        self.clients = {}
+        self.dropped = 0
+        # the vehicle loop wakes the selector through this socket pair
+        self.wake_recv, self.wake_send = socket.socketpair()
+        self.wake_recv.setblocking(False)
+        self.wake_send.setblocking(False)
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(self.sock, selectors.EVENT_READ)
+        self.selector.register(self.wake_recv, selectors.EVENT_READ)
+        self.lock = Lock()
+        self.value = None
+        self.new_value = False
+        self.running = True
+        self.thread = Thread(target=self.serve, daemon=True)
+        self.thread.start()
 
     def run(self, values):
-        timeout = 0.05
-        ready_to_read, ready_to_write, in_error = \
-               select.select(
-                  [self.sock],
-                  self.clients,
-                  [],
-                  timeout)
-            
-        if len(ready_to_write) > 0:
-            packet = { "name": self.name, "val" : values }
-            p = pickle.dumps(packet)
-            z = zlib.compress(p)
-            for client in ready_to_write:
-                try:
-                    self.send(client, z)
-                except BrokenPipeError or ConnectionResetError:
-                    print("client dropped connection")
-                    self.clients.remove(client)
-        
-        if self.sock in ready_to_read:
-            client, addr = self.sock.accept()
-            print("got connection from", addr)
-            self.clients.append(client)
+        with self.lock:
+            self.value = values
+            self.new_value = True
+        try:
+            self.wake_send.send(b'x')
+        except (BlockingIOError, OSError):
+            # already woken up and not yet served
+            pass
 
-        if len(in_error) > 0:
-            print("clients gone")
-            for sock in in_error:
-                self.clients.remove(sock)
+    def serve(self):
+        while self.running:
+            for key, mask in self.selector.select(timeout=0.5):
+                if key.fileobj is self.sock:
+                    self.accept()
+                elif key.fileobj is self.wake_recv:
+                    self.wake_up()
+                else:
+                    client = key.data
+                    if mask & selectors.EVENT_READ:
+                        self.receive(client)
+                    if mask & selectors.EVENT_WRITE and client.sock in self.clients:
+                        self.send(client)
+
+    def accept(self):
+        try:
+            sock, addr = self.sock.accept()
+        except BlockingIOError:
+            return
+        print("got connection from", addr)
+        sock.setblocking(False)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        client = _TCPValueClient(sock)
+        self.clients[sock] = client
+        self.selector.register(sock, selectors.EVENT_READ, client)
+
+    def wake_up(self):
+        try:
+            while self.wake_recv.recv(1024):
+                pass
+        except BlockingIOError:
+            pass
+        with self.lock:
+            if not self.new_value:
+                return
+            values = self.value
+            self.new_value = False
+        if not self.clients:
+            return
+        message = encode(self.name, values)
+        for client in self.clients.values():
+            if client.next is not None:
+                self.dropped += 1
+            client.next = message
+            self.selector.modify(client.sock, selectors.EVENT_READ | selectors.EVENT_WRITE, client)
+
+    def receive(self, client):
+        # clients don't send anything, reading detects a closed connection
+        try:
+            data = client.sock.recv(1024)
+        except BlockingIOError:
+            return
+        except OSError:
+            data = b''
+        if not data:
+            self.close(client)
+
+    def send(self, client):
+        if client.sending is None:
+            client.sending = memoryview(client.next)
+            client.next = None
+        try:
+            sent = client.sock.send(client.sending)
+        except BlockingIOError:
+            return
+        except OSError:
+            self.close(client)
+            return
+        client.sending = client.sending[sent:]
+        if len(client.sending) == 0:
+            client.sending = None
+            if client.next is None:
+                self.selector.modify(client.sock, selectors.EVENT_READ, client)
+
+    def close(self, client):
+        print("client dropped connection")
+        self.selector.unregister(client.sock)
+        del self.clients[client.sock]
+        client.sock.close()
 
     def shutdown(self):
+        self.running = False
+        try:
+            self.wake_send.send(b'x')
+        except (BlockingIOError, OSError):
+            # already woken up, the serving thread stops within its timeout
+            pass
+        self.thread.join()
+        for client in list(self.clients.values()):
+            self.close(client)
+        self.selector.close()
+        self.wake_recv.close()
+        self.wake_send.close()
         self.sock.close()
 
 
 class TCPClientValue(object):
     '''
-    Use tcp to get values on local network
+    Use tcp to get values on local network.
+    run does not wait for data, it reads what arrived and returns the newest
+    complete value, or None if there is none. A partly received value is
+    kept for the next run. Connecting does not wait for the server either,
+    run checks whether the connection was established.
     '''
     def __init__(self, name, host, port=3233):
         self.name = name
         self.port = port
         self.addr = (host, port)
         self.sock = None
+        self.connecting = False
+        self.buffer = bytearray()
+        self.last_connect = 0
+        self.retry_interval = 3.0
         self.connect()
         self.timeout = 0.05
         self.lastread = time.time()
 
     def connect(self):
+        '''
+        start connecting without waiting for the server
+        :return: True if connected, False if still connecting or failed
+        '''
+        self.last_connect = time.time()
         print("attempting connect to", self.addr)
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.sock.setblocking(False)
+        self.connecting = True
         try:
-            self.sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-            self.sock.connect(self.addr)
-        except ConnectionRefusedError:
-            print('server down')
-            time.sleep(3.0)
-            self.sock = None
+            error = self.sock.connect_ex(self.addr)
+        except OSError as e:
+            error = e.errno
+        if error not in (0, errno.EINPROGRESS, errno.EWOULDBLOCK):
+            self.connect_failed()
+            return False
+        return self.finish_connect()
+
+    def finish_connect(self):
+        '''
+        :return: True if the connection was established
+        '''
+        _, writable, _ = select.select([], [self.sock], [], 0)
+        if not writable:
+            if time.time() - self.last_connect > self.retry_interval:
+                self.connect_failed()
+            return False
+        if self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR):
+            self.connect_failed()
             return False
         print("connected!")
-        self.sock.setblocking(False)
+        self.connecting = False
+        self.buffer = bytearray()
+        self.lastread = time.time()
         return True
 
+    def connect_failed(self):
+        print('server down')
+        self.sock.close()
+        self.sock = None
+        self.connecting = False
+
     def is_connected(self):
-        return self.sock is not None
+        return self.sock is not None and not self.connecting
 
     def read(self, sock):
-        data = self.sock.recv(64 * 1024)
-
-        ready_to_read, ready_to_write, in_error = \
-        select.select(
-            [self.sock],
-            [],
-            [],
-            self.timeout)
-
-        while len(ready_to_read) == 1:
-            more_data = self.sock.recv(64 * 1024)
-            if len(more_data) == 0:
-                break
-            data = data + more_data
-
-            ready_to_read, ready_to_write, in_error = \
-            select.select(
-                [self.sock],
-                [],
-                [],
-                self.timeout)
-
-        return data
+        '''
+        read all data available without waiting
+        :return: False if the server closed the connection
+        '''
+        while True:
+            try:
+                data = sock.recv(64 * 1024)
+            except BlockingIOError:
+                return True
+            if len(data) == 0:
+                return False
+            self.buffer += data
+
+    def next_messages(self):
+        '''
+        :return: the complete messages in the buffer, which are removed
+        '''
+        messages = []
+        data = memoryview(self.buffer)
+        offset = 0
+        length = message_length(data)
+        while length and len(data) >= offset + length:
+            messages.append(bytes(data[offset:offset + length]))
+            offset += length
+            length = message_length(data[offset:])
+        data.release()
+        del self.buffer[:offset]
+        return messages
 
     def reset(self):
         self.sock.close()
         self.sock = None
+        self.connecting = False
+        self.buffer = bytearray()
         self.lastread = time.time()
-            
- 
+
     def run(self):
 
-        time_since_last_read = abs(time.time() - self.lastread)
-        
         if self.sock is None:
-            if not self.connect():
+            if time.time() - self.last_connect < self.retry_interval \
+                    or not self.connect():
                 return None
-        elif time_since_last_read > 5.0: 
+        elif self.connecting:
+            if not self.finish_connect():
+                return None
+        elif abs(time.time() - self.lastread) > 5.0:
             print("error: no data from server. may have died")
             self.reset()
             return None
 
-        ready_to_read, ready_to_write, in_error = \
-               select.select(
-                  [self.sock],
-                  [self.sock],
-                  [],
-                  self.timeout)
-
-        if len(in_error) > 0:
+        try:
+            connected = self.read(self.sock)
+            messages = self.next_messages()
+        except Exception as e:
+            print(e)
             print("error: server may have died")
             self.reset()
             return None
 
-        if len(ready_to_read) == 1:
-            try:
-                data = self.read(self.sock)
-                #print("got", len(data), "bytes")
-                self.lastread = time.time()
-                p = zlib.decompress(data)
-                obj = pickle.loads(p)
-            except Exception as e:
-                print(e)
-                print("error: server may have died")
-                self.reset()
-                return None
-
-            if self.name == obj['name']:
-                self.last = obj['val'] 
-                return obj['val']
-
-        if len(in_error) > 0:
+        if not connected:
             print("connection closed")
             self.reset()
 
+        if not messages:
+            return None
+
+        self.lastread = time.time()
+        # only the newest value matters
+        name, val = decode(messages[-1])
+        if self.name == name:
+            self.last = val
+            return val
+
         return None
 
     def shutdown(self):
-        self.sock.close()
+        if self.sock is not None:
+            self.sock.close()
 
 class MQTTValuePub(object):
     '''
@@ -319,10 +464,7 @@ class MQTTValuePub(object):
         print("connected.")
 
     def run(self, values):
-        packet = { "name": self.name, "val" : values }
-        p = pickle.dumps(packet)
-        z = zlib.compress(p)
-        self.client.publish(self.name, z)
+        self.client.publish(self.name, encode(self.name, values))
 
     def shutdown(self):
         self.client.disconnect()
@@ -355,13 +497,12 @@ class MQTTValueSub(object):
         if self.data is None:
             return self.def_value
 
-        p = zlib.decompress(self.data)
-        obj = pickle.loads(p)
+        name, val = decode(self.data)
 
-        if self.name == obj['name']:
-            self.last = obj['val']
-            #print("steering, throttle", obj['val'])
-            return obj['val']
+        if self.name == name:
+            self.last = val
+            #print("steering, throttle", val)
+            return val
             
         return self.def_value
 
@@ -464,7 +605,6 @@ def test_mqtt_pub_sub(ip):
             time.sleep(0.1)
 
 if __name__ == "__main__":
-    import time
     import sys
 
     #usage:
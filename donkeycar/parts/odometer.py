@@ -1,7 +1,8 @@
 import time
+from collections import deque
 from typing import Tuple
 
-from donkeycar.utilities.circular_buffer import CircularBuffer
+from donkeycar.parts.tachometer import TachometerMode, sign
 
 
 class Odometer:
@@ -15,7 +16,7 @@ class Odometer:
         self.timestamp:float = 0
         self.revolutions:float = 0
         self.running:bool = True
-        self.queue = CircularBuffer(smoothing_count if smoothing_count >= 1 else 1)
+        self.queue = deque(maxlen=smoothing_count if smoothing_count >= 1 else 1)
         self.debug = debug
         self.reading = (0, 0, None) # distance, velocity, timestamp
 
@@ -27,17 +28,15 @@ class Odometer:
 
             # smooth velocity
             velocity = 0
-            if self.queue.count > 0:
-                lastDistance, lastVelocity, lastTimestamp = self.queue.tail()
+            if len(self.queue) > 0:
+                lastDistance, lastVelocity, lastTimestamp = self.queue[-1]
                 if timestamp > lastTimestamp:
                     velocity = (distance - lastDistance) / (timestamp - lastTimestamp)
-            self.queue.enqueue((distance, velocity, timestamp))
+            self.queue.append((distance, velocity, timestamp))
 
             #
             # Assignment in Python is atomic and so it is threadsafe
             #
-	    print(f"DEBUG: Odometer Velocity: {velocity}")
-
             self.reading = (distance, velocity, timestamp)
 
     def update(self):
@@ -63,3 +62,52 @@ class Odometer:
 
     def shutdown(self):
         self.running = False
+
+
+class InterpolatingOdometer:
+    """
+    Distance and velocity of an encoder which stores its readings in a
+    TickBuffer, like ContinuousSerialEncoder, evaluated at the timestamp
+    of the drive loop instead of at the last reading. The distance is
+    interpolated between the readings and the velocity is the least
+    squares fit over the readings of the last window_secs, so it is
+    smoother than the difference of the last two readings.
+    The throttle sets the direction of the ticks like for the Tachometer.
+    """
+    def __init__(self, encoder, distance_per_tick:float, window_secs:float=0.1,
+                 encoder_index:int=0,
+                 direction_mode=TachometerMode.FORWARD_ONLY, debug=False):
+        self.encoder = encoder
+        self.distance_per_tick = distance_per_tick
+        self.window_secs = window_secs
+        self.encoder_index = encoder_index
+        self.direction_mode = direction_mode
+        self.direction = 1
+        self.debug = debug
+        self.buffer = encoder.buffer(encoder_index)
+        self.encoder.start_ticks()
+        self.running = True
+
+    def run(self, throttle:float=None, timestamp:float=None) -> Tuple[float, float, float]:
+        """
+        return: (distance, velocity, timestamp)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if not self.running:
+            return 0, 0, timestamp
+        if throttle is not None:
+            if TachometerMode.FORWARD_REVERSE == self.direction_mode:
+                # if throttle is zero, leave direction alone to model 'coasting'
+                if throttle != 0:
+                    self.direction = sign(throttle)
+            elif TachometerMode.FORWARD_REVERSE_STOP == self.direction_mode:
+                self.direction = sign(throttle)
+            self.encoder.poll_ticks(self.direction)
+        ticks, ticks_per_second = self.buffer.ticks_at(timestamp, self.window_secs)
+        return (ticks * self.distance_per_tick,
+                ticks_per_second * self.distance_per_tick, timestamp)
+
+    def shutdown(self):
+        self.running = False
+        self.encoder.stop_ticks()
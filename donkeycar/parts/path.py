@@ -1,39 +1,149 @@
 import pickle
 import math
 import logging
+import time
 
 import numpy
 from PIL import Image, ImageDraw
 
 from donkeycar.utils import norm_deg, dist, deg2rad, arr_to_img
 
+logger = logging.getLogger(__name__)
+
 
 class Path(object):
-    def __init__(self, min_dist = 1.):
-        self.path = []
+    '''
+    Records the path of the car as points at least min_dist apart. The
+    points are kept in a numpy array which grows by doubling, with the
+    columns x, y, timestamp and speed, which is nan if not given. run
+    returns the x, y columns of the recorded points as an n x 2 array, which
+    stays the same object as long as no point is added.
+    '''
+    COLUMNS = ('x', 'y', 'timestamp', 'speed')
+
+    def __init__(self, min_dist = 1., capacity=1024):
+        self.points = numpy.empty((capacity, len(self.COLUMNS)))
+        self.length = 0
         self.min_dist = min_dist
         self.x = math.inf
         self.y = math.inf
         self.recording = True
-
-    def run(self, x, y):
+        self._xy = None
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def path(self):
+        ''' recorded x, y points as n x 2 array '''
+        if self._xy is None:
+            self._xy = self.points[:self.length, :2]
+        return self._xy
+
+    def append(self, x, y, timestamp=None, speed=None):
+        if self.length == len(self.points):
+            points = numpy.empty((max(2 * self.length, 16), self.points.shape[1]))
+            points[:self.length] = self.points[:self.length]
+            self.points = points
+        self.points[self.length] = (x, y,
+                                    time.time() if timestamp is None else timestamp,
+                                    numpy.nan if speed is None else speed)
+        self.length += 1
+        self._xy = None
+        self.x = x
+        self.y = y
+
+    def run(self, x, y, speed=None):
         d = dist(x, y, self.x, self.y)
         if self.recording and d > self.min_dist:
-            self.path.append((x, y))
-            logging.info("path point (%f, %f)" % ( x, y))
-            self.x = x
-            self.y = y
+            self.append(x, y, speed=speed)
+            logger.debug("path point (%f, %f)" % (x, y))
         return self.path
 
+    def set_points(self, points):
+        points = numpy.asarray(points, dtype=numpy.float64)
+        if points.ndim != 2 or points.shape[1] < 2:
+            raise ValueError('Path points need x and y columns')
+        columns = min(points.shape[1], len(self.COLUMNS))
+        self.points = numpy.full((max(len(points), 16), len(self.COLUMNS)), numpy.nan)
+        self.points[:len(points), :columns] = points[:, :columns]
+        self.length = len(points)
+        self._xy = None
+        if self.length:
+            self.x, self.y = self.points[self.length - 1, :2]
+
+    def decimate(self, min_dist):
+        '''
+        Drop the points closer than min_dist to the last point kept
+        '''
+        if self.length < 3:
+            return self
+        xy = self.path
+        keep = [0]
+        last = xy[0]
+        for i in range(1, self.length - 1):
+            if math.hypot(xy[i, 0] - last[0], xy[i, 1] - last[1]) >= min_dist:
+                keep.append(i)
+                last = xy[i]
+        keep.append(self.length - 1)
+        self.set_points(self.points[keep])
+        return self
+
+    def smooth(self, window=5):
+        '''
+        Moving average of x and y over window points, the first and last
+        points are kept where they are
+        '''
+        half = window // 2
+        if half < 1 or self.length <= 2 * half:
+            return self
+        kernel = numpy.ones(2 * half + 1) / (2 * half + 1)
+        xy = self.points[:self.length, :2]
+        for column in range(2):
+            xy[half:-half, column] = numpy.convolve(xy[:, column], kernel, mode='valid')
+        self._xy = None
+        return self
+
     def save(self, filename):
-        outfile = open(filename, 'wb')
-        pickle.dump(self.path, outfile)
-    
+        '''
+        Save to a compressed numpy .npz file, to a pickled list of (x, y)
+        points for .pkl, like older versions did, or, for any other
+        extension, to a csv file with a header line
+        '''
+        points = self.points[:self.length]
+        if filename.endswith('.npz'):
+            numpy.savez_compressed(filename, **{column: points[:, i] for i, column
+                                                in enumerate(self.COLUMNS)})
+        elif filename.endswith('.pkl'):
+            with open(filename, 'wb') as outfile:
+                pickle.dump(points[:, :2].tolist(), outfile)
+        else:
+            numpy.savetxt(filename, points, delimiter=',', fmt='%.6f',
+                          header=','.join(self.COLUMNS), comments='')
+
     def load(self, filename):
-        infile = open(filename, 'rb')
-        self.path = pickle.load(infile)
+        '''
+        Load a path written by save(), the format of csv and pickle files
+        is detected by their content, not by their extension
+        '''
+        if filename.endswith('.npz'):
+            with numpy.load(filename) as data:
+                points = numpy.column_stack([data[column] for column in self.COLUMNS])
+        elif self._is_pickle(filename):
+            # list of points, as saved to .pkl files
+            with open(filename, 'rb') as infile:
+                points = numpy.array(pickle.load(infile), dtype=numpy.float64).reshape(-1, 2)
+        else:
+            points = numpy.loadtxt(filename, delimiter=',', skiprows=1, ndmin=2)
+        self.set_points(points)
         self.recording = False
 
+    @staticmethod
+    def _is_pickle(filename):
+        with open(filename, 'rb') as infile:
+            # pickle protocol 2 and later start with the PROTO opcode
+            return infile.read(1) == pickle.PROTO
+
 class PImage(object):
     def __init__(self, resolution=(500, 500), color="white", clear_each_frame=False):
         self.resolution = resolution
@@ -72,11 +182,17 @@ class OriginOffset(object):
 
 class PathPlot(object):
     '''
-    draw a path plot to an image
+    draw a path plot to an image. The path is drawn into a mask which is
+    kept between frames, so only the segments added since the last frame
+    are drawn and the cost per frame doesn't grow with the path.
     '''
-    def __init__(self, scale=1.0, offset=(0., 0.0)):
+    def __init__(self, scale=1.0, offset=(0., 0.0), color=(255, 0, 0)):
         self.scale = scale
         self.offset = offset
+        self.color = color
+        self.mask = None
+        self.drawn = 0
+        self.first_point = None
 
     def plot_line(self, sx, sy, ex, ey, draw, color):
         '''
@@ -85,24 +201,30 @@ class PathPlot(object):
         '''
         draw.line((sx,sy, ex, ey), fill=color, width=1)
 
+    def update_mask(self, size, path):
+        path = numpy.asarray(path, dtype=numpy.float64).reshape(-1, 2)
+        first_point = tuple(path[0]) if len(path) else None
+        # start over for another image size or another path
+        if self.mask is None or self.mask.size != size \
+                or len(path) < self.drawn or first_point != self.first_point:
+            self.mask = Image.new('L', size, 0)
+            self.drawn = 0
+            self.first_point = first_point
+        if len(path) < 2 or self.drawn == len(path):
+            return
+        start = max(self.drawn - 1, 0)
+        pts = path[start:] * self.scale + self.offset
+        ImageDraw.Draw(self.mask).line(pts.ravel().tolist(), fill=255, width=1)
+        self.drawn = len(path)
+
     def run(self, img, path):
         
         if type(img) is numpy.ndarray:
             stacked_img = numpy.stack((img,)*3, axis=-1)
             img = arr_to_img(stacked_img)
 
-        draw = ImageDraw.Draw(img)
-        color = (255, 0, 0)
-        for iP in range(0, len(path) - 1):
-            ax, ay = path[iP]
-            bx, by = path[iP + 1]
-            self.plot_line(ax * self.scale + self.offset[0],
-                        ay * self.scale + self.offset[1], 
-                        bx * self.scale + self.offset[0], 
-                        by * self.scale + self.offset[1], 
-                        draw, 
-                        color)
-
+        self.update_mask(img.size, path)
+        img.paste(self.color, mask=self.mask)
         return img
 
 
@@ -139,46 +261,323 @@ class PlotCircle(object):
 
         return img
 
-from donkeycar.la import Line3D, Vec3
+class PathIndex(object):
+    '''
+    The segments of a path as numpy arrays, with a grid of the segments
+    crossing each cell, to find the nearest segment without measuring the
+    distance to all of them.
+    '''
+    def __init__(self, path, closed=True, cell_size=1.0):
+        pts = numpy.asarray(path, dtype=numpy.float64).reshape(-1, 2)
+        self.closed = closed
+        self.cell_size = cell_size
+        self.start = pts if closed else pts[:-1]
+        self.end = numpy.roll(pts, -1, axis=0) if closed else pts[1:]
+        self.dir = self.end - self.start
+        self.len_sq = numpy.einsum('ij,ij->i', self.dir, self.dir)
+        self.len_sq[self.len_sq == 0] = 1e-12
+        self.grid = {}
+        if len(self.start) == 0:
+            return
+        # cells covered by the bounding box of each segment
+        low = numpy.floor(numpy.minimum(self.start, self.end) / cell_size)
+        high = numpy.floor(numpy.maximum(self.start, self.end) / cell_size)
+        cells = {}
+        for i, (x0, y0, x1, y1) in enumerate(
+                numpy.hstack((low, high)).astype(int).tolist()):
+            for cx in range(x0, x1 + 1):
+                for cy in range(y0, y1 + 1):
+                    cells.setdefault((cx, cy), []).append(i)
+        self.grid = {cell: numpy.array(segments)
+                     for cell, segments in cells.items()}
+        self.min_cell = low.min(axis=0).astype(int)
+        self.max_cell = high.max(axis=0).astype(int)
+
+    def __len__(self):
+        return len(self.start)
+
+    def distances(self, segments, x, y):
+        '''
+        :return: projection parameter along, distances to and projections on
+                 the segments with the given indices
+        '''
+        start = self.start[segments]
+        dir = self.dir[segments]
+        rel = numpy.array((x, y)) - start
+        t = numpy.clip(numpy.einsum('ij,ij->i', rel, dir)
+                       / self.len_sq[segments], 0.0, 1.0)
+        proj = start + t[:, numpy.newaxis] * dir
+        d = numpy.hypot(proj[:, 0] - x, proj[:, 1] - y)
+        return t, d, proj
+
+    def nearest_in(self, segments, x, y):
+        '''
+        :return: index, distance and projection of the nearest of segments
+        '''
+        _, d, proj = self.distances(segments, x, y)
+        i = int(numpy.argmin(d))
+        return int(segments[i]), float(d[i]), proj[i]
+
+    def nearest(self, x, y):
+        '''
+        Search the grid in growing rings of cells around the position, until
+        the next ring is further away than the nearest segment found.
+        '''
+        if len(self) == 0:
+            return None, math.inf, None
+        cx = int(math.floor(x / self.cell_size))
+        cy = int(math.floor(y / self.cell_size))
+        # beyond this ring there are no more cells with segments
+        max_ring = int(max(abs(cx - self.min_cell[0]), abs(cx - self.max_cell[0]),
+                           abs(cy - self.min_cell[1]), abs(cy - self.max_cell[1])))
+        best = None, math.inf, None
+        for ring in range(max_ring + 1):
+            # cells of this ring are at least (ring - 1) cells away
+            if (ring - 1) * self.cell_size > best[1]:
+                break
+            found = [self.grid[cell] for cell in self._ring(cx, cy, ring)
+                     if cell in self.grid]
+            if found:
+                nearest = self.nearest_in(numpy.concatenate(found), x, y)
+                if nearest[1] < best[1]:
+                    best = nearest
+        return best
+
+    @staticmethod
+    def _ring(cx, cy, ring):
+        if ring == 0:
+            yield cx, cy
+            return
+        for dx in range(-ring, ring + 1):
+            yield cx + dx, cy - ring
+            yield cx + dx, cy + ring
+        for dy in range(-ring + 1, ring):
+            yield cx - ring, cy + dy
+            yield cx + ring, cy + dy
+
 
 class CTE(object):
+    '''
+    Cross track error to a path of (x, y) points. The nearest segment is
+    searched in a window of segments around the one matched last, so the
+    cost per run does not grow with the length of the path. Only when there
+    is no match yet or the car is further than relocate_dist from the
+    segments of the window, the whole path is searched with a grid index.
+    The error is negative when the car is left of the path.
+    '''
+    def __init__(self, window=20, cell_size=1.0, relocate_dist=1.0,
+                 closed=True):
+        self.window = window
+        self.cell_size = cell_size
+        self.relocate_dist = relocate_dist
+        self.closed = closed
+        self.index = None
+        self.indexed_path = None
+        self.indexed_len = 0
+        self.segment = None
+
+    def update_index(self, path):
+        if path is self.indexed_path and len(path) == self.indexed_len:
+            return
+        self.index = PathIndex(path, self.closed, self.cell_size)
+        self.indexed_path = path
+        self.indexed_len = len(path)
+        self.segment = None
+
+    def nearest_segment(self, path, x, y):
+        '''
+        :return: index of the nearest segment, the distance to it and the
+                 projection of the position on it
+        '''
+        if path is None or len(path) < 2:
+            return None, None, None
+        self.update_index(path)
+        n = len(self.index)
+        if self.segment is not None:
+            offsets = numpy.arange(-self.window, self.window + 1)
+            if self.closed:
+                window = numpy.unique((self.segment + offsets) % n)
+            else:
+                window = numpy.unique(numpy.clip(self.segment + offsets, 0, n - 1))
+            segment, d, proj = self.index.nearest_in(window, x, y)
+            if d <= self.relocate_dist:
+                self.segment = segment
+                return segment, d, proj
+        self.segment, d, proj = self.index.nearest(x, y)
+        return self.segment, d, proj
 
     def nearest_two_pts(self, path, x, y):
-        if len(path) < 2:
+        '''
+        :return: start and end point of the nearest segment
+        '''
+        segment, _, _ = self.nearest_segment(path, x, y)
+        if segment is None:
             return None, None
-
-        distances = []
-        for iP, p in enumerate(path):
-            d = dist(p[0], p[1], x, y)
-            distances.append((d, iP, p))
-        distances.sort(key=lambda elem : elem[0])
-        iA = (distances[0][1] - 1) % len(path)
-        a = path[iA]
-        #iB is the next element in the path, wrapping around..
-        iB = (iA + 2) % len(path)
-        b = path[iB]
-        
-        return a, b
+        return tuple(self.index.start[segment]), tuple(self.index.end[segment])
 
     def run(self, path, x, y):
-        cte = 0.
+        segment, d, _ = self.nearest_segment(path, x, y)
+        if segment is None:
+            return 0.
+        dx, dy = self.index.dir[segment]
+        sx, sy = self.index.start[segment]
+        # side of the segment by the sign of the cross product
+        side = dx * (y - sy) - dy * (x - sx)
+        return -d if side >= 0 else d
 
-        a, b = self.nearest_two_pts(path, x, y)
-        
-        if a and b:
-            #logging.info("nearest: (%f, %f) to (%f, %f)" % ( a[0], a[1], x, y))
-            a_v = Vec3(a[0], 0., a[1])
-            b_v = Vec3(b[0], 0., b[1])
-            p_v = Vec3(x, 0., y)
-            line = Line3D(a_v, b_v)
-            err = line.vector_to(p_v)
-            sign = 1.0
-            cp = line.dir.cross(err.normalized())
-            if cp.y > 0.0 :
-                sign = -1.0
-            cte = err.mag() * sign            
-
-        return cte
+
+class PathTracker(object):
+    '''
+    Base of the path following pilots. When the path changes, the arc length
+    at the start of each segment, the curvature and a speed profile are
+    computed once: the speed is limited by max_lateral_accel in curves and
+    lowered before them so the car can brake at max_decel. Positions and
+    the heading yaw are in a right handed frame, yaw counter clockwise from
+    the x axis in radians. The steering output is normalized to -1 (left)
+    to 1 (right) by max_steering_angle.
+    '''
+    def __init__(self, wheel_base, max_steering_angle, max_speed,
+                 min_speed=0.0, max_lateral_accel=2.0, max_decel=1.0,
+                 closed=True, window=20, cell_size=1.0):
+        self.wheel_base = wheel_base
+        self.max_steering_angle = max_steering_angle
+        self.max_speed = max_speed
+        self.min_speed = min_speed
+        self.max_lateral_accel = max_lateral_accel
+        self.max_decel = max_decel
+        self.closed = closed
+        self.cte = CTE(window=window, cell_size=cell_size, closed=closed)
+        self.profile_index = None
+
+    def update_profile(self, path):
+        self.cte.update_index(path)
+        index = self.cte.index
+        if index is self.profile_index:
+            return
+        self.profile_index = index
+        self.seg_len = numpy.sqrt(index.len_sq)
+        # arc length at the start of each segment and at the end of the path
+        self.s = numpy.concatenate(([0.], numpy.cumsum(self.seg_len)))
+        self.length = self.s[-1]
+        self.curvature = self.path_curvature(index)
+        with numpy.errstate(divide='ignore'):
+            speed = numpy.sqrt(self.max_lateral_accel / numpy.abs(self.curvature))
+        speed = numpy.clip(speed, self.min_speed, self.max_speed)
+        # slow down before curves, around twice for a closed path
+        n = len(speed)
+        for j in range(2 * n - 2 if self.closed else n - 1, -1, -1):
+            i = j % n
+            if i + 1 < n or self.closed:
+                following = speed[(i + 1) % n]
+                speed[i] = min(speed[i], math.sqrt(
+                    following ** 2 + 2 * self.max_decel * self.seg_len[i]))
+        self.speed = speed
+
+    def path_curvature(self, index):
+        '''
+        :return: curvature at the start of each segment, from the circle
+                 through the point and its neighbours
+        '''
+        a = index.start - numpy.roll(index.dir, 1, axis=0)
+        b = index.start
+        c = index.end
+        ab = b - a
+        bc = c - b
+        cross = ab[:, 0] * bc[:, 1] - ab[:, 1] * bc[:, 0]
+        norms = numpy.hypot(*ab.T) * numpy.hypot(*bc.T) * numpy.hypot(*(c - a).T)
+        curvature = numpy.divide(2 * cross, norms, out=numpy.zeros_like(cross),
+                                 where=norms > 1e-12)
+        if not self.closed and len(curvature) > 1:
+            # the first point has no previous one
+            curvature[0] = curvature[1]
+        return curvature
+
+    def locate(self, path, x, y):
+        '''
+        :return: nearest segment and arc length of the projection on it
+        '''
+        segment, _, proj = self.cte.nearest_segment(path, x, y)
+        start = self.cte.index.start[segment]
+        along = math.hypot(proj[0] - start[0], proj[1] - start[1])
+        return segment, self.s[segment] + along
+
+    def point_at(self, s):
+        '''
+        :return: the point of the path at arc length s
+        '''
+        if self.closed:
+            s = s % self.length
+        else:
+            s = min(max(s, 0.), self.length)
+        i = int(numpy.searchsorted(self.s, s, side='right')) - 1
+        i = min(max(i, 0), len(self.seg_len) - 1)
+        t = (s - self.s[i]) / self.seg_len[i]
+        index = self.cte.index
+        return index.start[i] + min(t, 1.) * index.dir[i]
+
+    def steering(self, steering_angle):
+        # a positive angle turns left, which is negative steering
+        return max(-1., min(1., -steering_angle / self.max_steering_angle))
+
+    def run(self, path, x, y, yaw, speed=None):
+        '''
+        :return: normalized steering and target speed
+        '''
+        if path is None or len(path) < 2 or x is None or y is None \
+                or yaw is None:
+            return 0., 0.
+        self.update_profile(path)
+        steering_angle, segment = self.steering_angle(path, x, y, yaw, speed or 0.)
+        return self.steering(steering_angle), float(self.speed[segment])
+
+    def steering_angle(self, path, x, y, yaw, speed):
+        raise NotImplementedError
+
+
+class PurePursuit(PathTracker):
+    '''
+    Steers the rear axle at x, y on the circle to the point of the path
+    look_ahead + look_ahead_gain * speed ahead along the path.
+    '''
+    def __init__(self, wheel_base, max_steering_angle, max_speed,
+                 look_ahead=0.5, look_ahead_gain=0.5, **kwargs):
+        super().__init__(wheel_base, max_steering_angle, max_speed, **kwargs)
+        self.look_ahead = look_ahead
+        self.look_ahead_gain = look_ahead_gain
+
+    def steering_angle(self, path, x, y, yaw, speed):
+        segment, s = self.locate(path, x, y)
+        tx, ty = self.point_at(s + self.look_ahead + self.look_ahead_gain * abs(speed))
+        distance = math.hypot(tx - x, ty - y)
+        if distance < 1e-6:
+            return 0., segment
+        alpha = math.atan2(ty - y, tx - x) - yaw
+        return math.atan2(2. * self.wheel_base * math.sin(alpha), distance), segment
+
+
+class Stanley(PathTracker):
+    '''
+    Steers the front axle along the heading of the nearest segment, plus
+    atan(gain * cross track error / (softening + speed)) towards the path.
+    '''
+    def __init__(self, wheel_base, max_steering_angle, max_speed, gain=1.0,
+                 softening=0.5, **kwargs):
+        super().__init__(wheel_base, max_steering_angle, max_speed, **kwargs)
+        self.gain = gain
+        self.softening = softening
+
+    def steering_angle(self, path, x, y, yaw, speed):
+        fx = x + self.wheel_base * math.cos(yaw)
+        fy = y + self.wheel_base * math.sin(yaw)
+        segment, _ = self.locate(path, fx, fy)
+        dx, dy = self.cte.index.dir[segment]
+        heading_error = math.atan2(dy, dx) - yaw
+        heading_error = math.atan2(math.sin(heading_error), math.cos(heading_error))
+        # positive when the front axle is left of the path
+        sx, sy = self.cte.index.start[segment]
+        error = (dx * (fy - sy) - dy * (fx - sx)) / math.sqrt(self.cte.index.len_sq[segment])
+        correction = math.atan2(self.gain * error, self.softening + abs(speed))
+        return heading_error - correction, segment
 
 
 class PID_Pilot(object):
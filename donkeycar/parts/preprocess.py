@@ -0,0 +1,171 @@
+import logging
+from typing import Optional
+
+import numpy as np
+
+from donkeycar.parts.camera import rgb2gray_into
+from donkeycar.utils import ONE_BYTE_SCALE
+
+logger = logging.getLogger(__name__)
+
+
+class ImagePreprocessor:
+    """
+    Applies the image transformations of the configuration in a single part,
+    in place of chaining colour conversion, crop, resize, mask and
+    normalisation parts which each allocate a new image:
+
+    - 'CROP' in cfg.TRANSFORMATIONS crops by ROI_CROP_* and, like the crop
+      augmentation, scales the region back up to IMAGE_W x IMAGE_H with
+      cubic interpolation
+    - images of another size than IMAGE_W x IMAGE_H are resized
+    - rgb images are converted to grey if IMAGE_DEPTH is 1
+    - 'TRAPEZE' in cfg.TRANSFORMATIONS masks the image by ROI_TRAPEZE_*
+    - with normalize=True the result is scaled to [0, 1] like
+      utils.normalize_image
+
+    Resizing and grey conversion are not done by the transformations but by
+    utils.load_pil_image when training. Here they use the cubic resize of
+    OpenCV of the crop augmentation, which is not identical to the resize
+    of PIL, and the grey weights of PIL. Resizing needs OpenCV, without it
+    an ImportError is raised on the first frame which needs a resize.
+
+    The crop is a view of the input and every other step writes into a
+    buffer allocated on the first frame. Steps which are not needed are
+    skipped, so with nothing to do the input is returned as it is.
+
+    Unless reuse_buffer is False, the output of one frame is overwritten by
+    the next one. Each frame is returned as a new view, so that parts
+    detecting repeated frames by identity keep working, and the same view is
+    returned when the same input frame is passed again.
+    """
+    def __init__(self, cfg, key: str = 'TRANSFORMATIONS',
+                 normalize: bool = False, reuse_buffer: bool = True) -> None:
+        transformations = getattr(cfg, key, None) or []
+        for transformation in transformations:
+            if transformation not in ('CROP', 'TRAPEZE'):
+                logger.warning(f'Transformation {transformation} is not '
+                               f'supported by {type(self).__name__} and will '
+                               f'be ignored')
+        self.width = cfg.IMAGE_W
+        self.height = cfg.IMAGE_H
+        self.depth = cfg.IMAGE_DEPTH
+        self.crop = None
+        if 'CROP' in transformations:
+            self.crop = (cfg.ROI_CROP_TOP, cfg.ROI_CROP_BOTTOM,
+                         cfg.ROI_CROP_LEFT, cfg.ROI_CROP_RIGHT)
+        self.trapeze = None
+        if 'TRAPEZE' in transformations:
+            self.trapeze = (cfg.ROI_TRAPEZE_LL, cfg.ROI_TRAPEZE_LR,
+                            cfg.ROI_TRAPEZE_UL, cfg.ROI_TRAPEZE_UR,
+                            cfg.ROI_TRAPEZE_MIN_Y, cfg.ROI_TRAPEZE_MAX_Y)
+        self.normalize = normalize
+        self.reuse_buffer = reuse_buffer
+        try:
+            import cv2
+            self.cv2 = cv2
+        except ImportError:
+            self.cv2 = None
+        self.input_shape = None
+        self.last_input = None
+        self.last_output = None
+
+    def _setup(self, shape) -> None:
+        """ Works out the steps and allocates the buffers for the input """
+        self.input_shape = shape
+        h, w = shape[:2]
+        channels = shape[2] if len(shape) == 3 else 0
+        self.rows = slice(None)
+        self.cols = slice(None)
+        if self.crop:
+            top, bottom, left, right = self.crop
+            self.rows = slice(top, h - bottom)
+            self.cols = slice(left, w - right)
+            h, w = h - top - bottom, w - left - right
+        self.resize_buffer = None
+        if (h, w) != (self.height, self.width):
+            if self.cv2 is None:
+                # other interpolations would change the model inputs
+                raise ImportError(f'{type(self).__name__} needs OpenCV to '
+                                  f'resize {w}x{h} images to '
+                                  f'{self.width}x{self.height}, install '
+                                  f'opencv-python')
+            self.resize_buffer = np.empty(
+                (self.height, self.width) + shape[2:], dtype=np.uint8)
+        self.grey_buffer = None
+        if self.depth == 1 and channels == 3:
+            self.grey_buffer = np.empty((self.height, self.width, 1),
+                                        dtype=np.uint8)
+            self.grey_scratch = np.empty((self.height, self.width))
+            channels = 1
+        out_shape = (self.height, self.width, channels) if channels \
+            else (self.height, self.width)
+        self.mask = None
+        if self.trapeze:
+            self.mask = self._trapeze_mask(out_shape)
+            self.mask_buffer = np.empty(out_shape, dtype=np.uint8)
+        self.norm_buffer = np.empty(out_shape, dtype=np.float64) \
+            if self.normalize else None
+
+    def _trapeze_mask(self, shape) -> np.ndarray:
+        """ Boolean mask of the trapeze, as filled by the TRAPEZE
+            augmentation, broadcastable to the image shape """
+        lower_left, lower_right, upper_left, upper_right, min_y, max_y = \
+            self.trapeze
+        y = np.arange(shape[0])[:, np.newaxis]
+        x = np.arange(shape[1])[np.newaxis, :]
+        t = (y - min_y) / max(max_y - min_y, 1)
+        left = upper_left + t * (lower_left - upper_left)
+        right = upper_right + t * (lower_right - upper_right)
+        mask = (y >= min_y) & (y <= max_y) & (x >= np.round(left)) \
+            & (x <= np.round(right))
+        return mask.reshape(mask.shape + (1,) * (len(shape) - 2))
+
+    def _resize(self, img_arr: np.ndarray) -> np.ndarray:
+        # crop view is passed directly, OpenCV writes into the buffer
+        resized = self.cv2.resize(img_arr, (self.width, self.height),
+                                  dst=self.resize_buffer,
+                                  interpolation=self.cv2.INTER_CUBIC)
+        # OpenCV drops a trailing channel of 1
+        return resized.reshape(self.resize_buffer.shape)
+
+    def _grey(self, img_arr: np.ndarray) -> np.ndarray:
+        if self.cv2 is not None:
+            self.cv2.cvtColor(img_arr, self.cv2.COLOR_RGB2GRAY,
+                              dst=self.grey_buffer[..., 0])
+        else:
+            rgb2gray_into(img_arr, self.grey_buffer[..., 0],
+                          self.grey_scratch)
+        return self.grey_buffer
+
+    def run(self, img_arr: Optional[np.ndarray]) -> Optional[np.ndarray]:
+        if img_arr is None:
+            return None
+        if self.reuse_buffer and img_arr is self.last_input:
+            return self.last_output
+        if img_arr.shape != self.input_shape:
+            self._setup(img_arr.shape)
+
+        img = img_arr[self.rows, self.cols] if self.crop else img_arr
+        if self.resize_buffer is not None:
+            img = self._resize(img)
+        if self.grey_buffer is not None:
+            img = self._grey(img)
+        if self.mask is not None:
+            # also copies the input if it was not written to a buffer yet
+            img = np.multiply(img, self.mask, out=self.mask_buffer)
+        if self.norm_buffer is not None:
+            img = np.multiply(img, ONE_BYTE_SCALE, out=self.norm_buffer)
+
+        if img is img_arr or np.shares_memory(img, img_arr):
+            output = img
+        elif self.reuse_buffer:
+            output = img.view()
+        else:
+            output = img.copy()
+        self.last_input = img_arr
+        self.last_output = output
+        return output
+
+    def shutdown(self) -> None:
+        pass
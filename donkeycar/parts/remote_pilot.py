@@ -0,0 +1,166 @@
+"""
+Run the pilot on another machine: PilotServer serves the inference of a
+model over zmq, the RemotePilot part sends the pilot inputs of the car to
+it and returns the outputs, like the pilot would do locally. Start the
+server with
+
+    donkey pilotserver --model models/mypilot.h5 --type linear
+
+and set PILOT_REMOTE_HOST in myconfig.py of the car.
+"""
+import logging
+import time
+
+import zmq
+
+from donkeycar.parts.codec import decode, encode
+
+logger = logging.getLogger(__name__)
+
+
+class PilotServer:
+    """
+    Answers inference requests of RemotePilot parts with the outputs of
+    the pilot, i.e. a KerasPilot. Requests are answered in their order.
+    If the pilot fails, None is sent as outputs, so the client stops
+    waiting; malformed requests are dropped.
+    """
+    def __init__(self, pilot, port=5560):
+        self.pilot = pilot
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.ROUTER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        if port == 0:
+            port = self.socket.bind_to_random_port('tcp://*')
+        else:
+            self.socket.bind(f'tcp://*:{port}')
+        self.port = port
+        self.running = True
+        self.requests = 0
+        self.errors = 0
+        logger.info(f'Pilot server listening on port {self.port}')
+
+    def poll(self, timeout_ms=100):
+        """
+        Answer the next request, if one arrives within the timeout
+        :return: True if a request was answered
+        """
+        if not self.socket.poll(timeout_ms):
+            return False
+        identity, *parts = self.socket.recv_multipart(copy=False)
+        try:
+            message, *frames = parts
+            _, (request_id, inputs) = decode(message.buffer, frames)
+        except (ValueError, TypeError) as e:
+            self.errors += 1
+            logger.error(f'Dropping malformed pilot request: {e}')
+            return True
+        try:
+            outputs = self.pilot.run(*inputs)
+            if not isinstance(outputs, (tuple, list)):
+                outputs = [outputs]
+            outputs = list(outputs)
+        except Exception as e:
+            self.errors += 1
+            logger.error(f'Pilot failed on request {request_id}: {e}')
+            outputs = None
+        self.socket.send_multipart(
+            [identity, encode('pilot', [request_id, outputs])])
+        self.requests += 1
+        return True
+
+    def serve(self):
+        while self.running:
+            self.poll()
+
+    def shutdown(self):
+        self.running = False
+        self.socket.close()
+        self.context.term()
+
+
+class RemotePilot:
+    """
+    Part which runs the pilot on a PilotServer. Each new image is sent with
+    the other inputs while up to max_in_flight requests are still waiting
+    for their answer, so frames keep going out while the network and the
+    server are busy. The part returns the outputs for the newest image
+    answered, as long as that image is not older than timeout_ms. Otherwise
+    the fallback pilot, i.e. a small local model, is run or, without one,
+    None is returned for all outputs.
+    """
+    def __init__(self, host, port=5560, num_outputs=2, max_in_flight=2,
+                 timeout_ms=100, fallback=None):
+        self.context = zmq.Context()
+        self.socket = self.context.socket(zmq.DEALER)
+        self.socket.setsockopt(zmq.LINGER, 0)
+        self.socket.connect(f'tcp://{host}:{port}')
+        self.num_outputs = num_outputs
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout_ms / 1000.0
+        self.fallback = fallback
+        # send time of the requests waiting for an answer, by request id
+        self.in_flight = {}
+        self.request_id = 0
+        self.last_img_arr = None
+        self.output = None
+        self.output_time = 0.0
+        self.latency_ms = None
+        self.timeouts = 0
+        self.fallbacks = 0
+
+    def send(self, img_arr, other_arr):
+        self.request_id += 1
+        frames = []
+        message = encode('pilot', [self.request_id, [img_arr, *other_arr]],
+                         frames=frames)
+        try:
+            # copied by zmq, the camera may reuse the buffer of the image
+            self.socket.send_multipart([message] + frames, flags=zmq.NOBLOCK)
+        except zmq.Again:
+            return
+        self.in_flight[self.request_id] = time.time()
+
+    def receive(self):
+        while True:
+            try:
+                message, *frames = self.socket.recv_multipart(
+                    flags=zmq.NOBLOCK, copy=False)
+            except zmq.Again:
+                return
+            _, (request_id, outputs) = decode(message.buffer, frames)
+            sent = self.in_flight.pop(request_id, None)
+            # ignore answers which timed out, are older than the output or
+            # report a failure of the server's pilot
+            if outputs is not None and sent is not None \
+                    and sent > self.output_time:
+                self.output = tuple(outputs)
+                self.output_time = sent
+                self.latency_ms = (time.time() - sent) * 1000.0
+
+    def run(self, img_arr, *other_arr):
+        now = time.time()
+        for request_id, sent in list(self.in_flight.items()):
+            if now - sent > self.timeout:
+                del self.in_flight[request_id]
+                self.timeouts += 1
+        if img_arr is not None and img_arr is not self.last_img_arr \
+                and len(self.in_flight) < self.max_in_flight:
+            self.send(img_arr, other_arr)
+            self.last_img_arr = img_arr
+        self.receive()
+
+        if self.output is not None and now - self.output_time <= self.timeout:
+            return self.output
+        self.fallbacks += 1
+        if self.fallback is not None:
+            return self.fallback.run(img_arr, *other_arr)
+        return (None,) * self.num_outputs
+
+    def shutdown(self):
+        logger.info(f'Remote pilot: {self.timeouts} requests timed out, '
+                    f'fallback used {self.fallbacks} times')
+        self.socket.close()
+        self.context.term()
+        if self.fallback is not None and hasattr(self.fallback, 'shutdown'):
+            self.fallback.shutdown()
@@ -1,7 +1,10 @@
-import serial
 import time
 import logging
 
+from donkeycar.parts.odometer import InterpolatingOdometer
+from donkeycar.parts.tachometer import ContinuousSerialEncoder
+from donkeycar.utilities.serial_port import SerialPort
+
 # Configuration
 SERIAL_PORT = '/dev/ttyUSB0'  # Update with your serial port
 BAUD_RATE = 115200
@@ -29,68 +32,26 @@ logger.setLevel(logging.INFO)
 logger.propagate = False
 
 class ArduinoSpeedReader:
-    def __init__(self, port, baudrate):
+    """
+    Speed of an Arduino encoder in continuous mode. The ticks of every line
+    are buffered with their time on the thread of a ContinuousSerialEncoder
+    and the speed is fitted over all ticks of the last TICK_INTERVAL
+    seconds, so no ticks are lost between two reads.
+    """
+    def __init__(self, port, baudrate, interval_ms=50, window_secs=TICK_INTERVAL):
         self.port = port
         self.baudrate = baudrate
-        self.last_ticks = 0  # Track the last known tick count
-        self.last_time = time.time()  # Track the last update time
         self.speed = 0.0  # Store the current speed
 
-        # Initialize the serial connection
-        try:
-            self.ser = serial.Serial(self.port, self.baudrate, timeout=1)
-        except serial.SerialException as e:
-            #logging.error(f"Failed to open serial port: {e}")
-            raise
-
-        self.start_continuous_mode()
-
-    def start_continuous_mode(self):
-        """Send the command to Arduino to start sending data at regular intervals."""
-        try:
-            self.ser.write(b'c50\n')  # Command to start continuous data transmission
-            #logging.info("Started continuous mode on Arduino.")
-        except Exception as e:
-            pass
-            #logging.error(f"Failed to send continuous mode command: {e}")
+        # Opening the serial port raises if it is not available
+        self.encoder = ContinuousSerialEncoder(SerialPort(port, baudrate, timeout=1),
+                                               interval_ms=interval_ms)
+        self.odometer = InterpolatingOdometer(self.encoder, MM_PER_TICK / 1000,
+                                              window_secs=window_secs)
 
     def get_actual_speed(self):
-        """Retrieve and calculate speed from Arduino data."""
-        try:
-            # Ensure continuous mode is active
-            self.start_continuous_mode()
-
-            # Read and decode a line from the serial port
-            if self.ser.in_waiting > 0:
-                line = self.ser.readline().decode().strip()
-                if line:
-                    try:
-                        # Parse ticks and timestamp
-                        ticks, _ = map(int, line.split(','))
-                        current_time = time.time()
-
-                        # Calculate speed if this is not the first data
-                        if self.last_ticks is not None:
-                            time_elapsed = current_time - self.last_time
-
-                            # Update speed if enough time has passed
-                            if time_elapsed >= TICK_INTERVAL:
-                                distance_covered = (ticks - self.last_ticks) * MM_PER_TICK / 1000
-                                self.speed = distance_covered / time_elapsed
-                                self.last_time = current_time
-
-                        # Update last_ticks unconditionally
-                        self.last_ticks = ticks
-
-                    except ValueError:
-                        pass
-                        #logging.warning(f"Malformed data received: {line}")
-
-        except Exception as e:
-            pass
-            #logging.error(f"Error reading from serial port: {e}")
-
-        # Return the current speed
+        """Speed in m/s at the current time."""
+        _, self.speed, _ = self.odometer.run()
         return self.speed
 
     def run(self):
@@ -98,10 +59,9 @@ class ArduinoSpeedReader:
         return self.get_actual_speed()
 
     def close(self):
-        """Close the serial connection."""
-        if self.ser.is_open:
-            self.ser.close()
-            logging.info("Serial connection closed.")
+        """Stop the encoder and close the serial connection."""
+        self.odometer.shutdown()
+        logging.info("Serial connection closed.")
 
 
 if __name__ == "__main__":
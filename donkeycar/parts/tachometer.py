@@ -4,6 +4,8 @@ import time
 import threading
 from typing import Tuple
 
+import numpy as np
+
 #from donkeycar.utilities.platform import is_jetson
 from donkeycar.utilities.serial_port import SerialPort
 from donkeycar.parts.pins import InputPin, PinEdge
@@ -53,6 +55,73 @@ class AbstractEncoder(ABC):
         """
         return 0
 
+class TickBuffer:
+    """
+    Ring buffer of (ticks, timestamp) samples of an encoder. It is written
+    by a single reader thread and read by the drive loop without locking:
+    the writer fills a slot before it publishes it by incrementing count
+    and readers retry if the writer overwrote the samples while they were
+    copied.
+    """
+    def __init__(self, capacity:int=256):
+        self.capacity = capacity
+        self.ticks = np.zeros(capacity)
+        self.timestamps = np.zeros(capacity)
+        self.count = 0
+
+    def add(self, ticks:float, timestamp:float):
+        i = self.count % self.capacity
+        self.ticks[i] = ticks
+        self.timestamps[i] = timestamp
+        self.count += 1
+
+    def clear(self):
+        self.count = 0
+
+    def samples(self, max_count:int=None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Copy of the most recent samples, oldest first
+        max_count: most samples to return, at most half the capacity, so
+                   the writer can add samples while they are copied
+        """
+        limit = self.capacity // 2
+        max_count = limit if max_count is None else min(max_count, limit)
+        while True:
+            count = self.count
+            n = min(count, max_count)
+            index = np.arange(count - n, count) % self.capacity
+            ticks = self.ticks[index]
+            timestamps = self.timestamps[index]
+            if self.count - count <= self.capacity - n:
+                return ticks, timestamps
+
+    def ticks_at(self, timestamp:float, window_secs:float) -> Tuple[float, float]:
+        """
+        Ticks at the given time and the tick rate, fitted by least squares
+        to the samples of the window_secs before it. Ticks are interpolated
+        between samples and extrapolated with the tick rate after the last
+        sample, for at most window_secs.
+        return: (ticks, ticks per second)
+        """
+        ticks, timestamps = self.samples()
+        if len(ticks) == 0:
+            return 0.0, 0.0
+        start, end = np.searchsorted(timestamps,
+                                     (timestamp - window_secs, timestamp),
+                                     side='right')
+        rate = 0.0
+        if end - start >= 2:
+            t = timestamps[start:end] - timestamps[start:end].mean()
+            k = ticks[start:end] - ticks[start:end].mean()
+            denominator = np.dot(t, t)
+            if denominator > 0:
+                rate = float(np.dot(t, k) / denominator)
+        if end < len(ticks):
+            return float(np.interp(timestamp, timestamps, ticks)), rate
+        ahead = min(timestamp - timestamps[-1], window_secs)
+        return float(ticks[-1] + rate * ahead), rate
+
+
 class SerialEncoder(AbstractEncoder):
     """
     Encoder that requests tick count over serial port.
@@ -232,6 +301,115 @@ class EncoderChannel(AbstractEncoder):
         return self.encoder.get_ticks(encoder_index=self.channel)
 
 
+class ContinuousSerialEncoder(AbstractEncoder):
+    """
+    Encoder which reads the continuous mode of the 'r/p/c' protocol of
+    SerialEncoder on a thread of its own. The microcontroller is started
+    once with 'c{ms}' and every reading is stored with its timestamp in
+    the TickBuffer of its channel, so parts can interpolate the ticks at
+    the time of the drive loop without polling the serial port.
+
+    The milliseconds of the microcontroller are mapped to time.time() with
+    the smallest difference seen between arrival and device time, i.e. the
+    device time plus the lowest transmission delay.
+    """
+    def __init__(self, serial_port:SerialPort=None, interval_ms:int=20,
+                 buffer_size:int=256, debug=False):
+        if serial_port is None:
+            raise ValueError("serial_port must be an instance of SerialPort")
+        self.ser = serial_port
+        self.interval_ms = interval_ms
+        self.buffer_size = buffer_size
+        self.debug = debug
+        self.buffers = []
+        self.ticks = []
+        self.lasttick = []
+        self.direction = 1
+        self.clock_offset = None
+        self.last_device_ms = None
+        self.last_timestamp = 0.0
+        self.running = False
+        self.thread = None
+
+    def start_ticks(self):
+        if self.running:
+            return
+        self.ser.start()
+        self.ser.writeln('r')  # restart the encoder to zero
+        self.ser.writeln('c' + str(int(self.interval_ms)))
+        self.running = True
+        self.thread = threading.Thread(target=self._read, daemon=True)
+        self.thread.start()
+
+    def stop_ticks(self):
+        if not self.running:
+            return
+        self.running = False
+        self.ser.writeln('c')  # stop continuous mode
+        if self.thread is not None:
+            self.thread.join()
+        self.ser.stop()
+
+    def poll_ticks(self, direction:int):
+        """
+        Set the direction of the ticks read from now on,
+        the ticks themselves are read continuously.
+        """
+        self.direction = direction
+
+    def get_ticks(self, encoder_index:int=0) -> int:
+        return self.ticks[encoder_index] if encoder_index < len(self.ticks) else 0
+
+    def buffer(self, encoder_index:int=0) -> TickBuffer:
+        while len(self.buffers) <= encoder_index:
+            self.buffers.append(TickBuffer(self.buffer_size))
+        return self.buffers[encoder_index]
+
+    def _read(self):
+        # sleep for part of the interval when there is no data
+        idle_secs = self.interval_ms / 4000
+        while self.running:
+            if self.ser.buffered() > 0:
+                _, line = self.ser.readln()
+                if line:
+                    self.add_line(line, time.time())
+            else:
+                time.sleep(idle_secs)
+
+    def add_line(self, line:str, arrival:float):
+        """
+        Add a reading "ticks,ms;ticks,ms" received at the given time
+        """
+        try:
+            values = [v.split(',') for v in line.strip().split(';')]
+            readings = [(int(v[0]), int(v[1])) for v in values]
+        except (ValueError, IndexError):
+            logger.error("failure parsing encoder values from serial")
+            return
+
+        device_ms = readings[0][1]
+        if self.last_device_ms is not None and device_ms < self.last_device_ms:
+            # the microcontroller restarted
+            self.clock_offset = None
+        self.last_device_ms = device_ms
+        offset = arrival - device_ms / 1000
+        if self.clock_offset is None or offset < self.clock_offset:
+            self.clock_offset = offset
+        # a lower offset must not move readings before earlier ones
+        timestamp = max(device_ms / 1000 + self.clock_offset,
+                        self.last_timestamp)
+        self.last_timestamp = timestamp
+
+        for i, (total_ticks, _) in enumerate(readings):
+            if i >= len(self.ticks):
+                self.ticks.append(0)
+                self.lasttick.append(total_ticks)
+            delta_ticks = total_ticks - self.lasttick[i]
+            self.lasttick[i] = total_ticks
+            self.ticks[i] += delta_ticks * self.direction
+            self.buffer(i).add(self.ticks[i], timestamp)
+
+
 class GpioEncoder(AbstractEncoder):
     """
     An single-channel encoder read using an InputPin
@@ -7,32 +7,59 @@ author: @miro (Meir Tseitlin) 2020
 Note:
 """
 import os
-import queue
 import time
 import json
 import logging
+import zlib
+from collections import deque
 import numpy as np
 from logging import StreamHandler
 from paho.mqtt.client import Client as MQTTClient
 
+from donkeycar.parts.codec import encode
+
 logger = logging.getLogger()
 
 LOG_MQTT_KEY = 'log/default'
+BATCH_FORMATS = ('jsonl', 'binary')
+
+
+def _json_default(value):
+    # numpy scalars are not serializable by json
+    if isinstance(value, np.generic):
+        return value.item()
+    return str(value)
 
 
 class MqttTelemetry(StreamHandler):
     """
     Telemetry class collects telemetry from different parts of the system and periodically sends updated to the server.
     Telemetry reports are timestamped and stored in memory until it is pushed to the server
+
+    Reports are kept in a ring buffer of TELEMETRY_QUEUE_SIZE samples, when it
+    is full the oldest sample is dropped. With TELEMETRY_MQTT_BATCH_FORMAT set
+    to 'jsonl' or 'binary', all samples of a publish period are sent in one
+    message to the topic, as json lines or in the binary format of
+    donkeycar.parts.codec, optionally zlib compressed with
+    TELEMETRY_MQTT_COMPRESS. Otherwise the json or per key messages of
+    TELEMETRY_MQTT_JSON_ENABLE are sent. With counters=True the part outputs
+    the number of dropped samples and failed publishes after the queue size.
     """
 
-    def __init__(self, cfg):
+    def __init__(self, cfg, counters=False):
 
         StreamHandler.__init__(self)
 
         self.PUBLISH_PERIOD = cfg.TELEMETRY_PUBLISH_PERIOD
         self._last_publish = time.time()
-        self._telem_q = queue.Queue()
+        self._telem_q = deque(maxlen=getattr(cfg, 'TELEMETRY_QUEUE_SIZE', 1000))
+        self._dropped = 0
+        self._publish_errors = 0
+        self._counters = counters
+        self._batch_format = getattr(cfg, 'TELEMETRY_MQTT_BATCH_FORMAT', None)
+        if self._batch_format not in (None,) + BATCH_FORMATS:
+            raise ValueError(f'Unknown telemetry batch format {self._batch_format}')
+        self._compress = getattr(cfg, 'TELEMETRY_MQTT_COMPRESS', False)
         self._step_inputs = cfg.TELEMETRY_DEFAULT_INPUTS.split(',')
         self._step_types = cfg.TELEMETRY_DEFAULT_TYPES.split(',')
         self._total_updates = 0
@@ -41,6 +68,9 @@ class MqttTelemetry(StreamHandler):
         self._topic = cfg.TELEMETRY_MQTT_TOPIC_TEMPLATE % self._donkey_name
         self._use_json_format = cfg.TELEMETRY_MQTT_JSON_ENABLE
         self._mqtt_client = MQTTClient()
+        if self._batch_format:
+            # one message per period, don't pile up more while offline
+            self._mqtt_client.max_queued_messages_set(10)
         self._mqtt_client.connect(self._mqtt_broker, cfg.TELEMETRY_MQTT_BROKER_PORT)
         self._mqtt_client.loop_start()
         self._on = True
@@ -73,15 +103,14 @@ class MqttTelemetry(StreamHandler):
         """
         Basic reporting - gets arbitrary dictionary with values
         """
-        curr_time = int(time.time())
+        curr_time = time.time()
 
-        # Store sample with time rounded to second
-        try:
-            self._telem_q.put((curr_time, metrics), block=False)
-        except queue.Full:
-            pass
+        # the ring buffer drops the oldest sample when full
+        if len(self._telem_q) == self._telem_q.maxlen:
+            self._dropped += 1
+        self._telem_q.append((curr_time, metrics))
 
-        return curr_time
+        return int(curr_time)
 
     def emit(self, record):
         """
@@ -92,27 +121,72 @@ class MqttTelemetry(StreamHandler):
 
     @property
     def qsize(self):
-        return self._telem_q.qsize()
+        return len(self._telem_q)
+
+    @property
+    def dropped(self):
+        return self._dropped
+
+    @property
+    def publish_errors(self):
+        return self._publish_errors
+
+    def _publish(self, topic, payload):
+        try:
+            info = self._mqtt_client.publish(topic, payload)
+            # paho reports a full queue or lost connection in the result
+            if getattr(info, 'rc', 0):
+                self._publish_errors += 1
+        except Exception as e:
+            self._publish_errors += 1
+            logger.error(f'Error publishing {topic}: {e}')
+
+    def _publish_batch(self, samples):
+        try:
+            if self._batch_format == 'binary':
+                payload = encode(self._topic,
+                                 [[ts, values] for ts, values in samples],
+                                 compress_threshold=0 if self._compress else None)
+            else:
+                lines = [json.dumps({'ts': round(ts, 3), 'values': values},
+                                    default=_json_default)
+                         for ts, values in samples]
+                payload = '\n'.join(lines).encode('utf-8')
+                if self._compress:
+                    payload = zlib.compress(payload)
+        except Exception as e:
+            # an unencodable value must not end the publishing thread
+            self._publish_errors += 1
+            logger.error(f'Error encoding telemetry for {self._topic}: {e}')
+            return
+        self._publish(self._topic, payload)
 
     def publish(self):
 
-        # Create packet
-        packet = {}
-        while not self._telem_q.empty():
-            next_item = self._telem_q.get()
-            packet.setdefault(next_item[0], {}).update(next_item[1])
+        samples = []
+        while True:
+            try:
+                samples.append(self._telem_q.popleft())
+            except IndexError:
+                break
 
-        if not packet:
+        if not samples:
             return
-            
+
+        if self._batch_format:
+            self._publish_batch(samples)
+            self._total_updates += 1
+            return
+
+        # Create packet of samples grouped by second
+        packet = {}
+        for ts, metrics in samples:
+            packet.setdefault(int(ts), {}).update(metrics)
+
         if self._use_json_format:
             packet = [{'ts': k, 'values': v} for k, v in packet.items()]
-            payload = json.dumps(packet)
-
-            try:
-                self._mqtt_client.publish(self._topic, payload)
-            except Exception as e:
-                logger.error(f'Error publishing log {self._topic}: {e}')
+            payload = json.dumps(packet, default=_json_default)
+            self._publish(self._topic, payload)
         else:
             # Publish only the last timestamp for per step metrics
             last_sample = packet[list(packet)[-1]]
@@ -120,25 +194,16 @@ class MqttTelemetry(StreamHandler):
                 if k in self._step_inputs:
                     topic = f'{self._topic}/{k}'
                     
-                    try:
-                        # Convert unsupported numpy types to python standard
-                        if isinstance(v, np.generic):
-                            v = np.asscalar(v)
-
-                        self._mqtt_client.publish(topic, v)
-                    except TypeError:
-                        logger.error(f'Cannot publish topic "{topic}" with value of type {type(v)}')
-                    except Exception as e:
-                        logger.error(f'Error publishing log {topic}: {e}')
+                    # Convert unsupported numpy types to python standard
+                    if isinstance(v, np.generic):
+                        v = v.item()
+                    self._publish(topic, v)
 
             # Publish all logs
             for tm, sample in packet.items():
                 if LOG_MQTT_KEY in sample:
                     topic = f'{self._topic}/{LOG_MQTT_KEY}'
-                    try:
-                        self._mqtt_client.publish(topic, sample[LOG_MQTT_KEY])
-                    except Exception as e:
-                        logger.error(f'Error publishing log {topic}: {e}')
+                    self._publish(topic, sample[LOG_MQTT_KEY])
 
         self._total_updates += 1
         return
@@ -160,7 +225,7 @@ class MqttTelemetry(StreamHandler):
 
             self.publish()
             self._last_publish = curr_time
-        return self.qsize
+        return self.outputs()
 
     def run_threaded(self, *args):
 
@@ -169,6 +234,11 @@ class MqttTelemetry(StreamHandler):
         # Add to queue
         record = dict(zip(self._step_inputs, args))
         self.report(record)
+        return self.outputs()
+
+    def outputs(self):
+        if self._counters:
+            return self.qsize, self._dropped, self._publish_errors
         return self.qsize
 
     def update(self):
@@ -14,6 +14,8 @@ class Tub(object):
     """
     A datastore to store sensor data in a key, value format. \n
     Accepts str, int, float, image_array, image, and array data types.
+    An image_array value may also be jpeg encoded bytes, which are written
+    to the images folder as they are.
     """
 
     def __init__(self, base_path, inputs=[], types=[], metadata=[],
@@ -57,11 +59,17 @@ class Tub(object):
                 elif input_type == 'list' or input_type == 'vector':
                     contents[key] = list(value)
                 elif input_type == 'image_array':
-                    # Handle image array
-                    image = Image.fromarray(np.uint8(value))
                     name = Tub._image_file_name(self.manifest.current_index, key)
                     image_path = os.path.join(self.images_base_path, name)
-                    image.save(image_path)
+                    if isinstance(value, (bytes, bytearray, memoryview)):
+                        # Already jpeg encoded (e.g. by an MJPEG camera),
+                        # store the original bytes without re-encoding
+                        with open(image_path, 'wb') as f:
+                            f.write(value)
+                    else:
+                        # Handle image array
+                        image = Image.fromarray(np.uint8(value))
+                        image.save(image_path)
                     contents[key] = name
 
         # Private properties
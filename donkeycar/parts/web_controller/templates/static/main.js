@@ -331,6 +331,12 @@ var driveHandler = new function() {
             fields = ALL_POST_FIELDS;
         }
 
+        // angle and throttle alone go as a compact binary message
+        if(fields.length === 2 && fields.includes('angle') && fields.includes('throttle')) {
+            postControls();
+            return;
+        }
+
         let data = {}
         fields.forEach(field => {
             switch (field) {
@@ -350,6 +356,17 @@ var driveHandler = new function() {
         }
     };
 
+    //
+    // Send angle and throttle as two little endian float32
+    //
+    var postControls = function() {
+        if(socket.readyState !== WebSocket.OPEN) {
+            return;
+        }
+        socket.send(new Float32Array([state.tele.user.angle, state.tele.user.throttle]).buffer);
+        updateUI();
+    };
+
     var applyDeadzone = function(number, threshold){
        percentage = (Math.abs(number) - threshold) / (1 - threshold);
 
@@ -407,7 +424,7 @@ var driveHandler = new function() {
     // Send control updates to the server every .1 seconds.
     function joystickLoop () {
        setTimeout(function () {
-            postDrive()
+            postDrive(['angle', 'throttle'])
 
           if (joystickLoopRunning && state.controlMode == "joystick") {
              joystickLoop();
@@ -13,6 +13,9 @@ import json
 import logging
 import time
 import asyncio
+import struct
+from io import BytesIO
+from threading import Lock
 
 import requests
 from tornado.ioloop import IOLoop
@@ -101,10 +104,12 @@ class RemoteWebServer():
 
 class LocalWebController(tornado.web.Application):
 
-    def __init__(self, port=8887, mode='user'):
+    def __init__(self, port=8887, mode='user', state_rate=20):
         '''
         Create and publish variables needed on many of
         the web handlers.
+        :param state_rate: maximum rate in Hz at which state changes are
+                           pushed to the websocket clients
         '''
 
         print('Starting Donkey Server...', end='')
@@ -122,8 +127,9 @@ class LocalWebController(tornado.web.Application):
         self.port = port
 
         self.num_records = 0
-        self.wsclients = []
         self.loop = None
+        self.video = MjpegBroadcaster()
+        self.drive_state = StateBroadcaster(state_rate)
 
 
         handlers = [
@@ -151,50 +157,36 @@ class LocalWebController(tornado.web.Application):
         self.loop = IOLoop.instance()
         self.loop.start()
 
-    def update_wsclients(self, data):
-        if data:
-            for wsclient in self.wsclients:
-                try:
-                    data_str = json.dumps(data)
-                    logger.debug(f"Updating web client: {data_str}")
-                    wsclient.write_message(data_str)
-                except Exception as e:
-                    logger.warn("Error writing websocket message", exc_info=e)
-                    pass
-
     def run_threaded(self, img_arr=None, num_records=0, mode=None, recording=None):
         """
-        :param img_arr: current camera image or None
+        :param img_arr: current camera image, jpeg bytes or None
         :param num_records: current number of data records
         :param mode: default user/mode
         :param recording: default recording mode
         """
-        self.img_arr = img_arr
+        self.video.set_frame(img_arr)
         self.num_records = num_records
 
         #
         # enforce defaults if they are not none.
         #
-        changes = {}
         if mode is not None and self.mode != mode:
             self.mode = mode
-            changes["driveMode"] = self.mode
         if self.mode_latch is not None:
             self.mode = self.mode_latch
             self.mode_latch = None
-            changes["driveMode"] = self.mode
         if recording is not None and self.recording != recording:
             self.recording = recording
-            changes["recording"] = self.recording
         if self.recording_latch is not None:
-            self.recording = self.recording_latch;
-            self.recording_latch = None;
-            changes["recording"] = self.recording;
+            self.recording = self.recording_latch
+            self.recording_latch = None
 
-        # Send record count to websocket clients
-        if (self.num_records is not None and self.recording is True):
+        # the broadcaster sends what changed to the websocket clients
+        state = {"driveMode": self.mode, "recording": self.recording}
+        # send the record count to the clients every 10 records
+        if self.num_records is not None and self.recording is True:
             if self.num_records % 10 == 0:
-                changes['num_records'] = self.num_records
+                state['num_records'] = self.num_records
 
         #
         # get latched button presses then clear button presses
@@ -206,10 +198,8 @@ class LocalWebController(tornado.web.Application):
             if pressed:
                 self.buttons[button] = False
 
-        # if there were changes, then send to web client
-        if changes and self.loop is not None:
-            logger.debug(str(changes))
-            self.loop.add_callback(lambda: self.update_wsclients(changes))
+        if self.loop is not None:
+            self.drive_state.update(state, self.loop)
 
         if self.throttle == 0:
             return self.angle, self.throttle, self.mode, False, buttons
@@ -284,9 +274,15 @@ class WebSocketDriveAPI(tornado.websocket.WebSocketHandler):
 
     def open(self):
         print("New client connected")
-        self.application.wsclients.append(self)
+        self.application.drive_state.add_client(self)
 
     def on_message(self, message):
+        if isinstance(message, bytes):
+            # binary messages only carry the controls
+            if len(message) == CONTROLS.size:
+                self.application.angle, self.application.throttle = \
+                    CONTROLS.unpack(message)
+            return
         data = json.loads(message)
         self.application.angle = data.get('angle', self.application.angle)
         self.application.throttle = data.get('throttle', self.application.throttle)
@@ -301,7 +297,7 @@ class WebSocketDriveAPI(tornado.websocket.WebSocketHandler):
 
     def on_close(self):
         # print("Client disconnected")
-        self.application.wsclients.remove(self)
+        self.application.drive_state.remove_client(self)
 
 
 class WebSocketCalibrateAPI(tornado.websocket.WebSocketHandler):
@@ -353,9 +349,128 @@ class WebSocketCalibrateAPI(tornado.websocket.WebSocketHandler):
         print("Client disconnected")
 
 
+# binary control message of the web page: angle and throttle as float32
+CONTROLS = struct.Struct('<ff')
+
+
+class StateBroadcaster:
+    '''
+    Pushes the drive state to the websocket clients. The vehicle loop hands
+    over the state each run, only keys which changed since the last message
+    are sent, serialised once for all clients. Changes are collected and
+    sent at most max_rate times per second, a new client gets the full
+    state when it connects.
+    '''
+    def __init__(self, max_rate=20):
+        self.min_interval = 1.0 / max_rate if max_rate else 0.0
+        self.clients = []
+        # state sent to the clients, only used in the tornado loop
+        self.state = {}
+        self.lock = Lock()
+        self.pending = {}
+        self.scheduled = False
+        self.last_sent = 0.0
+        self.messages = 0
+
+    def update(self, state, loop):
+        '''
+        Called from the vehicle loop, schedules sending the changes in
+        the tornado loop
+        '''
+        with self.lock:
+            self.pending.update(state)
+            if self.scheduled:
+                return
+            self.scheduled = True
+        delay = max(0.0, self.last_sent + self.min_interval - time.time())
+        loop.add_callback(loop.call_later, delay, self.flush)
+
+    def flush(self):
+        with self.lock:
+            pending = self.pending
+            self.pending = {}
+            self.scheduled = False
+        changes = {key: value for key, value in pending.items()
+                   if key not in self.state or self.state[key] != value}
+        if not changes:
+            return
+        self.state.update(changes)
+        self.last_sent = time.time()
+        self.send(self.clients, changes)
+
+    def send(self, clients, data):
+        data_str = json.dumps(data)
+        logger.debug(f"Updating web clients: {data_str}")
+        self.messages += 1
+        for client in clients:
+            try:
+                client.write_message(data_str)
+            except Exception as e:
+                logger.warning("Error writing websocket message", exc_info=e)
+
+    def add_client(self, client):
+        self.clients.append(client)
+        if self.state:
+            self.send([client], self.state)
+
+    def remove_client(self, client):
+        self.clients.remove(client)
+
+
+class MjpegBroadcaster:
+    '''
+    Holds the latest image for all clients of the video stream. An image is
+    only jpeg encoded when a client asks for it, once per requested quality,
+    and the same bytes are then sent to every client. Jpeg bytes passed
+    through from an MJPEG camera are sent as they are.
+    '''
+    def __init__(self):
+        # frame id, image and its encodings by quality, replaced as a
+        # whole as the image is set and read from different threads
+        self.current = (0, None, {})
+        self.encodings = 0
+
+    @property
+    def frame_id(self):
+        return self.current[0]
+
+    def set_frame(self, img):
+        '''
+        :param img: image array, jpeg bytes or None to keep the last image
+        '''
+        frame_id, frame, _ = self.current
+        if img is not None and img is not frame:
+            self.current = (frame_id + 1, img, {})
+
+    def get_jpeg(self, quality=None):
+        '''
+        :param quality: jpeg quality 1-95, None for the default
+        :return: tuple of frame id and jpeg bytes, or None if no image yet
+        '''
+        frame_id, frame, jpegs = self.current
+        if frame is None:
+            return None
+        if isinstance(frame, bytes):
+            return frame_id, frame
+        jpeg = jpegs.get(quality)
+        if jpeg is None:
+            if quality is None:
+                jpeg = utils.arr_to_binary(frame)
+            else:
+                f = BytesIO()
+                utils.arr_to_img(frame).save(f, format='jpeg', quality=quality)
+                jpeg = f.getvalue()
+            jpegs[quality] = jpeg
+            self.encodings += 1
+        return frame_id, jpeg
+
+
 class VideoAPI(RequestHandler):
     '''
-    Serves a MJPEG of the images posted from the vehicle.
+    Serves a MJPEG of the images posted from the vehicle. Clients can ask
+    for a lower frame rate or jpeg quality, i.e. /video?fps=5&quality=50.
+    A client which is slower than the camera skips images, it always gets
+    the latest one.
     '''
 
     async def get(self):
@@ -363,24 +478,36 @@ class VideoAPI(RequestHandler):
         self.set_header("Content-type",
                         "multipart/x-mixed-replace;boundary=--boundarydonotcross")
 
-        served_image_timestamp = time.time()
+        fps = float(self.get_argument('fps', 0))
+        min_interval = 1.0 / fps if fps > 0 else 0
+        quality = self.get_argument('quality', None)
+        if quality is not None:
+            quality = min(max(int(quality), 1), 95)
+        broadcaster = self.application.video
+
+        served_frame_id = None
+        served_image_timestamp = 0
         my_boundary = "--boundarydonotcross\n"
         while True:
 
             interval = .01
-            if served_image_timestamp + interval < time.time() and \
-                    hasattr(self.application, 'img_arr'):
-
-                img = utils.arr_to_binary(self.application.img_arr)
+            if broadcaster.frame_id != served_frame_id and \
+                    served_image_timestamp + min_interval < time.time():
+                frame = broadcaster.get_jpeg(quality)
+                if frame is None:
+                    await tornado.gen.sleep(interval)
+                    continue
+                served_frame_id, img = frame
                 self.write(my_boundary)
                 self.write("Content-type: image/jpeg\r\n")
                 self.write("Content-length: %s\r\n\r\n" % len(img))
                 self.write(img)
                 served_image_timestamp = time.time()
                 try:
+                    # waits for slow clients, so they do not queue up images
                     await self.flush()
                 except tornado.iostream.StreamClosedError:
-                    pass
+                    return
             else:
                 await tornado.gen.sleep(interval)
 
@@ -414,6 +541,8 @@ class WebFpv(Application):
              {"path": self.static_file_path})
         ]
 
+        self.video = MjpegBroadcaster()
+
         settings = {'debug': True}
         super().__init__(handlers, **settings)
         print("Started Web FPV server. You can now go to {}.local:{} to "
@@ -426,10 +555,10 @@ class WebFpv(Application):
         IOLoop.instance().start()
 
     def run_threaded(self, img_arr=None):
-        self.img_arr = img_arr
+        self.video.set_frame(img_arr)
 
     def run(self, img_arr=None):
-        self.img_arr = img_arr
+        self.video.set_frame(img_arr)
 
     def shutdown(self):
         pass
@@ -3,18 +3,16 @@ import os
 from time import time
 from typing import List, Dict, Union, Tuple
 
-from tensorflow.python.keras.models import load_model
-
 from donkeycar.config import Config
 from donkeycar.parts.keras import KerasPilot
 from donkeycar.parts.interpreter import keras_model_to_tflite, \
-    saved_model_to_tensor_rt
+    saved_model_to_tensor_rt, keras_model_to_onnx
 from donkeycar.pipeline.database import PilotDatabase
 from donkeycar.pipeline.sequence import TubRecord, TubSequence, TfmIterator
 from donkeycar.pipeline.types import TubDataset
+from donkeycar.parts.preprocess import ImagePreprocessor
 from donkeycar.pipeline.augmentations import ImageAugmentation
 from donkeycar.utils import get_model_by_type, normalize_image, train_test_split
-import tensorflow as tf
 import numpy as np
 
 
@@ -35,7 +33,13 @@ class BatchSequence(object):
         self.batch_size = self.config.BATCH_SIZE
         self.is_train = is_train
         self.augmentation = ImageAugmentation(config, 'AUGMENTATIONS')
-        self.transformation = ImageAugmentation(config, 'TRANSFORMATIONS')
+        self.augment = is_train and bool(getattr(config, 'AUGMENTATIONS', []))
+        # transformations and normalisation in one pass, unless augmentations
+        # need to go in between; images of a sequence are kept, so each image
+        # gets its own output array
+        self.preprocessor = ImagePreprocessor(config, 'TRANSFORMATIONS',
+                                              normalize=not self.augment,
+                                              reuse_buffer=False)
         self.pipeline = self._create_pipeline()
 
     def __len__(self) -> int:
@@ -44,11 +48,10 @@ class BatchSequence(object):
     def image_processor(self, img_arr):
         """ Transformes the images and augments if in training. Then
             normalizes it. """
-        img_arr = self.transformation.run(img_arr)
-        if self.is_train:
-            img_arr = self.augmentation.run(img_arr)
-        norm_img = normalize_image(img_arr)
-        return norm_img
+        img_arr = self.preprocessor.run(img_arr)
+        if self.augment:
+            img_arr = normalize_image(self.augmentation.run(img_arr))
+        return img_arr
 
     def _create_pipeline(self) -> TfmIterator:
         """ This can be overridden if more complicated pipelines are
@@ -73,8 +76,9 @@ class BatchSequence(object):
                                                 y_transform=get_y)
         return pipeline
 
-    def create_tf_data(self) -> tf.data.Dataset:
+    def create_tf_data(self) -> 'tf.data.Dataset':
         """ Assembles the tf data pipeline """
+        import tensorflow as tf
         dataset = tf.data.Dataset.from_generator(
             generator=lambda: self.pipeline,
             output_types=self.model.output_types(),
@@ -92,10 +96,11 @@ def get_model_train_details(database: PilotDatabase, model: str = None) \
 
 def train(cfg: Config, tub_paths: str, model: str = None,
           model_type: str = None, transfer: str = None, comment: str = None) \
-        -> tf.keras.callbacks.History:
+        -> Dict[str, List[float]]:
     """
     Train the model
     """
+    import tensorflow as tf
     database = PilotDatabase(cfg)
     if model_type is None:
         model_type = cfg.DEFAULT_MODEL_TYPE
@@ -158,6 +163,7 @@ def train(cfg: Config, tub_paths: str, model: str = None,
         keras_model_to_tflite(model_path, tf_lite_model_path)
 
     if getattr(cfg, 'CREATE_TENSOR_RT', False):
+        from tensorflow.python.keras.models import load_model
         # load h5 (ie. keras) model
         model_rt = load_model(model_path)
         # save in tensorflow savedmodel format (i.e. directory)
@@ -165,6 +171,10 @@ def train(cfg: Config, tub_paths: str, model: str = None,
         # pass savedmodel to the rt converter
         saved_model_to_tensor_rt(f'{base_path}.savedmodel', f'{base_path}.trt')
 
+    if getattr(cfg, 'CREATE_ONNX', False):
+        onnx_model_path = f'{base_path}.onnx'
+        keras_model_to_onnx(model_path, onnx_model_path)
+
     database_entry = {
         'Number': model_num,
         'Name': os.path.basename(base_path),
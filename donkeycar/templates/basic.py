@@ -19,7 +19,7 @@ from donkeycar.parts.tub_v2 import TubWriter, TubWiper
 from donkeycar.parts.datastore import TubHandler
 from donkeycar.parts.controller import LocalWebController, RCReceiver
 from donkeycar.parts.actuator import PCA9685, PWMSteering, PWMThrottle
-from donkeycar.pipeline.augmentations import ImageAugmentation
+from donkeycar.parts.preprocess import ImagePreprocessor
 
 logger = logging.getLogger()
 logging.basicConfig(level=logging.INFO)
@@ -151,7 +151,7 @@ def drive(cfg, model_path=None, model_type=None):
         # Add image transformations like crop or trapezoidal mask
         if hasattr(cfg, 'TRANSFORMATIONS') and cfg.TRANSFORMATIONS:
             outputs = ['cam/image_array_trans']
-            car.add(ImageAugmentation(cfg, 'TRANSFORMATIONS'),
+            car.add(ImagePreprocessor(cfg, 'TRANSFORMATIONS'),
                     inputs=inputs, outputs=outputs)
             inputs = outputs
 
@@ -32,6 +32,7 @@ IMAGE_DEPTH = 3         # default RGB=3, make 1 for mono
 CAMERA_FRAMERATE = DRIVE_LOOP_HZ
 CAMERA_VFLIP = False
 CAMERA_HFLIP = False
+CAMERA_PUBLISH_JPEG = False  # (V4L only) also output the camera's MJPEG bytes as 'cam/jpeg'; the tub, web and network streamers then store/send them without re-encoding
 CAMERA_INDEX = 0  # used for 'WEBCAM' and 'CVCAM' when there is more than one camera connected 
 # For CSIC camera - If the camera is mounted in a rotated position, changing the below parameter will correct the output frame orientation
 CSIC_CAM_GSTREAMER_FLIP_PARM = 0 # (0 => none , 4 => Flip horizontally, 6 => Flip vertically)
@@ -362,7 +363,7 @@ DEFAULT_AI_FRAMEWORK = 'tensorflow'
 # time. This chooses between different neural network designs. You can
 # override this setting by passing the command line parameter --type to the
 # python manage.py train and drive commands.
-# tensorflow models: (linear|categorical|tflite_linear|tensorrt_linear)
+# tensorflow models: (linear|categorical|tflite_linear|tensorrt_linear|onnx_linear)
 # pytorch models: (resnet18)
 DEFAULT_MODEL_TYPE = 'linear'
 BATCH_SIZE = 128                #how many records to use when doing one pass of gradient decent. Use a smaller number if your gpu is running out of memory.
@@ -380,6 +381,7 @@ LEARNING_RATE_DECAY = 0.0       #only used when OPTIMIZER specified
 SEND_BEST_MODEL_TO_PI = False   #change to true to automatically send best model during training
 CREATE_TF_LITE = True           # automatically create tflite model in training
 CREATE_TENSOR_RT = False        # automatically create tensorrt model in training
+CREATE_ONNX = False             # automatically create onnx model in training, requires tf2onnx
 
 PRUNE_CNN = False               #This will remove weights from your model. The primary goal is to increase performance.
 PRUNE_PERCENT_TARGET = 75       # The desired percentage of pruning.
@@ -419,6 +421,7 @@ NUM_LAST_LAYERS_TO_TRAIN = 7        #when freezing layers, how many layers from
 #WEB CONTROL
 WEB_CONTROL_PORT = int(os.getenv("WEB_CONTROL_PORT", 8887))  # which port to listen on when making a web controller
 WEB_INIT_MODE = "user"              # which control mode to start in. one of user|local_angle|local. Setting local will start in ai mode.
+WEB_STATE_RATE = 20                 # maximum rate in Hz at which drive state changes are pushed to the web page
 
 #JOYSTICK
 USE_JOYSTICK_AS_DEFAULT = False      #when starting the manage.py, when True, will not require a --js option to use the joystick
@@ -491,6 +494,9 @@ TELEMETRY_MQTT_JSON_ENABLE = False
 TELEMETRY_MQTT_BROKER_HOST = 'broker.hivemq.com'
 TELEMETRY_MQTT_BROKER_PORT = 1883
 TELEMETRY_PUBLISH_PERIOD = 1
+TELEMETRY_QUEUE_SIZE = 1000   # samples kept until published, the oldest are dropped when full
+TELEMETRY_MQTT_BATCH_FORMAT = None  # (None|'jsonl'|'binary') send all samples of a period in one message; None for the messages of TELEMETRY_MQTT_JSON_ENABLE
+TELEMETRY_MQTT_COMPRESS = False  # zlib compress the batched messages
 TELEMETRY_LOGGING_ENABLE = True
 TELEMETRY_LOGGING_LEVEL = 'INFO' # (Python logging level) 'NOTSET' / 'DEBUG' / 'INFO' / 'WARNING' / 'ERROR' / 'FATAL' / 'CRITICAL'
 TELEMETRY_LOGGING_FORMAT = '%(message)s'  # (Python logging format - https://docs.python.org/3/library/logging.html#formatter-objects
@@ -591,8 +597,23 @@ AI_LAUNCH_KEEP_ENABLED = False      # when False ( default) you will need to hit
 #Scale the output of the throttle of the ai pilot for all model types.
 AI_THROTTLE_MULT = 1.0              # this multiplier will scale every throttle value for all output from NN models
 
+#Skip inference when the drive loop passes the same camera frame to the pilot again, the previous output is returned.
+PILOT_SKIP_UNCHANGED_FRAMES = True
+
+#Run the pilot inference in a separate thread, the drive loop then uses the most recent completed result.
+PILOT_ASYNC = False
+PILOT_ASYNC_MAX_AGE_MS = 500        # pilot outputs older than this many ms are ignored, None to disable
+PILOT_ASYNC_EXTRAPOLATE = False     # extrapolate angle and throttle of the last two outputs to the time of the drive loop
+
+#Run the pilot inference on another machine, started with 'donkey pilotserver --model <model> --type <type>'.
+#The model given to 'drive --model' runs on the car when the server's answer is too late.
+PILOT_REMOTE_HOST = None            # host name or ip of the pilot server, None to run the pilot on the car
+PILOT_REMOTE_PORT = 5560
+PILOT_REMOTE_MAX_IN_FLIGHT = 2      # images sent to the server before its first answer arrives
+PILOT_REMOTE_TIMEOUT_MS = 100       # answers for images older than this are not used
+
 #Path following
-PATH_FILENAME = "donkey_path.pkl"   # the path will be saved to this filename
+PATH_FILENAME = "donkey_path.csv"   # the path will be saved to this filename, .csv or .npz
 PATH_SCALE = 5.0                    # the path display will be scaled by this factor in the web page
 PATH_OFFSET = (0, 0)                # 255, 255 is the center of the map. This offset controls where the origin is displayed.
 PATH_MIN_DIST = 0.3                 # after travelling this distance (m), save a path point
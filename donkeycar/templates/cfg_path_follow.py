@@ -64,7 +64,7 @@ HAVE_SOMBRERO = False               #set to true when using the sombrero hat fro
 # 
 # 
 #Path following
-PATH_FILENAME = "donkey_path.pkl"   # the path will be saved to this filename
+PATH_FILENAME = "donkey_path.csv"   # the path will be saved to this filename, .csv or .npz
 PATH_SCALE = 10.0                   # the path display will be scaled by this factor in the web page
 PATH_OFFSET = (255, 255)            # 255, 255 is the center of the map. This offset controls where the origin is displayed.
 PATH_MIN_DIST = 0.2                 # after travelling this distance (m), save a path point
@@ -72,6 +72,16 @@ PID_P = -0.5                        # proportional mult for PID path follower
 PID_I = 0.000                       # integral mult for PID path follower
 PID_D = -0.3                       # differential mult for PID path follower
 PID_THROTTLE = 0.30                 # constant throttle value during path following
+PATH_FOLLOWER = 'pid'                # pid steers by the cross track error, pure_pursuit or stanley also plan the speed
+PATH_LOOK_AHEAD = 0.5               # pure_pursuit: distance (m) along the path to steer towards
+PATH_LOOK_AHEAD_GAIN = 0.5          # pure_pursuit: seconds of travel added to the look ahead distance
+STANLEY_GAIN = 1.0                  # stanley: gain of the cross track error correction
+PATH_MAX_SPEED = 1.0                # fastest target speed (m/s) of pure_pursuit and stanley
+PATH_MIN_SPEED = 0.2                # slowest target speed (m/s), the car stalls below it
+PATH_MAX_LATERAL_ACCEL = 1.0        # curves are driven slow enough to stay below this acceleration (m/s^2)
+PATH_MAX_DECEL = 1.0                # deceleration (m/s^2) used to slow down before curves
+WHEEL_BASE = 0.28                   # distance (m) between front and back axles
+MAX_STEERING_ANGLE = 0.4            # steering angle (radians) at full steering
 
 # the cross button is already reserved for the emergency stop
 SAVE_PATH_BTN = "circle"             # joystick button to save path
@@ -83,8 +93,13 @@ ERASE_PATH_BTN = "triangle"     # joystick button to erase path
 # 
 # #Odometry
 HAVE_ODOM = False                   # Do you have an odometer? Uses pigpio 
+ODOM_TYPE = 'pigpio'                # pigpio|arduino; arduino reads the continuous mode of the r/p/c encoder protocol over serial
 MM_PER_TICK = 12.7625               # How much travel with a single tick, in mm
 ODOM_PIN = 4                        # Which GPIO board mode pin to use as input
+ODOM_SERIAL = '/dev/ttyACM0'        # serial port of the arduino encoder
+ODOM_SERIAL_BAUDRATE = 115200       # baud rate of the arduino encoder
+ODOM_INTERVAL_MS = 20               # ms between the readings the arduino sends
+ODOM_WINDOW_SECS = 0.1              # velocity is fitted over the readings of this window
 ODOM_DEBUG = False                  # Write out values on vel and distance as it runs
 # 
 # #Intel T265
@@ -4,7 +4,7 @@ Scripts to drive a donkey 2 car
 
 Usage:
     manage.py (drive) [--model=<model>] [--js] [--type=(linear|categorical)] [--camera=(single|stereo)] [--meta=<key:value> ...] [--myconfig=<filename>]
-    manage.py (train) [--tubs=tubs] (--model=<model>) [--type=(linear|inferred|tensorrt_linear|tflite_linear)]
+    manage.py (train) [--tubs=tubs] (--model=<model>) [--type=(linear|inferred|tensorrt_linear|tflite_linear|onnx_linear)]
 
 Options:
     -h --help               Show this screen.
@@ -109,6 +109,12 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     #
     add_camera(V, cfg, camera_type)
 
+    #
+    # key holding the camera's jpeg bytes for the tub writer and streamers;
+    # falls back to the image array, which they encode themselves
+    #
+    jpeg_key = 'cam/jpeg' if has_jpeg_camera(cfg) else 'cam/image_array'
+
 
     # add lidar
     if cfg.USE_LIDAR:
@@ -166,7 +172,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
     # maintain run conditions for user mode and autopilot mode parts.
     #
     V.add(UserPilotCondition(show_pilot_image=getattr(cfg, 'SHOW_PILOT_IMAGE', False)),
-          inputs=['user/mode', "cam/image_array", "cam/image_array_trans"],
+          inputs=['user/mode', jpeg_key, "cam/image_array_trans"],
           outputs=['run_user', "run_pilot", "ui/image_array"])
 
     class LedConditionLogic:
@@ -277,7 +283,7 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
 
     # Use the FPV preview, which will show the cropped image output, or the full frame.
     if cfg.USE_FPV:
-        V.add(WebFpv(), inputs=['cam/image_array'], threaded=True)
+        V.add(WebFpv(), inputs=[jpeg_key], threaded=True)
 
     def load_model(kl, model_path):
         start = time.time()
@@ -321,7 +327,8 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         #
         model_reload_cb = None
         if '.h5' in model_path or '.trt' in model_path or '.tflite' in \
-                model_path or '.savedmodel' in model_path or '.pth':
+                model_path or '.savedmodel' in model_path or '.onnx' in \
+                model_path or '.pth':
             # load the whole model with weigths, etc
             load_model(kl, model_path)
 
@@ -412,18 +419,39 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         # Add image transformations like crop or trapezoidal mask
         # so they get applied at inference time in autopilot mode.
         #
-        if hasattr(cfg, 'TRANSFORMATIONS') or hasattr(cfg, 'POST_TRANSFORMATIONS'):
-            from donkeycar.parts.image_transformations import ImageTransformations
-            #
-            # add the complete set of pre and post augmentation transformations
-            #
+        if getattr(cfg, 'TRANSFORMATIONS', None):
+            from donkeycar.parts.preprocess import ImagePreprocessor
             logger.info(f"Adding inference transformations")
-            V.add(ImageTransformations(cfg, 'TRANSFORMATIONS',
-                                       'POST_TRANSFORMATIONS'),
+            V.add(ImagePreprocessor(cfg, 'TRANSFORMATIONS'),
                   inputs=['cam/image_array'], outputs=['cam/image_array_trans'])
             inputs = ['cam/image_array_trans'] + inputs[1:]
 
-        V.add(kl, inputs=inputs, outputs=outputs, run_condition='run_pilot')
+        pilot = kl
+        if cfg.PILOT_REMOTE_HOST:
+            #
+            # run inference on a pilot server (donkey pilotserver), the
+            # model loaded here is the fallback if answers are too late
+            #
+            from donkeycar.parts.remote_pilot import RemotePilot
+            pilot = RemotePilot(cfg.PILOT_REMOTE_HOST, cfg.PILOT_REMOTE_PORT,
+                                num_outputs=len(outputs),
+                                max_in_flight=cfg.PILOT_REMOTE_MAX_IN_FLIGHT,
+                                timeout_ms=cfg.PILOT_REMOTE_TIMEOUT_MS,
+                                fallback=kl)
+
+        if cfg.PILOT_ASYNC:
+            #
+            # run inference in its own thread so the drive loop is not
+            # blocked by the model latency; the output age is in ms
+            #
+            from donkeycar.parts.async_pilot import AsyncPilot
+            V.add(AsyncPilot(pilot, num_outputs=len(outputs),
+                             max_age_ms=cfg.PILOT_ASYNC_MAX_AGE_MS,
+                             extrapolate=cfg.PILOT_ASYNC_EXTRAPOLATE),
+                  inputs=inputs, outputs=outputs + ['pilot/age_ms'],
+                  run_condition='run_pilot', threaded=True)
+        else:
+            V.add(pilot, inputs=inputs, outputs=outputs, run_condition='run_pilot')
 
     #
     # stop at a stop sign
@@ -567,20 +595,24 @@ def drive(cfg, model_path=None, use_joystick=False, model_type=None,
         cfg.AUTO_CREATE_NEW_TUB else cfg.DATA_PATH
     meta += getattr(cfg, 'METADATA', [])
     tub_writer = TubWriter(tub_path, inputs=inputs, types=types, metadata=meta)
-    V.add(tub_writer, inputs=inputs, outputs=["tub/num_records"], run_condition='recording')
+    # the tub records 'cam/image_array', but can be fed the camera's jpeg
+    tub_inputs = [jpeg_key if key == 'cam/image_array' else key for key in inputs]
+    V.add(tub_writer, inputs=tub_inputs, outputs=["tub/num_records"], run_condition='recording')
 
     # Telemetry (we add the same metrics added to the TubHandler
     if cfg.HAVE_MQTT_TELEMETRY:
         from donkeycar.parts.telemetry import MqttTelemetry
-        tel = MqttTelemetry(cfg)
+        tel = MqttTelemetry(cfg, counters=True)
         telem_inputs, _ = tel.add_step_inputs(inputs, types)
-        V.add(tel, inputs=telem_inputs, outputs=["tub/queue_size"], threaded=True)
+        V.add(tel, inputs=telem_inputs,
+              outputs=["tub/queue_size", "telemetry/dropped", "telemetry/publish_errors"],
+              threaded=True)
 
     if cfg.PUB_CAMERA_IMAGES:
         from donkeycar.parts.network import TCPServeValue
         from donkeycar.parts.image import ImgArrToJpg
         pub = TCPServeValue("camera")
-        V.add(ImgArrToJpg(), inputs=['cam/image_array'], outputs=['jpg/bin'])
+        V.add(ImgArrToJpg(), inputs=[jpeg_key], outputs=['jpg/bin'])
         V.add(pub, inputs=['jpg/bin'])
 
 
@@ -721,7 +753,8 @@ def add_user_controller(V, cfg, use_joystick, input_image='ui/image_array'):
     # This web controller will create a web server that is capable
     # of managing steering, throttle, and modes, and more.
     #
-    ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE)
+    ctr = LocalWebController(port=cfg.WEB_CONTROL_PORT, mode=cfg.WEB_INIT_MODE,
+                             state_rate=cfg.WEB_STATE_RATE)
     V.add(ctr,
           inputs=[input_image, 'tub/num_records', 'user/mode', 'recording'],
           outputs=['user/steering', 'user/throttle', 'user/mode', 'recording', 'web/buttons'],
@@ -814,6 +847,16 @@ def add_simulator(V, cfg):
         V.add(gym, inputs=inputs, outputs=outputs, threaded=threaded)
 
 
+def has_jpeg_camera(cfg):
+    """
+    True if the configured camera publishes its original jpeg bytes
+    as 'cam/jpeg' alongside the decoded 'cam/image_array'
+    """
+    return not cfg.DONKEY_GYM and cfg.CAMERA_TYPE == "V4L" \
+        and getattr(cfg, 'CAMERA_PUBLISH_JPEG', False) \
+        and not getattr(cfg, 'BGR2RGB', False)
+
+
 def get_camera(cfg):
     """
     Get the configured camera part
@@ -838,7 +881,8 @@ def get_camera(cfg):
                             framerate=cfg.CAMERA_FRAMERATE, gstreamer_flip=cfg.CSIC_CAM_GSTREAMER_FLIP_PARM)
         elif cfg.CAMERA_TYPE == "V4L":
             from donkeycar.parts.camera import V4LCamera
-            cam = V4LCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, framerate=cfg.CAMERA_FRAMERATE)
+            cam = V4LCamera(image_w=cfg.IMAGE_W, image_h=cfg.IMAGE_H, image_d=cfg.IMAGE_DEPTH, framerate=cfg.CAMERA_FRAMERATE,
+                            publish_jpeg=has_jpeg_camera(cfg))
         elif cfg.CAMERA_TYPE == "IMAGE_LIST":
             from donkeycar.parts.camera import ImageListCamera
             cam = ImageListCamera(path_mask=cfg.PATH_MASK)
@@ -906,6 +950,8 @@ def add_camera(V, cfg, camera_type):
         outputs = ['cam/image_array']
         threaded = True
         cam = get_camera(cfg)
+        if has_jpeg_camera(cfg):
+            outputs += ['cam/jpeg']
         if cam:
             V.add(cam, inputs=inputs, outputs=outputs, threaded=threaded)
         if cfg.BGR2RGB:
@@ -14,6 +14,7 @@ Options:
 """
 import os
 import sys
+import math
 import time
 import logging
 import json
@@ -27,7 +28,10 @@ import pigpio
 import donkeycar as dk
 from donkeycar.parts.controller import WebFpv, get_js_controller, LocalWebController
 from donkeycar.parts.actuator import PCA9685, PWMSteering, PWMThrottle
-from donkeycar.parts.path import Path, PathPlot, CTE, PID_Pilot, PlotCircle, PImage, OriginOffset
+from donkeycar.parts.path import Path, PathPlot, CTE, PID_Pilot, PlotCircle, PImage, OriginOffset, \
+    PurePursuit, Stanley
+from donkeycar.parts.transform import Lambda
+from donkeycar.parts.velocity import StepSpeedController
 from donkeycar.parts.transform import PIDController
 from donkeycar.parts.pigpio_enc import PiPGIOEncoder, OdomDist
 from donkeycar.parts.realsense2 import RS_T265
@@ -59,12 +63,28 @@ def drive(cfg):
             threaded=True)
 
     if cfg.HAVE_ODOM:
-        pi = pigpio.pi()
-        enc = PiPGIOEncoder(cfg.ODOM_PIN, pi)
-        V.add(enc, outputs=['enc/ticks'])
-
-        odom = OdomDist(mm_per_tick=cfg.MM_PER_TICK, debug=cfg.ODOM_DEBUG)
-        V.add(odom, inputs=['enc/ticks', 'user/throttle'], outputs=['enc/dist_m', 'enc/vel_m_s', 'enc/delta_vel_m_s'])
+        odom_type = getattr(cfg, 'ODOM_TYPE', 'pigpio')
+        if odom_type == 'arduino':
+            # ticks are read continuously and interpolated at loop time
+            from donkeycar.parts.odometer import InterpolatingOdometer
+            from donkeycar.parts.tachometer import ContinuousSerialEncoder, TachometerMode
+            from donkeycar.utilities.serial_port import SerialPort
+            enc = ContinuousSerialEncoder(SerialPort(cfg.ODOM_SERIAL, cfg.ODOM_SERIAL_BAUDRATE),
+                                          interval_ms=cfg.ODOM_INTERVAL_MS, debug=cfg.ODOM_DEBUG)
+            odom = InterpolatingOdometer(enc, distance_per_tick=cfg.MM_PER_TICK / 1000,
+                                         window_secs=cfg.ODOM_WINDOW_SECS,
+                                         direction_mode=TachometerMode.FORWARD_REVERSE,
+                                         debug=cfg.ODOM_DEBUG)
+            V.add(odom, inputs=['user/throttle'], outputs=['enc/dist_m', 'enc/vel_m_s', 'enc/timestamp'])
+        elif odom_type == 'pigpio':
+            pi = pigpio.pi()
+            enc = PiPGIOEncoder(cfg.ODOM_PIN, pi)
+            V.add(enc, outputs=['enc/ticks'])
+
+            odom = OdomDist(mm_per_tick=cfg.MM_PER_TICK, debug=cfg.ODOM_DEBUG)
+            V.add(odom, inputs=['enc/ticks', 'user/throttle'], outputs=['enc/dist_m', 'enc/vel_m_s', 'enc/delta_vel_m_s'])
+        else:
+            raise ValueError(f"Unknown ODOM_TYPE '{odom_type}', use pigpio or arduino")
 
         if not os.path.exists(cfg.WHEEL_ODOM_CALIB):
             print("You must supply a json file when using odom with T265. There is a sample file in templates.")
@@ -182,8 +202,52 @@ def drive(cfg):
 
     # This will use the cross track error and PID constants to try to steer back towards the path.
     pid = PIDController(p=cfg.PID_P, i=cfg.PID_I, d=cfg.PID_D)
-    pilot = PID_Pilot(pid, cfg.PID_THROTTLE)
-    V.add(pilot, inputs=['cte/error'], outputs=['pilot/angle', 'pilot/throttle'], run_condition="run_pilot")
+    if cfg.PATH_FOLLOWER == 'pid':
+        pilot = PID_Pilot(pid, cfg.PID_THROTTLE)
+        V.add(pilot, inputs=['cte/error'], outputs=['pilot/angle', 'pilot/throttle'], run_condition="run_pilot")
+    else:
+        # The T265 position has no heading, take it from the direction of travel.
+        class HeadingFromMotion:
+            def __init__(self, min_dist=0.05):
+                self.min_dist = min_dist
+                self.x = None
+                self.y = None
+                self.heading = None
+
+            def run(self, x, y):
+                if self.x is None:
+                    self.x, self.y = x, y
+                elif math.hypot(x - self.x, y - self.y) >= self.min_dist:
+                    self.heading = math.atan2(y - self.y, x - self.x)
+                    self.x, self.y = x, y
+                return self.heading
+
+        V.add(HeadingFromMotion(), inputs=['pos/x', 'pos/y'], outputs=['pos/angle'])
+
+        follower_args = dict(wheel_base=cfg.WHEEL_BASE,
+                             max_steering_angle=cfg.MAX_STEERING_ANGLE,
+                             max_speed=cfg.PATH_MAX_SPEED,
+                             min_speed=cfg.PATH_MIN_SPEED,
+                             max_lateral_accel=cfg.PATH_MAX_LATERAL_ACCEL,
+                             max_decel=cfg.PATH_MAX_DECEL)
+        if cfg.PATH_FOLLOWER == 'pure_pursuit':
+            pilot = PurePursuit(look_ahead=cfg.PATH_LOOK_AHEAD,
+                                look_ahead_gain=cfg.PATH_LOOK_AHEAD_GAIN, **follower_args)
+        elif cfg.PATH_FOLLOWER == 'stanley':
+            pilot = Stanley(gain=cfg.STANLEY_GAIN, **follower_args)
+        else:
+            raise ValueError(f"Unknown PATH_FOLLOWER '{cfg.PATH_FOLLOWER}', use pid, pure_pursuit or stanley")
+        V.add(pilot, inputs=['path', 'pos/x', 'pos/y', 'pos/angle', 'enc/vel_m_s'],
+              outputs=['pilot/angle', 'pilot/target_speed'], run_condition="run_pilot")
+
+        if cfg.HAVE_ODOM:
+            # keep the speed of the profile with the odometer speed
+            speed_controller = StepSpeedController(cfg.PATH_MIN_SPEED, cfg.PATH_MAX_SPEED,
+                                                   (1.0 - cfg.PID_THROTTLE) / 255, cfg.PID_THROTTLE)
+            V.add(speed_controller, inputs=['pilot/throttle', 'enc/vel_m_s', 'pilot/target_speed'],
+                  outputs=['pilot/throttle'], run_condition="run_pilot")
+        else:
+            V.add(Lambda(lambda: cfg.PID_THROTTLE), outputs=['pilot/throttle'], run_condition="run_pilot")
 
     def dec_pid_d():
         pid.Kd -= 0.5
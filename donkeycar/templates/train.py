@@ -5,7 +5,7 @@ Basic usage should feel familiar: train.py --tubs data/ --model models/mypilot.h
 
 Usage:
     train.py [--tubs=tubs] (--model=<model>)
-    [--type=(linear|inferred|tensorrt_linear|tflite_linear)]
+    [--type=(linear|inferred|tensorrt_linear|tflite_linear|onnx_linear)]
     [--comment=<comment>]
 
 Options:
@@ -0,0 +1,137 @@
+import time
+from threading import Thread
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.async_pilot import AsyncPilot
+
+
+class SlowPilot:
+    """ Pilot that returns the first pixel of the image as angle """
+    def __init__(self, delay):
+        self.delay = delay
+        self.frames = []
+
+    def run(self, img_arr, other_arr=None):
+        time.sleep(self.delay)
+        self.frames.append(int(img_arr[0, 0]))
+        return float(img_arr[0, 0]), 0.5
+
+    def shutdown(self):
+        pass
+
+
+def wait_for(condition, timeout=2.0):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.005)
+
+
+@pytest.fixture
+def pilot_and_part():
+    pilot = SlowPilot(delay=0.05)
+    part = AsyncPilot(pilot)
+    t = Thread(target=part.update, daemon=True)
+    t.start()
+    yield pilot, part
+    part.shutdown()
+    t.join(timeout=1.0)
+    assert not t.is_alive()
+
+
+def test_async_pilot_returns_none_before_first_inference(pilot_and_part):
+    _, part = pilot_and_part
+    assert part.run_threaded(np.zeros((2, 2))) == (None, None, None)
+
+
+def test_async_pilot_drops_intermediate_frames(pilot_and_part):
+    pilot, part = pilot_and_part
+    frames = [np.full((2, 2), i) for i in range(10)]
+    start = time.time()
+    for frame in frames:
+        part.run_threaded(frame)
+    # handing over frames must not block the drive loop
+    assert time.time() - start < 0.05
+    wait_for(lambda: part.output is not None and part.output[0] == 9.0)
+    angle, throttle, age_ms = part.run_threaded(frames[-1])
+    assert (angle, throttle) == (9.0, 0.5)
+    assert age_ms >= 0.0
+    # at most the first frame was picked up before the newest one, all
+    # frames in between were dropped
+    assert pilot.frames[-1] == 9 and len(pilot.frames) <= 2
+    assert part.dropped_frames == len(frames) - len(pilot.frames)
+
+
+def test_async_pilot_does_not_rerun_same_frame(pilot_and_part):
+    pilot, part = pilot_and_part
+    frame = np.ones((2, 2))
+    part.run_threaded(frame)
+    wait_for(lambda: part.inferences == 1)
+    for _ in range(5):
+        part.run_threaded(frame)
+    time.sleep(0.1)
+    assert part.inferences == 1
+
+
+def test_async_pilot_max_age():
+    part = AsyncPilot(SlowPilot(delay=0.0), max_age_ms=10)
+    part.output = (0.1, 0.2)
+    part.output_time = time.time() - 1.0
+    angle, throttle, age_ms = part.run_threaded(np.zeros((2, 2)))
+    assert angle is None and throttle is None
+    assert age_ms > 10
+
+
+def test_frame_reused_by_camera_is_not_inferred(pilot_and_part):
+    pilot, part = pilot_and_part
+    img = np.full((2, 2), 7, dtype=np.uint8)
+    part.run_threaded(img)
+    # the camera writes the next frame into the same buffer
+    img[:] = 99
+    wait_for(lambda: pilot.frames)
+    assert pilot.frames == [7]
+
+
+class FailingPilot(SlowPilot):
+    """ Pilot that fails on negative frames """
+    def run(self, img_arr, other_arr=None):
+        if img_arr[0, 0] < 0:
+            raise ValueError('bad frame')
+        return super().run(img_arr, other_arr)
+
+
+def test_async_pilot_survives_pilot_failure():
+    part = AsyncPilot(FailingPilot(delay=0.0), max_age_ms=50)
+    t = Thread(target=part.update, daemon=True)
+    t.start()
+    try:
+        part.run_threaded(np.full((2, 2), 3))
+        wait_for(lambda: part.inferences == 1)
+        part.run_threaded(np.full((2, 2), -1))
+        time.sleep(0.1)
+        # the failure is not an output, the last one went stale
+        angle, throttle, age_ms = part.run_threaded(np.full((2, 2), -1))
+        assert angle is None and throttle is None and age_ms > 50
+        assert t.is_alive()
+        part.run_threaded(np.full((2, 2), 4))
+        wait_for(lambda: part.inferences == 2)
+        assert part.run_threaded(np.full((2, 2), 4))[:2] == (4.0, 0.5)
+    finally:
+        part.shutdown()
+        t.join(timeout=1.0)
+
+
+def test_async_pilot_extrapolates_angle_and_throttle():
+    part = AsyncPilot(SlowPilot(delay=0.0), extrapolate=True)
+    now = time.time()
+    part.previous_output, part.previous_time = (0.0, 0.4), now - 0.3
+    part.output, part.output_time = (0.2, 0.8), now - 0.2
+    angle, throttle, age_ms = part.run_threaded(np.zeros((2, 2)))
+    # at most one inference interval ahead, limited to -1..1
+    assert angle == pytest.approx(0.4)
+    assert throttle == 1.0
+    assert age_ms >= 200
+    # without extrapolation the last output is returned
+    part.extrapolate = False
+    assert part.run_threaded(np.zeros((2, 2)))[:2] == (0.2, 0.8)
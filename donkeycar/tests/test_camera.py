@@ -0,0 +1,65 @@
+import os
+import time
+from threading import Thread
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from donkeycar.parts.camera import FramePool, ImageListCamera, rgb2gray_into
+from donkeycar.utils import rgb2gray
+
+
+def test_frame_pool():
+    pool = FramePool((2, 3), np.uint8, size=3)
+    frames = []
+    for i in range(4):
+        buffer = pool.next_buffer()
+        buffer[:] = i
+        frames.append(pool.publish())
+        assert pool.frame is frames[-1]
+    # buffers are reused round robin, every frame is a new view
+    assert np.shares_memory(frames[0], frames[3])
+    assert frames[0] is not frames[3]
+    assert pool.generation == 4
+    assert pool.is_valid(3) and pool.is_valid(4)
+    assert not pool.is_valid(2)
+    with pytest.raises(ValueError):
+        FramePool((2, 3), size=1)
+
+
+def test_rgb2gray_into():
+    rgb = np.random.randint(0, 255, (12, 16, 3), dtype=np.uint8)
+    out = np.empty((12, 16), np.uint8)
+    scratch = np.empty((12, 16), np.float64)
+    rgb2gray_into(rgb, out, scratch)
+    np.testing.assert_array_equal(out, rgb2gray(rgb))
+
+
+def wait_until(condition, timeout=2.0):
+    start = time.time()
+    while not condition() and time.time() - start < timeout:
+        time.sleep(0.005)
+
+
+def test_image_list_camera(tmpdir):
+    for i in range(5):
+        img = Image.fromarray(np.full((12, 16, 3), i * 10, dtype=np.uint8))
+        img.save(os.path.join(tmpdir, f'{i}_cam_image_array_.png'))
+    cam = ImageListCamera(path_mask=os.path.join(tmpdir, '*.png'), prefetch=2)
+    # no frame was loaded yet, the drive loop is not blocked
+    assert cam.run_threaded() is None
+    t = Thread(target=cam.update, daemon=True)
+    t.start()
+    values = []
+    for _ in range(7):
+        wait_until(lambda: not cam.frames.empty())
+        values.append(cam.run_threaded()[0, 0, 0])
+    cam.shutdown()
+    t.join()
+    assert values == [0, 10, 20, 30, 40, 0, 10]
+    # without a new frame the last one is repeated
+    last = cam.frame
+    while not cam.frames.empty():
+        cam.frames.get()
+    assert cam.run_threaded() is last
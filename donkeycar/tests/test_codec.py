@@ -0,0 +1,78 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.codec import CodecError, decode, encode, message_length
+
+
+@pytest.mark.parametrize('value', [
+    None, True, False, 0, -7, 2 ** 40, 0.25, 'steering', b'\xff\xd8jpeg',
+    [0.1, -0.5, 'user'], (1, 2.0, None), {'angle': 0.1, 'buttons': [1, 2]},
+    [], {}, ''])
+def test_round_trip(value):
+    name, decoded = decode(encode('pilot', value))
+    assert name == 'pilot'
+    assert decoded == value
+    assert type(decoded) is type(value)
+
+
+@pytest.mark.parametrize('arr', [
+    np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8),
+    np.linspace(0, 1, 360),
+    np.arange(12, dtype=np.int16).reshape(3, 4).T,
+    np.zeros((0, 2), dtype=np.float32)])
+def test_numpy_round_trip(arr):
+    _, decoded = decode(encode('cam', {'img': arr, 'speed': np.float32(1.5)}))
+    np.testing.assert_array_equal(decoded['img'], arr)
+    assert decoded['img'].dtype == arr.dtype
+    assert decoded['speed'] == 1.5
+
+
+def test_compression():
+    lidar = np.zeros(1000)
+    assert len(encode('lidar', lidar)) < lidar.nbytes / 10
+    assert len(encode('lidar', lidar, compress_threshold=None)) \
+        > lidar.nbytes
+    # images are not compressed again
+    img = np.zeros((120, 160, 3), dtype=np.uint8)
+    assert len(encode('cam', img)) > img.nbytes
+
+
+def test_smaller_than_pickle():
+    value = [0.1, 0.5, 'local', True]
+    packet = {'name': 'pilot', 'val': value}
+    assert len(encode('pilot', value)) < len(pickle.dumps(packet))
+
+
+def test_invalid_messages():
+    with pytest.raises(TypeError):
+        encode('pilot', object())
+    msg = encode('pilot', [1.0, 2.0])
+    with pytest.raises(CodecError):
+        decode(msg[:-3])
+    with pytest.raises(CodecError):
+        decode(b'XX' + msg[2:])
+
+
+def test_message_length():
+    messages = [encode('pilot', i) for i in range(3)]
+    data = b''.join(messages)
+    assert message_length(data) == len(messages[0])
+    assert message_length(data[:5]) == 0
+
+
+def test_frames_round_trip():
+    img = np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+    jpeg = bytes(2000)
+    frames = []
+    msg = encode('cam', [img, jpeg, np.ones(3)], frames=frames)
+    # large values are not copied into the message
+    assert len(frames) == 2 and frames[0] is img
+    assert len(msg) < 100
+    _, (img_out, jpeg_out, small) = decode(msg, frames)
+    np.testing.assert_array_equal(img_out, img)
+    assert jpeg_out == jpeg
+    np.testing.assert_array_equal(small, np.ones(3))
+    with pytest.raises(CodecError):
+        decode(msg)
@@ -0,0 +1,77 @@
+import math
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.fusion import OdometryEKF
+
+
+def drive(ekf, seconds, speed, yaw_rate, rng, heading=0.0, gps_every=None,
+          dt=0.02):
+    """ Runs the filter on noisy readings of a car driving a circle arc,
+        returns the true pose and the estimates """
+    x = y = distance = 0.0
+    angle = heading
+    estimates = []
+    truth = []
+    for i in range(int(seconds / dt)):
+        t = 100 + i * dt
+        gps = []
+        if gps_every and i % gps_every == 0:
+            gps = [(t, 5000 + x + rng.normal(0, 0.5),
+                    300 + y + rng.normal(0, 0.5))]
+        estimates.append(ekf.run(distance + rng.normal(0, 0.005),
+                                 math.degrees(yaw_rate) + rng.normal(0, 1),
+                                 rng.normal(0, 0.2), gps, t)[:6])
+        truth.append((x, y, angle, speed))
+        x += speed * math.cos(angle) * dt
+        y += speed * math.sin(angle) * dt
+        angle += yaw_rate * dt
+        distance += speed * dt
+    return np.array(truth), np.array(estimates)
+
+
+def test_speed_is_smoother_than_encoder_differences():
+    rng = np.random.default_rng(0)
+    ekf = OdometryEKF()
+    truth, estimates = drive(ekf, 10, 1.0, 0.0, rng)
+    speed = estimates[100:, 3]
+    assert speed.mean() == pytest.approx(1.0, abs=0.02)
+    # differences of the encoder distance have a std of 0.35 m/s
+    assert speed.std() < 0.1
+    assert estimates[-1, 0] == pytest.approx(truth[-1, 0], abs=0.1)
+
+
+def test_circle_follows_yaw_rate():
+    rng = np.random.default_rng(1)
+    ekf = OdometryEKF()
+    truth, estimates = drive(ekf, 8, 1.5, 0.5, rng)
+    assert estimates[-1, 4] == pytest.approx(0.5, abs=0.05)
+    position_error = np.hypot(*(estimates[-1, :2] - truth[-1, :2]))
+    assert position_error < 0.3
+    assert np.abs(estimates[:, 2]).max() <= math.pi
+
+
+def test_gps_aligns_heading():
+    rng = np.random.default_rng(2)
+    ekf = OdometryEKF(gps_std=0.5)
+    # the track in gps coordinates heads 1 rad from the start frame
+    truth, estimates = drive(ekf, 30, 1.0, 0.05, rng, heading=1.0,
+                             gps_every=10)
+    angle_error = estimates[-1, 2] - truth[-1, 2]
+    assert math.atan2(math.sin(angle_error), math.cos(angle_error)) \
+        == pytest.approx(0, abs=0.15)
+    assert ekf.gps_origin == pytest.approx((5000, 300), abs=2)
+
+
+def test_state_updated_in_place():
+    ekf = OdometryEKF()
+    state = ekf.state
+    covariance = ekf.run(0.0, 0.0, 0.0, None, 1.0)[6]
+    for t in range(2, 20):
+        assert ekf.run(0.01 * t, 0.0, 0.0, None, t * 0.05 + 1)[6] \
+            is covariance
+    assert ekf.state is state
+    assert not covariance.flags.writeable
+    assert covariance == pytest.approx(covariance.T)
+    assert (np.linalg.eigvalsh(covariance) > 0).all()
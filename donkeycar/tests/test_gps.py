@@ -0,0 +1,89 @@
+import time
+from functools import reduce
+
+import numpy as np
+import pytest
+import utm
+
+from donkeycar.parts.gps import Gps, NmeaStream, POSITION_DTYPE, \
+    getGpsPosition, nmea_to_degrees, nmea_to_degrees_array
+
+RMC = '$GPRMC,003918.00,A,3806.92281,N,12235.64362,W,0.090,,060322,,,D*67'
+
+
+def sentence(body):
+    checksum = reduce(lambda a, b: a ^ b, body.encode())
+    return f'${body}*{checksum:02X}\r\n'
+
+
+def test_stream_splits_sentences_across_reads():
+    stream = NmeaStream(size=100)
+    data = (b'garbage' + RMC.encode() + b'\r\n'
+            + sentence('GPVTG,54.7,T,34.4,M,5.5,N,10.2,K,A').encode()
+            + RMC.replace('*67', '*68').encode() + b'\r\n')
+    sentences = []
+    for i in range(0, len(data), 10):
+        sentences += stream.feed(data[i:i + 10])
+    assert [fields[0] for fields in sentences] == [b'GPRMC', b'GPVTG']
+    assert sentences[0][3] == b'3806.92281'
+    assert stream.invalid == 1
+    assert stream.end == 0
+
+
+def test_nmea_to_degrees_array():
+    degrees = nmea_to_degrees_array([3806.92281, -12235.64362, 59.5])
+    assert degrees == pytest.approx([nmea_to_degrees('3806.92281', 'N'),
+                                     nmea_to_degrees('12235.64362', 'W'),
+                                     nmea_to_degrees('59.5', 'N')])
+
+
+def test_gps_positions():
+    gps = Gps('loop://', capacity=4)
+    try:
+        gga = sentence('GPGGA,003918.00,3806.92281,N,12235.64362,W,4,12,'
+                       '0.8,10.0,M,-30.0,M,,')
+        # the rmc sentence of the same fix does not add a position
+        gps.gps.write((gga + RMC + '\r\n'
+                       + sentence('GPVTG,54.7,T,34.4,M,5.5,N,10.2,K,A')
+                       ).encode())
+        time.sleep(0.05)
+        positions = gps.run()
+        assert positions.dtype == POSITION_DTYPE
+        assert len(positions) == 1
+        _, x, y = positions[0]
+        assert (x, y) == pytest.approx(getGpsPosition(RMC))
+        assert not positions.flags.writeable
+        assert gps.speed == pytest.approx(10.2 / 3.6)
+        assert gps.course == pytest.approx(54.7)
+        assert len(gps.run()) == 0
+
+        # without readers only the newest positions are kept
+        for second in range(6):
+            gps.gps.write(sentence(
+                f'GPGGA,00392{second}.00,3806.9{second},N,12235.6,W,1,8,'
+                f'1.0,10.0,M,-30.0,M,,').encode())
+            time.sleep(0.02)
+            gps.poll()
+        positions = gps.run_threaded()
+        assert len(positions) == 4 and gps.dropped == 2
+        assert np.all(np.diff(positions['x']) > 0)
+    finally:
+        gps.shutdown()
+
+
+def test_gps_positions_across_equator():
+    gps = Gps('loop://')
+    try:
+        north = sentence('GPGGA,003918.00,0000.01,N,00930.0,E,1,8,'
+                         '1.0,10.0,M,-30.0,M,,')
+        south = sentence('GPGGA,003919.00,0000.01,S,00930.0,E,1,8,'
+                         '1.0,10.0,M,-30.0,M,,')
+        gps.gps.write((north + south).encode())
+        time.sleep(0.05)
+        positions = gps.run()
+        assert len(positions) == 2
+        for (_, x, y), latitude in zip(positions, (0.01 / 60, -0.01 / 60)):
+            easting, northing, _, _ = utm.from_latlon(latitude, 9.5)
+            assert (x, y) == pytest.approx((northing, easting))
+    finally:
+        gps.shutdown()
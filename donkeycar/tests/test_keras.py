@@ -6,7 +6,7 @@ import pytest
 import os
 
 from donkeycar.parts.interpreter import keras_to_tflite, \
-    saved_model_to_tensor_rt, TfLite, TensorRT
+    saved_model_to_tensor_rt, keras_to_onnx, TfLite, TensorRT, OnnxInterpreter
 from donkeycar.parts.keras import *
 from donkeycar.utils import get_test_img
 
@@ -51,13 +51,8 @@ def create_models(keras_pilot, dir):
     return km, kl, krt
 
 
-@pytest.mark.parametrize('keras_pilot', test_data)
-def test_keras_vs_tflite_and_tensorrt(keras_pilot, tmp_dir):
-    """ This test cannot run for the 3D CNN model in tflite and the LSTM
-        model in """
-    km, kl, krt = create_models(keras_pilot, tmp_dir)
-
-    # prepare data
+def create_args(keras_pilot, km):
+    """ Prepare input data for the run method of the given pilot """
     img = get_test_img(km)
     if keras_pilot is KerasIMU:
         # simulate 6 imu data in [0, 1]
@@ -73,6 +68,16 @@ def test_keras_vs_tflite_and_tensorrt(keras_pilot, tmp_dir):
         args = (img, one_hot)
     else:
         args = (img, )
+    return args
+
+
+@pytest.mark.parametrize('keras_pilot', test_data)
+def test_keras_vs_tflite_and_tensorrt(keras_pilot, tmp_dir):
+    """ This test cannot run for the 3D CNN model in tflite and the LSTM
+        model in """
+    km, kl, krt = create_models(keras_pilot, tmp_dir)
+
+    args = create_args(keras_pilot, km)
 
     # run all three interpreters and check results are numerically close
     out2 = out3 = None
@@ -88,5 +93,131 @@ def test_keras_vs_tflite_and_tensorrt(keras_pilot, tmp_dir):
     print(out1, out2, out3)
 
 
+@pytest.mark.parametrize('keras_pilot', test_data)
+def test_keras_vs_onnx(keras_pilot, tmp_dir):
+    """ Onnx export needs tf2onnx and inference needs onnxruntime, both are
+        optional dependencies. """
+    pytest.importorskip('tf2onnx')
+    pytest.importorskip('onnxruntime')
+    interpreter = KerasInterpreter()
+    km = keras_pilot(interpreter=interpreter)
+    onnx_model_path = os.path.join(tmp_dir, 'model.onnx')
+    keras_to_onnx(interpreter.model, onnx_model_path)
+    ko = keras_pilot(interpreter=OnnxInterpreter())
+    ko.load(onnx_model_path)
 
-
+    args = create_args(keras_pilot, km)
+    out1 = km.run(*args)
+    out2 = ko.run(*args)
+    assert out2 == approx(out1, rel=TOLERANCE, abs=TOLERANCE)
+
+
+class CountingInterpreter(Interpreter):
+    """ Interpreter returning constant linear outputs which counts calls """
+    def __init__(self):
+        self.count = 0
+
+    def load(self, model_path: str) -> None:
+        pass
+
+    def get_input_shapes(self):
+        return [(None, 120, 160, 3)]
+
+    def predict(self, img_arr, other_arr):
+        self.count += 1
+        return [np.array([0.1]), np.array([0.2])]
+
+
+def test_pilot_skips_unchanged_frame():
+    interpreter = CountingInterpreter()
+    kl = KerasLinear(interpreter=interpreter)
+    img = get_test_img(kl)
+    out1 = kl.run(img)
+    out2 = kl.run(img)
+    assert out2 == out1
+    assert interpreter.count == 1
+    assert kl.skipped_inferences == 1
+    # a new frame object triggers inference again
+    kl.run(img.copy())
+    assert interpreter.count == 2
+    # and so does switching the cache off
+    kl.skip_unchanged_frames = False
+    kl.run(img)
+    kl.run(img)
+    assert interpreter.count == 4
+    assert kl.skipped_inferences == 1
+
+
+def test_pilot_reuses_copy_of_other_input():
+    interpreter = CountingInterpreter()
+    kl = KerasLinear(interpreter=interpreter)
+    img = get_test_img(kl)
+    other = np.array([0.1, 0.2])
+    kl.run(img, other)
+    last_other = kl.last_other_arr
+    assert last_other is not other
+    # changed in place by another part, so the frame is inferred again
+    other[0] = 0.3
+    kl.run(img, other)
+    assert interpreter.count == 2
+    # the copy is written into the array of the previous one
+    assert kl.last_other_arr is last_other
+    assert last_other.tolist() == [0.3, 0.2]
+    kl.run(img, other)
+    assert interpreter.count == 2
+
+
+def test_sequence_buffer():
+    seq = SequenceBuffer(3, (2, ))
+    seq.append([1, 1])
+    # first item fills the whole sequence
+    assert seq.view().tolist() == [[1, 1]] * 3
+    for i in range(2, 6):
+        seq.append([i, i])
+    view = seq.view()
+    assert view.tolist() == [[3, 3], [4, 4], [5, 5]]
+    # view is contiguous and doesn't copy the buffer
+    assert view.flags['C_CONTIGUOUS']
+    assert np.shares_memory(view, seq.buffer)
+
+
+class RecordingInterpreter(CountingInterpreter):
+    """ Interpreter which records the inputs it was called with """
+    def __init__(self):
+        super().__init__()
+        self.inputs = []
+
+    def predict(self, img_arr, other_arr):
+        self.inputs.append((np.array(img_arr), np.array(other_arr)))
+        return super().predict(img_arr, other_arr)
+
+
+@pytest.mark.parametrize('keras_pilot', [KerasLSTM, Keras3D_CNN])
+def test_sequence_pilot_input(keras_pilot):
+    interpreter = RecordingInterpreter()
+    kl = keras_pilot(interpreter=interpreter, input_shape=(4, 5, 3),
+                     seq_length=3)
+    imgs = [np.random.randint(0, 255, size=(4, 5, 3), dtype=np.uint8)
+            for _ in range(5)]
+    # compare against padding with the first image and stacking the list
+    seq = []
+    for img in imgs:
+        kl.run(img)
+        while len(seq) < 3:
+            seq.append(img)
+        seq.pop(0)
+        seq.append(img)
+        img_in, _ = interpreter.inputs[-1]
+        assert img_in == approx(normalize_image(np.array(seq)))
+
+
+def test_memory_pilot_input():
+    interpreter = RecordingInterpreter()
+    kl = KerasMemory(interpreter=interpreter, mem_length=3,
+                     mem_start_speed=0.5)
+    for _ in range(3):
+        kl.run(get_test_img(kl))
+    mem_in = [inp[1].tolist() for inp in interpreter.inputs]
+    assert mem_in[0] == approx([0, 0.5] * 3)
+    assert mem_in[1] == approx([0, 0.5] * 2 + [0.1, 0.2])
+    assert mem_in[2] == approx([0, 0.5] + [0.1, 0.2] * 2)
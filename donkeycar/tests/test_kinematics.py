@@ -0,0 +1,93 @@
+import math
+import time
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.kinematics import Bicycle, InverseBicycle, Unicycle, \
+    bicycle_poses, bicycle_steering_angles, unicycle_poses
+
+
+def drive(rng, n=500):
+    timestamps = 1000.0 + np.cumsum(rng.uniform(0.01, 0.05, n))
+    # a few readings which do not advance in time
+    timestamps[[50, 51, 300]] = timestamps[[49, 40, 299]]
+    distances = np.cumsum(rng.uniform(0, 0.05, n))
+    return distances, timestamps
+
+
+def test_bicycle_poses_match_part():
+    rng = np.random.default_rng(0)
+    distances, timestamps = drive(rng)
+    steering = 0.4 * np.sin(np.arange(len(distances)) / 40)
+    poses = np.array(bicycle_poses(0.3, distances, steering, timestamps))
+
+    part = Bicycle(0.3)
+    for i in range(len(distances)):
+        expected = part.run(distances[i], steering[i], timestamps[i])
+        if i == 0 or i in (50, 51, 300):
+            continue
+        assert poses[:, i] == pytest.approx(expected, abs=1e-9)
+    # the part returns zeros for skipped readings, the batch holds the
+    # previous pose
+    assert (poses[:, 51] == poses[:, 49]).all()
+    assert np.abs(poses[4]).max() <= math.pi
+
+
+def test_unicycle_poses_match_part():
+    rng = np.random.default_rng(1)
+    left, timestamps = drive(rng)
+    right = left + np.cumsum(rng.uniform(-0.01, 0.02, len(left)))
+    poses = np.array(unicycle_poses(0.2, left, right, timestamps))
+
+    part = Unicycle(0.2)
+    for i in range(len(left)):
+        expected = part.run(left[i], right[i], timestamps[i])
+        if i == 0 or i in (50, 51, 300):
+            continue
+        assert poses[:, i] == pytest.approx(expected, abs=1e-9)
+
+
+def test_bicycle_steering_angles():
+    velocities = np.array([1.0, 2.0, 0.0, -1.0])
+    angular = np.array([0.5, -1.0, 1.0, 0.5])
+    angles = bicycle_steering_angles(0.3, velocities, angular)
+    part = InverseBicycle(0.3)
+    for i in (0, 1, 3):
+        assert angles[i] == pytest.approx(
+            part.run(velocities[i], angular[i], 1.0)[1])
+    assert angles[2] == 0
+
+
+def test_empty_poses():
+    poses = bicycle_poses(0.3, [], [], [])
+    assert len(poses) == 9 and all(len(p) == 0 for p in poses)
+
+
+def test_tubpose_command(tmp_path):
+    from donkeycar.management.base import TubPose
+    from donkeycar.parts.tub_v2 import Tub
+
+    tub = Tub(str(tmp_path / 'tub'), ['cam/image_array', 'user/angle',
+                                      'enc/speed'],
+              ['image_array', 'float', 'float'])
+    for i in range(20):
+        tub.write_record({'cam/image_array': np.zeros((4, 4, 3), np.uint8),
+                          'user/angle': -0.5, 'enc/speed': 1.0})
+        time.sleep(0.005)
+    tub.close()
+
+    TubPose().run(['--tub', str(tmp_path / 'tub'),
+                   '--out', str(tmp_path / 'posed'),
+                   '--config', str(tmp_path / 'missing.py'),
+                   '--wheel-base', '0.3', '--max-steering-angle', '0.4'])
+    records = list(Tub(str(tmp_path / 'posed'), read_only=True))
+    assert len(records) == 20
+    assert [r['_timestamp_ms'] for r in records] == \
+        [r['_timestamp_ms'] for r in Tub(str(tmp_path / 'tub'))]
+    # steering to the left turns counter clockwise
+    assert records[-1]['pos/angle'] > 0
+    assert all('pos/x' in r and 'vel/angle' in r for r in records)
+    # the images are copied along
+    image_path = tmp_path / 'posed' / 'images' / records[0]['cam/image_array']
+    assert image_path.exists()
@@ -95,3 +95,132 @@ def test_simple_express_scan():
     lidar.stop()
     lidar.set_motor_pwm(0)
     lidar.disconnect()
+
+
+def test_polar_renderer_draws_scan():
+    from donkeycar.parts.lidar import PolarRenderer
+
+    renderer = PolarRenderer((100, 100), max_distance=1000, mark_px=1,
+                             background=(0, 0, 0), point_color=(255, 0, 0))
+    # 0 degrees is right of the center, 90 degrees above it
+    img = renderer.render([500, 500, 2000], [0, 90, 180])
+    assert tuple(img[50, 76]) == (255, 0, 0, 255)
+    assert tuple(img[24, 50]) == (255, 0, 0, 255)
+    # beyond max_distance is not drawn
+    assert img[:, :40, :3].max() == 0
+    # the buffer is reused
+    assert renderer.render([], []) is img
+    assert img[..., :3].max() == 0
+    # marks beyond the edges are cut off
+    edges = renderer.image([960, 960], [0, 180])
+    assert edges.size == (100, 100)
+    assert edges.getpixel((99, 50)) == (255, 0, 0)
+    assert edges.getpixel((0, 50)) == (255, 0, 0)
+
+
+def test_polar_renderer_fades_old_measurements():
+    from donkeycar.parts.lidar import PolarRenderer
+
+    renderer = PolarRenderer((100, 100), max_distance=1000, mark_px=1,
+                             background=(0, 0, 0), point_color=(200, 200, 200),
+                             fade_seconds=1.0)
+    renderer.render([500], [0], [10.0])
+    img = renderer.render([500], [90], [10.5])
+    # the first measurement is half faded half a second later
+    assert img[50, 76, 0] == 100
+    assert img[24, 50, 0] == 200
+    img = renderer.render([500], [180], [11.6])
+    assert img[50, 76, 0] == 0
+
+
+def test_lidar_plots():
+    import numpy as np
+    from donkeycar.parts.lidar import LidarPlot, LidarPlot2
+
+    angles = np.linspace(0, 360, 2000, endpoint=False)
+    distances = np.full(2000, 1500.)
+    measurements = [(d, a, 0., 1, i)
+                    for i, (d, a) in enumerate(zip(distances, angles))]
+    img = LidarPlot2(resolution=(200, 200), max_dist=3000).run(measurements)
+    assert img.size == (200, 200)
+    pixels = np.asarray(img)
+    assert tuple(pixels[100, 152]) == (255, 64, 64)
+    structured = np.array(measurements, dtype=[
+        ('distance', 'f8'), ('angle', 'f8'), ('time', 'f8'),
+        ('scan', 'i8'), ('index', 'i8')])
+    img2 = LidarPlot2(resolution=(200, 200), max_dist=3000).run(structured)
+    assert np.array_equal(np.asarray(img2), pixels)
+    # angles increase clockwise, distances are clipped to the edge
+    img = np.asarray(LidarPlot(resolution=(100, 100), max_dist=1000)
+                     .run([400, 5000], [90, 180]))
+    assert tuple(img[73, 50]) == (128, 128, 128)
+    assert (img[48:52, 0, 0] == 128).any()
+
+
+def test_scan_buffer_publishes_whole_scans():
+    import numpy as np
+    from donkeycar.parts.lidar import ScanBuffer
+
+    buffer = ScanBuffer(capacity=4)
+    assert len(buffer.scan) == 0
+    for i in range(6):
+        buffer.add(1000. + i, i * 60., 0.1 * i, 1, i)
+    # the scan in progress is not visible
+    assert len(buffer.scan) == 0
+    scan = buffer.publish()
+    assert buffer.scan is scan
+    assert scan.dtype.names == ('distance', 'angle', 'time', 'scan', 'index')
+    assert list(scan['index']) == list(range(6))
+    assert not scan.flags.writeable
+    # filling the next scan leaves the published one as it is
+    for i in range(3):
+        buffer.add(2000., i * 120., 1.0, 2, i)
+    np.testing.assert_array_equal(scan['distance'], 1000. + np.arange(6))
+    second = buffer.publish()
+    assert list(second['scan']) == [2, 2, 2]
+    np.testing.assert_array_equal(scan['distance'], 1000. + np.arange(6))
+    buffer.add(0., 0., 0., 3, 0)
+    buffer.clear()
+    assert len(buffer.publish()) == 0
+
+
+def test_lidar_sectors():
+    import numpy as np
+    import pytest
+    from donkeycar.parts.lidar import LidarSectors
+
+    sectors = LidarSectors(num_sectors=4, occupied_distance=1000,
+                           stop_distance=300, stop_ttc=0.5, front_width=60)
+    angles = np.arange(0, 360, 1.0)
+    distances = np.full(360, 3000.)
+    distances[350] = 2000.      # forward, sector 0 spans -45 to 45 degrees
+    distances[90] = 800.        # left
+    distances[200] = 0.         # invalid
+    scan = np.column_stack((distances, angles))
+    values, occupied, ttc, stop = sectors.run(scan, 1.0)
+    np.testing.assert_array_equal(values, [2000., 800., 3000., 3000.])
+    np.testing.assert_array_equal(occupied, [False, True, False, False])
+    assert ttc == pytest.approx(2.0)
+    assert not stop
+    # fast enough to hit the obstacle in front within stop_ttc
+    _, _, ttc, stop = sectors.run(scan, 5.0)
+    assert ttc == pytest.approx(0.4) and stop
+    # reversing looks backwards
+    _, _, ttc, stop = sectors.run(scan, -1.0)
+    assert ttc == pytest.approx(3.0) and not stop
+    # standing still
+    _, _, ttc, stop = sectors.run(scan, 0.)
+    assert ttc == np.inf and not stop
+    assert sectors.run(None, 1.0)[3] is False
+
+
+def test_lidar_sectors_percentile():
+    import numpy as np
+    from donkeycar.parts.lidar import LidarSectors
+
+    sectors = LidarSectors(num_sectors=2, percentile=50)
+    angles = np.array([0, 10, 20, 30, 180, 190])
+    distances = np.array([400., 100., 300., 200., 500., 600.])
+    values = sectors.summarise(distances, angles)
+    # lower median of 100, 200, 300, 400 and of 500, 600
+    np.testing.assert_array_equal(values, [200., 500.])
@@ -0,0 +1,115 @@
+import time
+
+import numpy as np
+import pytest
+
+zmq = pytest.importorskip('zmq')
+from donkeycar.parts.network import ZMQValuePub, ZMQValueSub
+
+
+def test_zmq_image_pub_sub_returns_newest():
+    port = 5579
+    pub = ZMQValuePub('camera', port=port)
+    sub = ZMQValueSub('camera', ip='localhost', port=port, hwm=100)
+    try:
+        # let the subscription reach the publisher
+        time.sleep(0.5)
+        assert sub.run() is None
+        images = [np.full((120, 160, 3), i, dtype=np.uint8) for i in range(5)]
+        for img in images:
+            pub.run(img)
+        time.sleep(0.5)
+        img = sub.run()
+        np.testing.assert_array_equal(img, images[-1])
+        # older images were skipped, not returned one by one
+        assert sub.dropped > 0
+        # no new message returns the last one
+        assert sub.run() is img
+    finally:
+        pub.shutdown()
+        sub.shutdown()
+
+
+def free_port():
+    import socket
+    with socket.socket() as sock:
+        sock.bind(('localhost', 0))
+        return sock.getsockname()[1]
+
+
+def test_tcp_serve_does_not_block_on_slow_client():
+    import socket
+    from donkeycar.parts.network import TCPClientValue, TCPServeValue
+
+    port = free_port()
+    server = TCPServeValue('camera', port=port)
+    # a client which connects but never reads
+    slow = socket.create_connection(('localhost', port))
+    slow.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    client = TCPClientValue('camera', 'localhost', port=port)
+    try:
+        time.sleep(0.2)
+        img = np.zeros((120, 160, 3), dtype=np.uint8)
+        longest = 0
+        for i in range(200):
+            img[0, 0, 0] = i
+            start = time.time()
+            server.run(img.copy())
+            longest = max(longest, time.time() - start)
+            time.sleep(0.002)
+        # run only hands the value over to the serving thread
+        assert longest < 0.05
+        value = None
+        for _ in range(20):
+            time.sleep(0.05)
+            value = client.run()
+            if value is not None and value[0, 0, 0] == 199:
+                break
+        # the reading client gets the newest value
+        assert value is not None and value[0, 0, 0] == 199
+        # the slow client's values were replaced instead of queued
+        assert server.dropped > 0
+    finally:
+        slow.close()
+        client.shutdown()
+        server.shutdown()
+
+
+def test_tcp_client_connects_without_blocking():
+    from donkeycar.parts.network import TCPClientValue, TCPServeValue
+
+    port = free_port()
+    start = time.time()
+    client = TCPClientValue('camera', 'localhost', port=port)
+    client.retry_interval = 0.1
+    assert client.run() is None
+    assert time.time() - start < 0.1
+    assert not client.is_connected()
+    server = TCPServeValue('camera', port=port)
+    try:
+        value = None
+        for _ in range(40):
+            time.sleep(0.02)
+            server.run(np.ones(3))
+            value = client.run()
+            if value is not None:
+                break
+        assert client.is_connected()
+        assert value is not None and value.tolist() == [1, 1, 1]
+    finally:
+        client.shutdown()
+        server.shutdown()
+
+
+def test_tcp_serve_shutdown_with_full_wake_up_socket():
+    from donkeycar.parts.network import TCPServeValue
+
+    server = TCPServeValue('camera', port=free_port())
+    server.running = False
+    server.thread.join()
+    while True:
+        try:
+            server.wake_send.send(b'x' * 4096)
+        except OSError:
+            break
+    server.shutdown()
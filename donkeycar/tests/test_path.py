@@ -0,0 +1,188 @@
+import math
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from donkeycar.parts.path import CTE, Path, PathIndex, PathPlot, \
+    PurePursuit, Stanley
+
+
+def circle_path(n=2000, radius=20.0):
+    angles = np.linspace(0, 2 * math.pi, n, endpoint=False)
+    return [(radius * math.cos(a), radius * math.sin(a)) for a in angles]
+
+
+def brute_force_distance(path, x, y):
+    best = math.inf
+    for i in range(len(path)):
+        a = np.array(path[i])
+        b = np.array(path[(i + 1) % len(path)])
+        d = b - a
+        t = np.clip(np.dot((x, y) - a, d) / np.dot(d, d), 0, 1)
+        best = min(best, np.hypot(*(a + t * d - (x, y))))
+    return best
+
+
+def test_grid_index_finds_nearest_segment():
+    path = circle_path(500)
+    index = PathIndex(path, cell_size=0.5)
+    rng = np.random.default_rng(0)
+    for x, y in rng.uniform(-30, 30, (50, 2)):
+        _, d, _ = index.nearest(x, y)
+        assert d == pytest.approx(brute_force_distance(path, x, y))
+
+
+def test_cte_sign_and_projection():
+    # counter clockwise along the x axis and back
+    path = [(0., 0.), (10., 0.), (10., 10.), (0., 10.)]
+    cte = CTE()
+    # negative left of the path, like Line3D based cte before
+    assert cte.run(path, 5., 1.) == pytest.approx(-1.)
+    cte = CTE()
+    assert cte.run(path, 5., -1.) == pytest.approx(1.)
+    segment, d, proj = cte.nearest_segment(path, 3., -0.5)
+    assert segment == 0
+    np.testing.assert_allclose(proj, (3., 0.))
+    assert cte.nearest_two_pts(path, 3., -0.5) == ((0., 0.), (10., 0.))
+    assert CTE().run(path[:1], 0., 0.) == 0.
+
+
+def test_cte_follows_window_along_path():
+    path = circle_path()
+    cte = CTE(window=5)
+    for i in range(0, 2000, 3):
+        a = 2 * math.pi * i / 2000
+        # inside the circle is left of the counter clockwise path
+        error = cte.run(path, 19.5 * math.cos(a), 19.5 * math.sin(a))
+        assert error == pytest.approx(-0.5, abs=1e-3)
+        assert abs(cte.segment - i) <= 1
+    # a jump away from the window is found with the index
+    cte.run(path, -20., 0.)
+    assert abs(cte.segment - 1000) <= 1
+
+
+def test_cte_prefers_matched_part_of_crossing_path():
+    # figure eight crossing at the origin
+    t = np.linspace(0, 2 * math.pi, 400, endpoint=False)
+    path = list(zip(10 * np.sin(t), 5 * np.sin(2 * t)))
+    cte = CTE(window=10)
+    for i in range(190, 201):
+        cte.run(path, *path[i])
+    # at the crossing the segment continues the matched part of the path
+    assert 195 <= cte.segment <= 205
+
+
+def test_path_records_points_apart(tmp_path):
+    path = Path(min_dist=0.5, capacity=2)
+    for i in range(100):
+        xy = path.run(i * 0.1, 0.)
+    # a point every 0.6 with the first one at 0
+    assert len(path) == 17
+    assert xy.shape == (17, 2)
+    # the same array is returned until a point is added
+    assert path.run(9.9, 0.) is xy
+    assert np.all(np.diff(path.points[:len(path), 2]) >= 0)
+    assert np.isnan(path.points[0, 3])
+
+
+@pytest.mark.parametrize('filename', ['path.csv', 'path.npz'])
+def test_path_save_load(tmp_path, filename):
+    path = Path(min_dist=0.)
+    for i in range(10):
+        path.run(float(i), float(i * i), speed=i / 10)
+    path.save(str(tmp_path / filename))
+    loaded = Path()
+    loaded.load(str(tmp_path / filename))
+    assert not loaded.recording
+    np.testing.assert_allclose(loaded.points[:10], path.points[:10], atol=1e-6)
+    np.testing.assert_allclose(loaded.run(0., 0.), path.path, atol=1e-6)
+
+
+def test_path_save_load_pkl(tmp_path):
+    path = Path(min_dist=0.)
+    for i in range(10):
+        path.run(float(i), float(i * i), speed=i / 10)
+    path.save(str(tmp_path / 'path.pkl'))
+    loaded = Path()
+    loaded.load(str(tmp_path / 'path.pkl'))
+    assert not loaded.recording
+    np.testing.assert_allclose(loaded.run(0., 0.), path.path)
+    # a csv written to a .pkl file is read as csv
+    np.savetxt(str(tmp_path / 'csv.pkl'), path.points[:10], delimiter=',',
+               header=','.join(Path.COLUMNS), comments='')
+    loaded.load(str(tmp_path / 'csv.pkl'))
+    np.testing.assert_allclose(loaded.points[:10], path.points[:10])
+
+
+def test_path_decimate_and_smooth():
+    path = Path(min_dist=0.)
+    for i in range(101):
+        path.run(i * 0.1, (-1) ** i * 0.1)
+    path.decimate(1.0)
+    assert 10 <= len(path) <= 12
+    assert tuple(path.path[-1]) == pytest.approx((10., 0.1))
+
+    path = Path(min_dist=0.)
+    for i in range(11):
+        path.run(float(i), (-1) ** i * 0.1)
+    path.smooth(3)
+    # zigzag is smoothed, ends stay
+    assert tuple(path.path[0]) == pytest.approx((0., 0.1))
+    assert np.abs(path.path[1:-1, 1]).max() < 0.1
+
+
+def test_path_plot_draws_new_segments_only():
+    plot = PathPlot(scale=1.0, offset=(10., 10.))
+    path = Path(min_dist=0.)
+    path.run(0., 0.)
+    path.run(20., 0.)
+    img = plot.run(Image.new('RGB', (50, 50), 'white'), path.path)
+    assert img.getpixel((20, 10)) == (255, 0, 0)
+    path.run(20., 20.)
+    img = plot.run(Image.new('RGB', (50, 50), 'white'), path.path)
+    assert plot.drawn == 3
+    assert img.getpixel((20, 10)) == (255, 0, 0)
+    assert img.getpixel((30, 20)) == (255, 0, 0)
+    assert img.getpixel((20, 20)) == (255, 255, 255)
+
+
+def drive(follower, path, x, y, yaw, steps=1500, dt=0.02, speed=1.0):
+    """ bicycle model steered by the follower, returns the final cte """
+    cte = CTE()
+    for _ in range(steps):
+        steering, _ = follower.run(path, x, y, yaw, speed)
+        steering_angle = -steering * follower.max_steering_angle
+        x += speed * math.cos(yaw) * dt
+        y += speed * math.sin(yaw) * dt
+        yaw += speed / follower.wheel_base * math.tan(steering_angle) * dt
+    return cte.run(path, x, y)
+
+
+@pytest.mark.parametrize('follower', [
+    PurePursuit(wheel_base=0.25, max_steering_angle=0.5, max_speed=2.0),
+    Stanley(wheel_base=0.25, max_steering_angle=0.5, max_speed=2.0)])
+def test_followers_converge_to_circle(follower):
+    path = circle_path(1000, radius=3.0)
+    # start 0.5m outside, heading along the counter clockwise path
+    error = drive(follower, path, 3.5, 0., math.pi / 2)
+    assert abs(error) < 0.05
+
+
+def test_speed_profile_slows_down_for_curves():
+    # straight line into a tight half circle
+    straight = [(float(x), 0.) for x in np.arange(0, 10, 0.1)]
+    angles = np.linspace(-math.pi / 2, math.pi / 2, 50)
+    curve = [(10 + math.cos(a), 1 + math.sin(a)) for a in angles]
+    follower = PurePursuit(wheel_base=0.25, max_steering_angle=0.5,
+                           max_speed=3.0, max_lateral_accel=1.0,
+                           max_decel=1.0, closed=False)
+    path = straight + curve
+    _, start_speed = follower.run(path, 0., 0., 0.)
+    _, before_speed = follower.run(path, 9.5, 0., 0.)
+    _, curve_speed = follower.run(path, 11., 1., math.pi / 2)
+    assert start_speed == pytest.approx(3.0)
+    assert curve_speed == pytest.approx(1.0, rel=0.05)
+    assert curve_speed < before_speed < start_speed
+    assert follower.length == pytest.approx(9.9 + math.pi, rel=0.01)
+    assert follower.run(None, 0., 0., 0.) == (0., 0.)
@@ -0,0 +1,81 @@
+import numpy as np
+import pytest
+
+from donkeycar.config import Config
+from donkeycar.parts.preprocess import ImagePreprocessor
+from donkeycar.utils import normalize_image
+
+
+def make_cfg(**kwargs):
+    cfg = Config()
+    cfg.IMAGE_W, cfg.IMAGE_H, cfg.IMAGE_DEPTH = 160, 120, 3
+    cfg.TRANSFORMATIONS = []
+    cfg.ROI_CROP_TOP, cfg.ROI_CROP_BOTTOM = 40, 0
+    cfg.ROI_CROP_LEFT, cfg.ROI_CROP_RIGHT = 0, 0
+    cfg.ROI_TRAPEZE_LL, cfg.ROI_TRAPEZE_LR = 0, 160
+    cfg.ROI_TRAPEZE_UL, cfg.ROI_TRAPEZE_UR = 20, 140
+    cfg.ROI_TRAPEZE_MIN_Y, cfg.ROI_TRAPEZE_MAX_Y = 60, 120
+    for key, value in kwargs.items():
+        setattr(cfg, key, value)
+    return cfg
+
+
+@pytest.fixture
+def img():
+    return np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+
+
+def test_no_transformation_returns_input(img):
+    pre = ImagePreprocessor(make_cfg())
+    assert pre.run(img) is img
+    assert pre.run(None) is None
+
+
+def test_normalize(img):
+    pre = ImagePreprocessor(make_cfg(), normalize=True)
+    np.testing.assert_array_equal(pre.run(img), normalize_image(img))
+
+
+def test_crop_scales_back_to_image_size(img):
+    pre = ImagePreprocessor(make_cfg(TRANSFORMATIONS=['CROP']))
+    if pre.cv2 is None:
+        # no other interpolation than the one of the crop augmentation
+        with pytest.raises(ImportError):
+            pre.run(img)
+        return
+    out = pre.run(img)
+    assert out.shape == img.shape
+    expected = pre.cv2.resize(img[40:], (160, 120),
+                              interpolation=pre.cv2.INTER_CUBIC)
+    np.testing.assert_array_equal(out, expected)
+
+
+def test_grey(img):
+    pre = ImagePreprocessor(make_cfg(IMAGE_DEPTH=1))
+    out = pre.run(img)
+    assert out.shape == (120, 160, 1)
+    expected = np.rint(np.dot(img, [0.299, 0.587, 0.114]))
+    np.testing.assert_allclose(out[..., 0], expected, atol=1)
+
+
+def test_trapeze_mask(img):
+    pre = ImagePreprocessor(make_cfg(TRANSFORMATIONS=['TRAPEZE']))
+    out = pre.run(img)
+    # input untouched, outside of the trapeze blacked out
+    assert not np.shares_memory(out, img)
+    assert not out[:60].any()
+    assert not out[60, :20].any() and not out[60, 141:].any()
+    np.testing.assert_array_equal(out[60, 20:141], img[60, 20:141])
+    np.testing.assert_array_equal(out[119, 1:159], img[119, 1:159])
+
+
+def test_buffer_reuse(img):
+    pre = ImagePreprocessor(make_cfg(TRANSFORMATIONS=['TRAPEZE']))
+    out_1 = pre.run(img)
+    # same frame gives same output, new frame a new view of the buffer
+    assert pre.run(img) is out_1
+    out_2 = pre.run(img.copy())
+    assert out_2 is not out_1 and np.shares_memory(out_1, out_2)
+    pre = ImagePreprocessor(make_cfg(TRANSFORMATIONS=['TRAPEZE']),
+                            reuse_buffer=False)
+    assert not np.shares_memory(pre.run(img), pre.run(img.copy()))
@@ -0,0 +1,99 @@
+import time
+from threading import Thread
+
+import numpy as np
+import pytest
+
+pytest.importorskip('zmq')
+from donkeycar.parts.remote_pilot import PilotServer, RemotePilot
+
+
+class FirstPixelPilot:
+    """ Pilot that returns the first pixel of the image as angle """
+    def __init__(self, delay=0.0):
+        self.delay = delay
+
+    def run(self, img_arr, other_arr=None):
+        time.sleep(self.delay)
+        return float(img_arr[0, 0]), 0.5
+
+
+@pytest.fixture
+def server():
+    server = PilotServer(FirstPixelPilot(delay=0.01), port=0)
+    t = Thread(target=server.serve, daemon=True)
+    t.start()
+    yield server
+    server.running = False
+    t.join()
+    server.shutdown()
+
+
+def run_until(part, img_arr, condition, timeout=2.0):
+    start = time.time()
+    output = part.run(img_arr)
+    while not condition(output) and time.time() - start < timeout:
+        time.sleep(0.005)
+        output = part.run(img_arr)
+    return output
+
+
+def test_remote_pilot(server):
+    part = RemotePilot('localhost', server.port, max_in_flight=2,
+                       timeout_ms=500)
+    try:
+        # nothing answered yet and no fallback
+        assert part.run(np.full((4, 4), 1.0)) == (None, None)
+        frames = [np.full((4, 4), float(i)) for i in range(2, 6)]
+        for frame in frames:
+            part.run(frame)
+        # pipelined: only two requests are waiting at any time
+        assert len(part.in_flight) <= 2
+        output = run_until(part, frames[-1], lambda o: o[0] == 5.0)
+        assert output == (5.0, 0.5)
+        assert part.latency_ms is not None
+    finally:
+        part.shutdown()
+
+
+def test_remote_pilot_falls_back_without_server():
+    # nothing listens on this port
+    part = RemotePilot('localhost', 5599, timeout_ms=20,
+                       fallback=FirstPixelPilot())
+    try:
+        img = np.full((4, 4), 3.0)
+        assert part.run(img) == (3.0, 0.5)
+        time.sleep(0.05)
+        assert part.run(np.full((4, 4), 7.0)) == (7.0, 0.5)
+        assert part.timeouts == 1
+        assert part.fallbacks == 2
+    finally:
+        part.shutdown()
+
+
+class FailingPilot:
+    def run(self, img_arr, other_arr=None):
+        if img_arr[0, 0] < 0:
+            raise ValueError('bad frame')
+        return float(img_arr[0, 0]), 0.5
+
+
+def test_server_survives_bad_requests():
+    server = PilotServer(FailingPilot(), port=0)
+    t = Thread(target=server.serve, daemon=True)
+    t.start()
+    part = RemotePilot('localhost', server.port, timeout_ms=500)
+    try:
+        part.socket.send_multipart([b'not a message'])
+        part.run(np.full((4, 4), -1.0))
+        # the failure is answered, so the request is not waiting anymore
+        run_until(part, None, lambda o: not part.in_flight)
+        assert not part.in_flight
+        output = run_until(part, np.full((4, 4), 3.0), lambda o: o[0] == 3.0)
+        assert output == (3.0, 0.5)
+        assert server.errors == 2
+    finally:
+        part.shutdown()
+        server.running = False
+        t.join()
+        server.shutdown()
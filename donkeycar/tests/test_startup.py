@@ -0,0 +1,27 @@
+import subprocess
+import sys
+
+import pytest
+
+# modules which are imported when starting a car or running non-ML commands
+# and must not pull in tensorflow or torch until a model is created or loaded
+modules = ['donkeycar', 'donkeycar.utils', 'donkeycar.parts.keras',
+           'donkeycar.parts.interpreter', 'donkeycar.pipeline.training',
+           'donkeycar.parts.kinematics', 'donkeycar.management.base']
+heavy_modules = ['tensorflow', 'torch', 'fastai']
+
+
+def imported_heavy_modules(module):
+    """ Import module in a fresh interpreter and return the heavy ML modules
+        which got imported with it. """
+    code = f'import sys, {module}; ' \
+           f'print(*[m for m in {heavy_modules} if m in sys.modules])'
+    out = subprocess.run([sys.executable, '-c', code], check=True,
+                         stdout=subprocess.PIPE, universal_newlines=True)
+    return out.stdout.splitlines()[-1].split()
+
+
+@pytest.mark.parametrize('module', modules)
+def test_import_does_not_load_ml_framework(module):
+    heavy = imported_heavy_modules(module)
+    assert not heavy, f'{module} imports {heavy} at import time'
@@ -0,0 +1,106 @@
+import time
+
+import numpy as np
+import pytest
+
+from donkeycar.parts.odometer import InterpolatingOdometer, Odometer
+from donkeycar.parts.tachometer import AbstractEncoder, \
+    ContinuousSerialEncoder, TachometerMode, TickBuffer
+from donkeycar.utilities.serial_port import SerialPort
+
+
+class BufferedEncoder(AbstractEncoder):
+    def __init__(self):
+        self.tick_buffer = TickBuffer(64)
+        self.direction = 1
+
+    def start_ticks(self):
+        pass
+
+    def stop_ticks(self):
+        pass
+
+    def poll_ticks(self, direction):
+        self.direction = direction
+
+    def get_ticks(self, encoder_index=0):
+        return 0
+
+    def buffer(self, encoder_index=0):
+        return self.tick_buffer
+
+
+def test_tick_buffer_wraps():
+    buffer = TickBuffer(8)
+    for i in range(20):
+        buffer.add(i, i * 0.1)
+    ticks, timestamps = buffer.samples()
+    assert ticks.tolist() == [16, 17, 18, 19]
+    assert timestamps == pytest.approx([1.6, 1.7, 1.8, 1.9])
+
+
+def test_ticks_interpolated_and_extrapolated():
+    buffer = TickBuffer()
+    rng = np.random.default_rng(0)
+    for t in np.arange(0, 1, 0.02):
+        buffer.add(100 * t + rng.normal(0, 0.5), t)
+    ticks, rate = buffer.ticks_at(0.5, 0.2)
+    assert ticks == pytest.approx(50, abs=2)
+    assert rate == pytest.approx(100, rel=0.1)
+    # after the last reading the rate carries the ticks forward
+    ticks, rate = buffer.ticks_at(1.0, 0.2)
+    assert ticks == pytest.approx(100, abs=2)
+    assert rate == pytest.approx(100, rel=0.1)
+    assert TickBuffer().ticks_at(1.0, 0.2) == (0, 0)
+
+
+def test_continuous_encoder_lines():
+    encoder = ContinuousSerialEncoder(SerialPort('/dev/null'))
+    # the first line arrives with the lowest delay
+    encoder.add_line('10,1000;5,1000\n', 50.001)
+    encoder.add_line('20,1020;3,1020\n', 50.030)
+    encoder.add_line('garbage\n', 50.035)
+    encoder.poll_ticks(-1)
+    encoder.add_line('25,1040;3,1040\n', 50.045)
+    assert encoder.get_ticks(0) == 5
+    assert encoder.get_ticks(1) == -2
+    ticks, timestamps = encoder.buffer(0).samples()
+    assert ticks.tolist() == [0, 10, 5]
+    assert timestamps == pytest.approx([50.001, 50.021, 50.041])
+
+
+def test_interpolating_odometer():
+    encoder = BufferedEncoder()
+    odometer = InterpolatingOdometer(encoder, distance_per_tick=0.01,
+                                     window_secs=0.1,
+                                     direction_mode=TachometerMode.FORWARD_REVERSE)
+    for t in np.arange(0, 1, 0.02):
+        encoder.tick_buffer.add(200 * t, 10 + t)
+    distance, velocity, timestamp = odometer.run(0.5, 10.51)
+    assert distance == pytest.approx(1.02)
+    assert velocity == pytest.approx(2)
+    assert timestamp == 10.51
+    odometer.run(-0.5, 10.52)
+    assert encoder.direction == -1
+
+
+def test_odometer_smoothing():
+    odometer = Odometer(0.5, smoothing_count=2)
+    odometer.run(0, 1.0)
+    assert odometer.run(4, 2.0) == (2, 2, 2.0)
+
+
+def test_arduino_speed_reader_counts_every_tick(monkeypatch):
+    from donkeycar.parts.sensordata import ArduinoSpeedReader, MM_PER_TICK
+
+    monkeypatch.setattr(SerialPort, 'start', lambda self: self)
+    reader = ArduinoSpeedReader('/dev/null', 115200)
+    try:
+        now = time.time()
+        # 10 ticks every 20 ms, several lines between two reads
+        for i in range(6):
+            reader.encoder.add_line(f'{10 * i},{1000 + 20 * i}\n',
+                                    now - 0.1 + 0.02 * i)
+        assert reader.run() == pytest.approx(500 * MM_PER_TICK / 1000)
+    finally:
+        reader.close()
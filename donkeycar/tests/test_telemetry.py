@@ -1,9 +1,13 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
+import json
 import time
+import zlib
 from unittest import mock
+import numpy as np
 from paho.mqtt.client import Client
 import donkeycar.templates.cfg_complete as cfg
+from donkeycar.parts.codec import decode
 from donkeycar.parts.telemetry import MqttTelemetry
 import pytest
 from random import randint
@@ -47,3 +51,76 @@ def test_mqtt_telemetry():
     res = str.encode('[{"ts": %s, "values": {"my/speed": 16, "my/voltage": 11.1, "pilot/angle": 33.3, '
                      '"pilot/throttle": 22.2}}]' % timestamp)
     assert on_message_mock.call_args_list[0][0][2].payload == res
+
+
+class StubClient:
+    """ Stand-in for the paho client, recording the published messages """
+    def __init__(self, *args, **kwargs):
+        self.messages = []
+        self.rc = 0
+
+    def max_queued_messages_set(self, n):
+        pass
+
+    def connect(self, host, port=1883):
+        pass
+
+    def loop_start(self):
+        pass
+
+    def publish(self, topic, payload):
+        self.messages.append((topic, payload))
+        return mock.Mock(rc=self.rc)
+
+
+@pytest.fixture
+def telemetry(monkeypatch):
+    monkeypatch.setattr('donkeycar.parts.telemetry.MQTTClient', StubClient)
+
+    def create(batch_format, compress=False, queue_size=1000):
+        # restored after the test, so the template defaults stay untouched
+        monkeypatch.setattr(cfg, 'TELEMETRY_DEFAULT_INPUTS',
+                            'pilot/angle,pilot/throttle')
+        monkeypatch.setattr(cfg, 'TELEMETRY_DONKEY_NAME', 'stub')
+        monkeypatch.setattr(cfg, 'TELEMETRY_MQTT_BATCH_FORMAT', batch_format)
+        monkeypatch.setattr(cfg, 'TELEMETRY_MQTT_COMPRESS', compress)
+        monkeypatch.setattr(cfg, 'TELEMETRY_QUEUE_SIZE', queue_size)
+        monkeypatch.setattr(cfg, 'TELEMETRY_LOGGING_ENABLE', False)
+        return MqttTelemetry(cfg, counters=True)
+    return create
+
+
+def test_telemetry_jsonl_batch(telemetry):
+    t = telemetry('jsonl', compress=True)
+    for i in range(5):
+        t.run_threaded(np.float32(i), 0.5)
+    t.publish()
+    # all samples in one message
+    assert len(t._mqtt_client.messages) == 1
+    topic, payload = t._mqtt_client.messages[0]
+    assert topic == 'donkey/stub/telemetry'
+    lines = zlib.decompress(payload).decode().split('\n')
+    values = [json.loads(line)['values'] for line in lines]
+    assert values == [{'pilot/angle': i, 'pilot/throttle': 0.5}
+                      for i in range(5)]
+    assert t.run_threaded(1.0, 0.5) == (1, 0, 0)
+
+
+def test_telemetry_binary_batch_drops_oldest(telemetry):
+    t = telemetry('binary', queue_size=3)
+    for i in range(5):
+        t.run_threaded(float(i), 0.5)
+    assert t.outputs() == (3, 2, 0)
+    t._mqtt_client.rc = 4  # paho: no connection
+    t.publish()
+    topic, samples = decode(t._mqtt_client.messages[0][1])
+    assert [values['pilot/angle'] for _, values in samples] == [2.0, 3.0, 4.0]
+    assert t.outputs() == (0, 2, 1)
+
+
+def test_telemetry_unencodable_batch_is_counted(telemetry):
+    t = telemetry('binary')
+    t.run_threaded(object(), 0.5)
+    t.publish()
+    assert t._mqtt_client.messages == []
+    assert t.publish_errors == 1
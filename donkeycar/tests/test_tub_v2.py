@@ -1,8 +1,12 @@
+import os
 import shutil
 import tempfile
 import unittest
 
+import numpy as np
+
 from donkeycar.parts.tub_v2 import Tub
+from donkeycar.utils import arr_to_binary, load_image
 from donkeycar.pipeline.types import TubRecord, Collator
 from donkeycar.config import Config
 
@@ -72,5 +76,34 @@ class TestTub(unittest.TestCase):
         shutil.rmtree(cls._path)
 
 
+class TestTubJpeg(unittest.TestCase):
+
+    def test_jpeg_bytes_stored_unchanged(self):
+        path = tempfile.mkdtemp()
+        try:
+            tub = Tub(path, ['cam/image_array'], ['image_array'])
+            img_arr = np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+            jpeg = arr_to_binary(img_arr)
+            tub.write_record({'cam/image_array': jpeg})
+            tub.write_record({'cam/image_array': img_arr})
+            records = list(tub)
+            self.assertEqual(len(records), 2)
+            image_path = os.path.join(tub.images_base_path,
+                                      records[0]['cam/image_array'])
+            with open(image_path, 'rb') as f:
+                self.assertEqual(f.read(), jpeg)
+            # both records load as the same kind of image
+            cfg = Config()
+            cfg.IMAGE_W, cfg.IMAGE_H, cfg.IMAGE_DEPTH = 160, 120, 3
+            for record in records:
+                image_path = os.path.join(tub.images_base_path,
+                                          record['cam/image_array'])
+                img = load_image(image_path, cfg)
+                self.assertEqual(img.shape, (120, 160, 3))
+            tub.close()
+        finally:
+            shutil.rmtree(path)
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -2,7 +2,9 @@
 import pytest
 import json
 import os
-from donkeycar.parts.web_controller.web import LocalWebController
+import numpy as np
+from donkeycar.parts.web_controller.web import LocalWebController, \
+    MjpegBroadcaster, StateBroadcaster, WebSocketDriveAPI, CONTROLS
 import donkeycar.templates.cfg_complete as cfg
 from importlib import reload
 
@@ -30,3 +32,87 @@ def test_web_control_user_defined_port():
     
     assert server.port == 12345
 
+
+def test_mjpeg_broadcaster_encodes_once():
+    video = MjpegBroadcaster()
+    assert video.get_jpeg() is None
+    img = np.random.randint(0, 255, (120, 160, 3), dtype=np.uint8)
+    video.set_frame(img)
+    frame_id, jpeg = video.get_jpeg()
+    # every client gets the same bytes, the image is encoded once
+    assert video.get_jpeg() == (frame_id, jpeg)
+    assert video.encodings == 1
+    # same image again or no image doesn't make a new frame
+    video.set_frame(img)
+    video.set_frame(None)
+    assert video.frame_id == frame_id
+    # lower quality is encoded once more
+    _, small_jpeg = video.get_jpeg(quality=10)
+    assert len(small_jpeg) < len(jpeg)
+    assert video.encodings == 2
+    video.set_frame(img.copy())
+    assert video.frame_id == frame_id + 1
+
+
+def test_mjpeg_broadcaster_passes_jpeg_through():
+    video = MjpegBroadcaster()
+    jpeg = b'\xff\xd8jpeg bytes'
+    video.set_frame(jpeg)
+    assert video.get_jpeg(quality=10) == (1, jpeg)
+    assert video.encodings == 0
+
+
+class FakeLoop:
+    def __init__(self):
+        self.callbacks = []
+
+    def add_callback(self, callback, *args):
+        self.callbacks.append((callback, args))
+
+    def call_later(self, delay, callback):
+        callback()
+
+    def run(self):
+        callbacks, self.callbacks = self.callbacks, []
+        for callback, args in callbacks:
+            callback(*args)
+
+
+class FakeClient:
+    def __init__(self):
+        self.messages = []
+
+    def write_message(self, message):
+        self.messages.append(json.loads(message))
+
+
+def test_state_broadcaster_sends_coalesced_diffs():
+    loop = FakeLoop()
+    state = StateBroadcaster(max_rate=0)
+    client = FakeClient()
+    state.add_client(client)
+    state.update({'driveMode': 'user', 'recording': False}, loop)
+    state.update({'driveMode': 'user', 'recording': True}, loop)
+    # both updates are sent in one callback
+    assert len(loop.callbacks) == 1
+    loop.run()
+    assert client.messages == [{'driveMode': 'user', 'recording': True}]
+    # unchanged state is not sent, changed keys only
+    state.update({'driveMode': 'user', 'recording': True}, loop)
+    loop.run()
+    state.update({'driveMode': 'local', 'recording': True}, loop)
+    loop.run()
+    assert client.messages[1:] == [{'driveMode': 'local'}]
+    # new clients start with the full state
+    late = FakeClient()
+    state.add_client(late)
+    assert late.messages == [{'driveMode': 'local', 'recording': True}]
+
+
+def test_binary_control_message(server):
+    class Handler:
+        application = server
+    WebSocketDriveAPI.on_message(Handler(), CONTROLS.pack(0.5, -0.25))
+    assert (server.angle, server.throttle) == (0.5, -0.25)
+    WebSocketDriveAPI.on_message(Handler(), json.dumps({'angle': 0.1}))
+    assert server.angle == 0.1
@@ -130,7 +130,7 @@ def rgb2gray(rgb):
     grey = np.dot(rgb[..., :3], [0.299, 0.587, 0.114])
     # transform back if the input is a uint8 array
     if rgb.dtype.type is np.uint8:
-        grey = round(grey).astype(np.uint8)
+        grey = np.round(grey).astype(np.uint8)
     return grey
 
 
@@ -466,7 +466,7 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> Union['KerasPilot', 'Fa
         KerasInferred, KerasIMU, KerasMemory, KerasBehavioral, KerasLocalizer, \
         KerasLSTM, Keras3D_CNN
     from donkeycar.parts.interpreter import KerasInterpreter, TfLite, TensorRT, \
-        FastAIInterpreter
+        FastAIInterpreter, OnnxInterpreter
 
     if model_type is None:
         model_type = cfg.DEFAULT_MODEL_TYPE
@@ -478,6 +478,9 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> Union['KerasPilot', 'Fa
     elif 'tensorrt_' in model_type:
         interpreter = TensorRT()
         used_model_type = model_type.replace('tensorrt_', '')
+    elif 'onnx_' in model_type:
+        interpreter = OnnxInterpreter()
+        used_model_type = model_type.replace('onnx_', '')
     elif 'fastai_' in model_type:
         interpreter = FastAIInterpreter()
         used_model_type = model_type.replace('fastai_', '')
@@ -521,10 +524,11 @@ def get_model_by_type(model_type: str, cfg: 'Config') -> Union['KerasPilot', 'Fa
         kl = Keras3D_CNN(interpreter=interpreter, input_shape=input_shape,
                          seq_length=cfg.SEQUENCE_LENGTH)
     else:
-        known = [k + u for k in ('', 'tflite_', 'tensorrt_')
+        known = [k + u for k in ('', 'tflite_', 'tensorrt_', 'onnx_')
                  for u in used_model_type.mem]
         raise ValueError(f"Unknown model type {model_type}, supported types are"
                          f" { ', '.join(known)}")
+    kl.skip_unchanged_frames = getattr(cfg, 'PILOT_SKIP_UNCHANGED_FRAMES', True)
     return kl
 
 
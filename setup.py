@@ -87,6 +87,7 @@ setup(name='donkeycar',
           ],
           'ci': ['codecov'],
           'tf': ['tensorflow==2.2.0'],
+          'onnx': ['onnxruntime', 'tf2onnx'],
           'torch': [
               'pytorch>=1.7.1',
               'torchvision',